@@ -7,6 +7,7 @@ import glob
 import csv
 import sys
 import statistics
+from results import read_results
 
 def cols_v_time(num_vincs=6, num_sites=6, all=True, specific=None):
     """
@@ -78,6 +79,7 @@ def cols_v_time(num_vincs=6, num_sites=6, all=True, specific=None):
     #loop over num_vincs to get data
     for v in range(num_vincs):
         folder_paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/5000e*'))
+        results = [read_results(folder) for folder in folder_paths]
         
         #bin collisions into 10-year chunks
         
@@ -91,24 +93,11 @@ def cols_v_time(num_vincs=6, num_sites=6, all=True, specific=None):
             err[o] = [0] *(len(times)-1)
             
             #loop over each folder
-            for f in range(len(folder_paths)):
-                file = folder_paths[f] + '/' + folder_paths[f].split('/')[-1] + '_' + object_names[o] + '.csv'
-                with open(file, mode='r') as f:
-                    r = csv.reader(f)
-                    rows = list(r)
-                    lines = len(rows)
-                    if (lines!=2):      #if there are collision entries, read them
-                        
-                        rownum = 2  #track row
-                        k = 0       #track bin
-                        #bin collisions
-                        while((rownum < lines) & (k < len(times)-1)):
-                            rowtime = float(rows[rownum][4])
-                            if (rowtime < times[k+1]):
-                                binned_collisions[o][k] += 1
-                                rownum += 1
-                            else:
-                                k += 1
+            for res in results:
+                coltimes = res['col_t'][res['col_body'] == o]
+                counts = np.histogram(coltimes[coltimes < times[-1]], bins=times)[0]      #bin collisions
+                for k in range(len(times)-1):
+                    binned_collisions[o][k] += int(counts[k])
             for j in range(len(times)-1):
                 err[o][j] = math.sqrt(binned_collisions[o][j])
         binned_collisions_all.append(binned_collisions)
@@ -0,0 +1,95 @@
+import ast
+import numpy as np
+import os
+import csv
+import glob
+
+#****CONSTANTS****(hardwired to TRAPPIST for now, to be fixed later)
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+#******************
+
+
+def read_eventlog(path):
+    """
+    DESCRIPTION:
+    Reads a simulation's binary collision/escape event log (<label>_events.bin) into a structured array
+    with fields 'kind' (0 collision, 1 escape), 'body', 'hash', 't' and 'data'.
+    For collisions, data holds [vx, vy, vz] and, in logs with 15 data columns, the impact geometry:
+    [dx, dy, dz, dvx, dvy, dvz] of the ejecta relative to the body hit, and [px, py, pz, pvx, pvy, pvz]
+    of the body relative to the star.
+    The log can still be being written by a running job: a partly written last record is ignored.
+
+    CALLING SEQUENCE:
+    events = read_eventlog(path)
+    """
+
+    with open(path, 'rb') as f:
+        dtype = np.dtype(ast.literal_eval(f.readline().decode()))    #first line describes the record layout
+        raw = f.read()
+    n = len(raw)//dtype.itemsize
+    return np.frombuffer(raw[:n*dtype.itemsize], dtype=dtype)
+
+
+def eventlog_to_csv(folder):
+    """
+    DESCRIPTION:
+    Writes the per-planet collision CSVs and the escaped CSV of one simulation folder from its event log,
+    in the same layout the simulation writes at the end of a run. Use this to look at partial results
+    of a job that is still running, or that was killed before writing its CSVs.
+
+    CALLING SEQUENCE:
+    eventlog_to_csv(folder)
+
+    KEYWORDS:
+    ## folder: the simulation folder, e.g. Ejecta_Simulation_Data/5000e_2000y_0vinc_1
+    """
+
+    label = folder.rstrip('/').split('/')[-1]
+    events = read_eventlog(os.path.join(folder, label + '_events.bin'))
+    cols = events[events['kind'] == 0]
+    escs = events[events['kind'] == 1]
+
+    #planetary collisions files
+    obj_header = ['hash','vx', 'vy', 'vz', 't']
+    if events.dtype['data'].shape[0] >= 15:                           #impact geometry recorded
+        obj_header += ['dx', 'dy', 'dz', 'dvx', 'dvy', 'dvz', 'xBody', 'yBody', 'zBody', 'vxBody', 'vyBody', 'vzBody']
+    for x in range(len(object_names)):
+        rows = cols[cols['body'] == x]
+        with open(os.path.join(folder, label + '_' + object_names[x] + '.csv'), 'w') as f:
+            write = csv.writer(f)
+            write.writerow([label])
+            write.writerow(obj_header)
+            for ev in rows:
+                write.writerow([int(ev['hash'])] + ev['data'][:3].tolist() + [float(ev['t'])]
+                               + ev['data'][3:len(obj_header)-2].tolist())
+
+    #escaped particles file
+    esc_header = ['hash', 'semi-maj axis', 'eccentricity', 'inclination', 'long. asc. node', 'arg. pericenter', 'true anomaly',
+                  't', 'v_inf']
+    with open(os.path.join(folder, label + '_escaped.csv'), 'w') as f:
+        write = csv.writer(f)
+        write.writerow([label])
+        write.writerow(esc_header)
+        for ev in escs:
+            write.writerow([int(ev['hash'])] + ev['data'][:6].tolist() + [float(ev['t']), float(ev['data'][6])])
+
+
+def eventlog_to_csv_all(num_vincs=6):
+    """
+    DESCRIPTION:
+    Runs eventlog_to_csv on every simulation folder in Ejecta_Simulation_Data/[vinc_num]vinc/.
+
+    CALLING SEQUENCE:
+    eventlog_to_csv_all(num_vincs=6)
+
+    KEYWORDS:
+    ## num_vincs: number of velocity increments (default 6; +0-5 km/s)
+    """
+
+    parent = os.getcwd()
+    for v in range(num_vincs):
+        folder_paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/*'))
+        for folder in folder_paths:
+            if os.path.exists(folder + '/' + folder.split('/')[-1] + '_events.bin'):
+                eventlog_to_csv(folder)
+        print(str(v) + 'vinc event logs written to csv...')
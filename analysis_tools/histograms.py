@@ -7,6 +7,7 @@ import glob
 import csv
 import sys
 import statistics
+from results import read_results, ejecta_weights
 
 def histograms(num_vincs=6, num_sites=6, all=True, specific=None):
     """
@@ -88,7 +89,7 @@ def histograms(num_vincs=6, num_sites=6, all=True, specific=None):
 
         #dictionaries to keep track of values
         aggregate_vals = {                       
-            "total_ejecta": 0,     #total number of ejecta present
+            "total_ejecta": 0,     #total weight of the ejecta present (their number, with plain random directions)
             "num_collisions": 0, #total number of collisions
             "num_remaining": 0,  #number of remaining ejecta
             "esc": 0             #number of escaped particles
@@ -110,31 +111,48 @@ def histograms(num_vincs=6, num_sites=6, all=True, specific=None):
             error_percent[object_names[i]] = 0 
 
 
-        #add up total collisions from each simulation 
+        #add up total collisions from each simulation, as sums of the ejecta's sampling weights
+        #(older simulations get the weights of the cube sampler they used; plain random directions give the counts)
+        weighted = {o: 0. for o in object_names + ['num_collisions', 'num_remaining', 'esc']}
+        sq_weights = dict(weighted)                  #sums of squared weights, for the error values
+        per_sim = []                                 #weighted counts of each simulation
+        samplers = set()
         for i in range(len(folder_paths)):
-            file = folder_paths[i] + '/' + folder_paths[i].split('/')[-1] + '_overview.csv'
-            with open(file, mode = 'r') as f:
-                r = csv.reader(f)
-                rows = list(r)
-                aggregate_vals["total_ejecta"] += int(rows[2][1])         #total num of ejecta
-                aggregate_vals["esc"] += int(rows[8][1])                  #num escaped
-                for j in range(9, 17):
-                    aggregate_vals[rows[j][0]] += int(rows[j][1])         #num collided with each planet
-                    aggregate_vals['num_collisions'] += int(rows[j][1])   #add to overall collision count
-         
-        #calculate number of remaining particles
-        aggregate_vals['num_remaining'] = aggregate_vals['total_ejecta'] - aggregate_vals['num_collisions']
+            res = read_results(folder_paths[i])
+            meta = res['meta']                                                 #overview of the simulation
+            samplers.add(meta.get('Direction sampler'))
+            aggregate_vals["total_ejecta"] += res['init_weight'].sum()        #total weight of the ejecta
+            w_col = ejecta_weights(res, res['col_hash'])
+            w_esc = ejecta_weights(res, res['esc_hash'])
+            sim_vals = {'esc': w_esc.sum(), 'num_collisions': w_col.sum(), 
+                        'num_remaining': res['init_weight'].sum() - w_col.sum()}
+            sim_sq = {'esc': (w_esc**2).sum(), 'num_collisions': (w_col**2).sum(),
+                      'num_remaining': (res['init_weight']**2).sum() - (w_col**2).sum()}
+            for x in range(len(object_names)):
+                k = res['col_body'] == x
+                sim_vals[object_names[x]] = w_col[k].sum()                    #num collided with each planet
+                sim_sq[object_names[x]] = (w_col[k]**2).sum()
+            for key in weighted:
+                weighted[key] += sim_vals[key]
+                sq_weights[key] += sim_sq[key]
+            per_sim.append(sim_vals)
+        for key in weighted:
+            aggregate_vals[key] = int(round(weighted[key]))
         
         
-        #sqrt(n) error value for:
+        #error values for:
         #- each planet's total
         #- total num of collisions
         #- and num remaining
-        for i in range(len(object_names)):
-            error_vals[object_names[i]] = math.sqrt(aggregate_vals[object_names[i]])
-        error_vals['num_collisions'] = math.sqrt(aggregate_vals['num_collisions'])
-        error_vals['num_remaining'] = math.sqrt(aggregate_vals['num_remaining'])
-        error_vals['esc'] = math.sqrt(aggregate_vals['esc'])
+        #random directions: sqrt(n), or the square root of the sum of squared weights
+        #lattice and stratified directions: from the scatter between simulations, which are independent
+        #randomized estimates (sqrt(n) would hide their smaller error)
+        if samplers <= {'fibonacci', 'sobol', 'stratified'} and len(per_sim) > 1:
+            for key in weighted:
+                error_vals[key] = math.sqrt(len(per_sim)*np.var([sim_vals[key] for sim_vals in per_sim], ddof=1))
+        else:
+            for key in weighted:
+                error_vals[key] = math.sqrt(sq_weights[key])
                                                  
         #error as percentage
         for i in range(len(object_names)):
@@ -241,11 +259,11 @@ def histograms(num_vincs=6, num_sites=6, all=True, specific=None):
         totalheights.append(aggregate_vals_all[v]['num_remaining']/2)
         totalheights.append(aggregate_vals_all[v]['num_remaining'])
 
-        #calculate each planets' collisions as percentage of total ejecta
+        #calculate each planets' collisions as percentage of total ejecta (weighted, as the counts)
         percents = []
         for i in range(num_planets + 1):
-            percents.append(collisions[i]/300000*100)
-        percents.append(aggregate_vals_all[v]['num_remaining']/300000*100)
+            percents.append(collisions[i]/aggregate_vals_all[v]['total_ejecta']*100)
+        percents.append(aggregate_vals_all[v]['num_remaining']/aggregate_vals_all[v]['total_ejecta']*100)
 
         print(percents)
         for i in range(1, num_planets):
@@ -406,13 +424,13 @@ def histograms(num_vincs=6, num_sites=6, all=True, specific=None):
             for j in range(len(object_names)):
                 collisions.append(aggregate_vals_all[i][object_names[j]])
                 err.append(error_vals_all[i][object_names[j]])
-                percents.append(collisions[j]/300000*100)
+                percents.append(collisions[j]/aggregate_vals_all[i]['total_ejecta']*100)
                 if j==0:
                     totalheights.append(collisions[j])
                 else:
                     totalheights.append(height + collisions[j]/2)
                     height += collisions[j]
-            percents.append(aggregate_vals_all[i]['num_remaining']/300000*100)
+            percents.append(aggregate_vals_all[i]['num_remaining']/aggregate_vals_all[i]['total_ejecta']*100)
             collisions_all.append(collisions)
             err_all.append(err)
             percents_all.append(percents)
@@ -0,0 +1,88 @@
+import numpy as np
+import os
+import glob
+import pickle
+from results import read_results
+
+#****CONSTANTS****(hardwired to TRAPPIST for now, to be fixed later)
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+AUyr_to_kms = 4.740470463533348         #1 AU/yr in km/s
+#******************
+
+
+def impact_geometry(res):
+    """
+    DESCRIPTION:
+    Computes the impact speed, impact angle and impact site of every collision of one simulation at once,
+    from the impact geometry in its results (see read_results):
+        v_imp -------speed relative to the body hit (km/s)
+        angle -------impact angle above the local horizontal (degrees; 90 is a vertical impact)
+        lat ---------latitude of the impact site (degrees), positive towards the body's orbital angular momentum
+        lon ---------longitude of the impact site (degrees), 0 at the substellar point and +90 at the apex
+                     of the body's orbital motion (the centre of the leading hemisphere), as for a tidally locked body
+    Collisions recorded without impact geometry get NaN.
+
+    CALLING SEQUENCE:
+    geometry = impact_geometry(read_results(folder))
+    """
+
+    r = res['col_rel_pos']                                            #ejecta relative to the body hit
+    v = res['col_rel_vel']
+    p = res['col_body_pos']                                           #body relative to the star
+    pv = res['col_body_vel']
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed = np.linalg.norm(v, axis=1)
+        up = r/np.linalg.norm(r, axis=1)[:, None]                     #local vertical at the impact site
+        angle = np.arcsin(np.clip(-(up*v).sum(axis=1)/speed, -1., 1.))
+
+        #body frame: x towards the star, z along the orbital angular momentum, y along the orbital motion
+        x = -p/np.linalg.norm(p, axis=1)[:, None]
+        z = np.cross(p, pv)
+        z = z/np.linalg.norm(z, axis=1)[:, None]
+        y = np.cross(x, z)
+        lat = np.arcsin(np.clip((up*z).sum(axis=1), -1., 1.))
+        lon = np.arctan2((up*y).sum(axis=1), (up*x).sum(axis=1))
+
+    return {
+        'body': res['col_body'],
+        'hash': res['col_hash'],
+        't': res['col_t'],
+        'v_imp': speed*AUyr_to_kms,
+        'angle': np.degrees(angle),
+        'lat': np.degrees(lat),
+        'lon': np.degrees(lon),
+    }
+
+
+def impact_geometry_all(num_vincs=6):
+    """
+    DESCRIPTION:
+    Runs impact_geometry on every simulation in Ejecta_Simulation_Data/[vinc_num]vinc/ and joins the impacts
+    of each velocity increment into one set of arrays, accessed by impacts_all[num_vinc][key], with keys
+    'body', 'hash', 't', 'v_imp', 'angle', 'lat', 'lon' and 'sim' (simulation number).
+    Saves them as impacts_all.pkl.
+
+    CALLING SEQUENCE:
+    impacts_all = impact_geometry_all(num_vincs=6)
+
+    KEYWORDS:
+    ## num_vincs: number of velocity increments (default 6; +0-5 km/s)
+    """
+
+    parent = os.getcwd()
+    impacts_all = []
+    for v in range(num_vincs):
+        folder_paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/*'))
+        per_sim = []
+        for folder in folder_paths:
+            geometry = impact_geometry(read_results(folder))
+            sim_num = int(folder.split('/')[-1].split('_')[-1])
+            geometry['sim'] = np.full(len(geometry['t']), sim_num)
+            per_sim.append(geometry)
+        impacts_all.append({key: np.concatenate([g[key] for g in per_sim]) for key in per_sim[0]} if per_sim else {})
+        print(str(v) + 'vinc impact geometry done...')
+
+    with open(parent + '/Plots/all_ejecta/impacts_all.pkl', 'wb') as f:
+        pickle.dump(impacts_all, f, pickle.HIGHEST_PROTOCOL)
+    return impacts_all
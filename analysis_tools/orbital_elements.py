@@ -8,6 +8,8 @@ import sys
 import statistics
 import glob
 import pickle
+import ast
+from results import read_results
 
 from rebound import hash as h
 from matplotlib.animation import FuncAnimation, FFMpegWriter
@@ -19,7 +21,8 @@ colors = ('palegreen', 'w','r', 'c', 'm', 'gold', 'darkgrey', 'b', 'g')
 groups = ('remaining', 'escaped', 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
 semimaj = (1.154e-2, 1.580e-2, 2.227e-2, 2.925e-2, 3.849e-2, 4.683e-2, 6.189e-2)
 
-bin_slices = 201
+bin_slices = 201            #snapshots (every 10 years) of runs whose overview has no 'Snapshot times (yrs)'
+pop_stride = 10**7          #ejecta hashes in packed runs are population*pop_stride + ejecta number, as in start_template.py
 #******************
 
 """
@@ -42,8 +45,180 @@ For all_ejecta plots:
     inc_snapshot_allp(vinc, timeslice, rem=True, esc=True, b=True, c=True, d=True, e=True, f=True, g=True, h=True)
         - create a single snapshot of inc vs. a
 
+    read_snapshots(path)
+        - read a compact snapshot file (<label>_snapshots.bin)
+
+    snapshot_sources(folder)
+        - find the snapshots of a simulation, including packed and sharded runs
+
+    snapshot_times(sa)
+        - times of every snapshot of a simulation
+        
+    time_slice(t)
+        - the timeslice closest to a time, for the snapshot plots
+
 """
 
+def read_snapshots(path):
+    
+    """
+    DESCRIPTION:
+        Reads a simulation's compact snapshot file (<label>_snapshots.bin, written with snapshot_mode = 'compact')
+        into a list with one dictionary per snapshot, holding 't', 'N', 'planets' (star and planet positions and 
+        velocities) and one array per column: 'hash', 'a', 'e', 'inc', 'Omega', 'omega', 'f'.
+        A partly written last snapshot is ignored.
+    
+    CALLING SEQUENCE:
+        snapshots = read_snapshots(path)
+    
+    """
+    
+    with open(path, 'rb') as f:
+        header = ast.literal_eval(f.readline().decode())              #first line describes the layout
+        raw = f.read()
+    head_dtype = np.dtype(header['snapshot'])
+    columns = [np.dtype([col]) for col in header['columns']]
+    
+    snapshots = []
+    pos = 0
+    while pos + head_dtype.itemsize <= len(raw):
+        head = np.frombuffer(raw, dtype=head_dtype, count=1, offset=pos)[0]
+        n = int(head['N'])
+        end = pos + head_dtype.itemsize + n*sum(col.itemsize for col in columns)
+        if end > len(raw):
+            break
+        snapshot = {'t': float(head['t']), 'N': n, 'planets': head['planets']}
+        pos += head_dtype.itemsize
+        for col in columns:
+            snapshot[col.names[0]] = np.frombuffer(raw, dtype=col[0], count=n, offset=pos)
+            pos += n*col.itemsize
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def snapshot_sources(folder):
+    
+    """
+    DESCRIPTION:
+        Finds the snapshots of one simulation folder. A simulation with its own compact snapshot file or 
+        SimulationArchive uses those. A population of a packed run uses the packed simulation's folder (named 
+        under 'Packed simulation' in its overview, next to the population's folder or in Ejecta_Simulation_Data),
+        and a sharded run the snapshots of every shard, moved to <label>/shards/<label>_shard<k>.
+        Returns a list of (snapshots, times, pop), one per snapshot file, where pop is the population to pick 
+        out of a packed run's snapshots (see snapshot_orbits), or None.
+    
+    CALLING SEQUENCE:
+        sources = snapshot_sources(folder)
+    
+    """
+    
+    folder = folder.rstrip('/')
+    label = folder.split('/')[-1]
+    base, pop = folder, None
+    meta = read_results(folder)['meta']
+    own = os.path.exists(folder + '/' + label + '_snapshots.bin') or os.path.exists(folder + '/' + label + '.bin')
+    packed = meta.get('Packed simulation')
+    if packed is not None and not own:              #origins of a consolidated run keep their own snapshots
+        parent = os.getcwd() + '/Ejecta_Simulation_Data/'
+        found = [x for x in [os.path.dirname(folder) + '/' + packed, parent + packed] if os.path.isdir(x)]
+        found += sorted(glob.glob(parent + '*/' + packed))
+        if len(found) == 0:
+            print('Error: packed simulation ' + packed + ' of ' + folder + ' not found.')
+            return None
+        base, label, pop = found[0], packed, meta.get('Packed population')
+    
+    shards = meta.get('Shards')
+    if own or (shards or 1) <= 1:
+        paths = [base + '/' + label]
+    else:
+        shard_labels = [label + '_shard' + str(k) for k in range(int(shards))]
+        paths = [base + '/shards/' + slabel + '/' + slabel for slabel in shard_labels]
+    sources = []
+    for path in paths:
+        if os.path.exists(path + '_snapshots.bin'):
+            sa = read_snapshots(path + '_snapshots.bin')
+        else:
+            sa = rebound.SimulationArchive(path + '.bin')
+        sources.append((sa, snapshot_times(sa), pop))
+    return sources
+
+
+def snapshot_orbits(snapshot, pop=None):
+    
+    """
+    DESCRIPTION:
+        Gets {hash: (e, inc, a)} for every ejecta in one snapshot, from either a compact snapshot 
+        (see read_snapshots) or a REBOUND SimulationArchive snapshot.
+        
+    CALLING SEQUENCE:
+        orbits = snapshot_orbits(snapshot, pop=None)
+        
+    KEYWORDS:
+    ## pop: for a packed run's snapshots, keep only this population's ejecta (hashes pop*pop_stride + number),
+    ##      keyed by their number within the population, as in its results
+    """
+    
+    if isinstance(snapshot, dict):
+        hashes = snapshot['hash']
+        keep = np.ones(len(hashes), dtype=bool) if pop is None else hashes//pop_stride == pop
+        return dict(zip((hashes[keep] % pop_stride).tolist(), 
+                        zip(snapshot['e'][keep].tolist(), snapshot['inc'][keep].tolist(), snapshot['a'][keep].tolist())))
+    orbits = {}
+    for x in snapshot.particles[len(object_names):]:
+        name = x.hash.value
+        if pop is not None and name//pop_stride != pop:
+            continue
+        orbit = x.orbit
+        orbits[name % pop_stride] = (orbit.e, orbit.inc, orbit.a)
+    return orbits
+    
+
+def snapshot_times(sa):
+    
+    """
+    DESCRIPTION:
+        Gets the times (in years) of every snapshot of a simulation, from either a compact snapshot list
+        (see read_snapshots) or a REBOUND SimulationArchive. Snapshots need not be evenly spaced.
+    
+    CALLING SEQUENCE:
+        times = snapshot_times(sa)
+    
+    """
+    
+    if isinstance(sa, list):
+        return np.array([snapshot['t'] for snapshot in sa])
+    return np.array([sa.t[i] for i in range(len(sa))])
+
+
+def time_slice(t):
+    
+    """
+    DESCRIPTION:
+        Gets the timeslice (index into the times saved by get_orbital_elements_all) closest to time t (in years),
+        for ecc_snapshot_allp and inc_snapshot_allp.
+    
+    CALLING SEQUENCE:
+        timeslice = time_slice(t)
+    
+    """
+    
+    with open(os.getcwd() + '/Plots/all_ejecta/times_all.pkl', 'rb') as f:
+        times = pickle.load(f)
+    return int(np.argmin(np.abs(np.array(times) - t)))
+
+
+def load_times():
+    """
+    Loads the snapshot times saved by get_orbital_elements_all, or the old every-10-years slices if it saved none.
+    """
+    
+    path = os.getcwd() + '/Plots/all_ejecta/times_all.pkl'
+    if not os.path.exists(path):
+        return [i*10 for i in range(bin_slices)]
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
 def sort_particles_all(num_vincs=6, num_sims=60):
     
     """
@@ -79,28 +254,18 @@ def sort_particles_all(num_vincs=6, num_sims=60):
                 particles_sorted_per_sim[o] = []
                 
             
+            res = read_results(folder)
+            
             #get escaped hashes
-            esc_file = folder + '/' + folder.split('/')[-1] + '_escaped.csv'
-            with open(esc_file, 'r') as e_file:
-                r = csv.reader(e_file)
-                rows = list(r)
-                if len(rows)!=2:
-                    for k in range(2, len(rows)):
-                        hashval = int(rows[k][0])
-                        particles_sorted_per_sim['escaped'].append(hashval)
-                        particles_sorted_per_sim['remaining'].remove(hashval)
+            for hashval in res['esc_hash'].tolist():
+                particles_sorted_per_sim['escaped'].append(hashval)
+                particles_sorted_per_sim['remaining'].remove(hashval)
             
             #get planet collision hashes
-            for o in object_names:
-                o_file = folder + '/' + folder.split('/')[-1] + '_' + o + '.csv'
-                with open(o_file, 'r') as f:
-                    r = csv.reader(f)
-                    rows = list(r)
-                    if len(rows)!=2:
-                        for k in range(2, len(rows)):
-                            hashval = int(rows[k][0])
-                            particles_sorted_per_sim[o].append(hashval)
-                            particles_sorted_per_sim['remaining'].remove(hashval)
+            for x in range(len(object_names)):
+                for hashval in res['col_hash'][res['col_body'] == x].tolist():
+                    particles_sorted_per_sim[object_names[x]].append(hashval)
+                    particles_sorted_per_sim['remaining'].remove(hashval)
             
             sim_num = int(folder.split('/')[-1].split('_')[-1].split('.')[0])
             particles_sorted_per_vinc[sim_num-1] = particles_sorted_per_sim
@@ -115,7 +280,7 @@ def sort_particles_all(num_vincs=6, num_sims=60):
         
         
         
-def get_orbital_elements_all(num_vincs=6, num_sims=60):
+def get_orbital_elements_all(num_vincs=6, num_sims=60, times=None):
     
     """
     DESCRIPTION:
@@ -123,11 +288,15 @@ def get_orbital_elements_all(num_vincs=6, num_sims=60):
             eccs_all.pkl
             incs_all.pkl
             axes_all.pkl
-        Accessed by [num_vinc][num_sim][bin_slice][type]
+        Accessed by [num_vinc][num_sim][bin_slice][type], where bin_slice indexes the times saved in times_all.pkl.
+        Each simulation contributes its snapshot closest to each time (see snapshot_sources for packed and sharded runs).
         
     CALLING SEQUENCE:
-        get_orbital_elements_all(num_vincs=6)
+        get_orbital_elements_all(num_vincs=6, num_sims=60, times=None)
         
+    KEYWORDS:
+    ## times: snapshot times (in years) to get; by default, the snapshot times recorded in the overview
+    ##        of the first simulation ('Snapshot times (yrs)'), or bin_slices slices every 10 years for older runs
     """
     parent = os.getcwd()
     eccs_all = [] #[num_vinc][num_sim][bin_slice][type]
@@ -137,23 +306,30 @@ def get_orbital_elements_all(num_vincs=6, num_sims=60):
     with open(parent + '/Plots/all_ejecta/particles_sorted_all.pkl', 'rb') as f:
         particles_sorted_all = pickle.load(f)
     
+    if times is None:
+        first = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/0vinc/*'))[0]
+        times = read_results(first)['meta'].get('Snapshot times (yrs)') or [i*10 for i in range(bin_slices)]
+    
     #get orbital element data
     print('getting orbital elements data...')    
     for v in range(num_vincs):
         folder_paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/*'))
-        bin_paths = [x + '/' + x.split('/')[-1] + '.bin' for x in folder_paths]
         eccs_per_vinc = [0]*num_sims
         incs_per_vinc = [0]*num_sims
         axes_per_vinc = [0]*num_sims
-        for bin in bin_paths:
+        for folder in folder_paths:
             eccs_per_sim = []
             incs_per_sim = []
             axes_per_sim = []
             
-            sim_num = int(bin.split('/')[-1].split('_')[-1].split('.')[0])
-            sa = rebound.SimulationArchive(bin)
-            for i in range(bin_slices):
-                snapshot = sa[i]
+            sim_num = int(folder.split('/')[-1].split('_')[-1].split('.')[0])
+            sources = snapshot_sources(folder)
+            if sources is None:
+                return
+            for t in times:
+                orbits = {}
+                for sa, sa_times, pop in sources:                 #one per shard of a sharded run
+                    orbits.update(snapshot_orbits(sa[int(np.argmin(np.abs(sa_times - t)))], pop))
                 eccs_per_binslice = {
                     'escaped': [],
                     'remaining': [],
@@ -171,32 +347,30 @@ def get_orbital_elements_all(num_vincs=6, num_sims=60):
                     incs_per_binslice[o] = []
                     axes_per_binslice[o] = []
                     
-                existing_particles = [x.hash.value for x in snapshot.particles[:]]
-                
                 #get escaped orbital elements
                 for hashval in particles_sorted_all[v][sim_num-1]['escaped']:
-                    if hashval in existing_particles:
-                        orbit = snapshot.particles[h(hashval)].orbit
-                        eccs_per_binslice['escaped'].append(orbit.e)
-                        incs_per_binslice['escaped'].append(orbit.inc)
-                        axes_per_binslice['escaped'].append(orbit.a)
+                    if hashval in orbits:
+                        e, inc, a = orbits[hashval]
+                        eccs_per_binslice['escaped'].append(e)
+                        incs_per_binslice['escaped'].append(inc)
+                        axes_per_binslice['escaped'].append(a)
                 
                 #get remaining orbital elements
                 for hashval in particles_sorted_all[v][sim_num-1]['remaining']:
-                    if hashval in existing_particles:
-                        orbit = snapshot.particles[h(hashval)].orbit
-                        eccs_per_binslice['remaining'].append(orbit.e)
-                        incs_per_binslice['remaining'].append(orbit.inc)
-                        axes_per_binslice['remaining'].append(orbit.a)
+                    if hashval in orbits:
+                        e, inc, a = orbits[hashval]
+                        eccs_per_binslice['remaining'].append(e)
+                        incs_per_binslice['remaining'].append(inc)
+                        axes_per_binslice['remaining'].append(a)
                     
                 #get planet collision orbital elements
                 for o in object_names:
                     for hashval in particles_sorted_all[v][sim_num-1][o]:
-                        if hashval in existing_particles:
-                            orbit = snapshot.particles[h(hashval)].orbit
-                            eccs_per_binslice[o].append(orbit.e)
-                            incs_per_binslice[o].append(orbit.inc)
-                            axes_per_binslice[o].append(orbit.a)
+                        if hashval in orbits:
+                            e, inc, a = orbits[hashval]
+                            eccs_per_binslice[o].append(e)
+                            incs_per_binslice[o].append(inc)
+                            axes_per_binslice[o].append(a)
 
                 eccs_per_sim.append(eccs_per_binslice)
                 incs_per_sim.append(incs_per_binslice)
@@ -220,6 +394,8 @@ def get_orbital_elements_all(num_vincs=6, num_sims=60):
         pickle.dump(eccs_all, f, pickle.HIGHEST_PROTOCOL)
     with open(parent + '/Plots/all_ejecta/axes_all.pkl', 'wb') as f:
         pickle.dump(axes_all, f, pickle.HIGHEST_PROTOCOL)
+    with open(parent + '/Plots/all_ejecta/times_all.pkl', 'wb') as f:
+        pickle.dump(list(times), f, pickle.HIGHEST_PROTOCOL)
     
     
 
@@ -259,6 +435,7 @@ def orbital_elements_videos_all(num_vincs=6, num_sims=60):
         axes_all = pickle.load(f)
         
     print('axes loaded...')
+    times = load_times()
         
         
     mp4colors = ('palegreen','r', 'c', 'm', 'gold', 'darkgrey', 'b', 'g', 'k')
@@ -353,10 +530,10 @@ def orbital_elements_videos_all(num_vincs=6, num_sims=60):
             g.set_offsets(np.c_[xg,yg])
             h.set_offsets(np.c_[xh,yh])
             esc.set_offsets(np.c_[xesc, yesc])
-            ax.set_title("all particles, inc vs. a, time = " + str(i*10) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
+            ax.set_title("all particles, inc vs. a, time = " + '{:g}'.format(times[i]) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
 
         ani_incs = FuncAnimation(fig, animate_incs, 
-                        frames=np.arange(0, 201, 1), interval=200, repeat=True) 
+                        frames=np.arange(0, len(times), 1), interval=200, repeat=True) 
 
         savefolder = parent + '/Plots/all_ejecta/vincs_separate/' + str(v) + 'vinc/all_planets/'
         f ="inc_v_a_" + str(v) + "vinc_all_particles.mp4"
@@ -448,10 +625,10 @@ def orbital_elements_videos_all(num_vincs=6, num_sims=60):
             g.set_offsets(np.c_[xg,yg])
             h.set_offsets(np.c_[xh,yh])
             esc.set_offsets(np.c_[xesc, yesc])
-            ax.set_title("all particles, e vs. a, time = " + str(i*10) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
+            ax.set_title("all particles, e vs. a, time = " + '{:g}'.format(times[i]) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
 
         ani_eccs = FuncAnimation(fig, animate_eccs, 
-                        frames=np.arange(0, 201, 1), interval=200, repeat=True) 
+                        frames=np.arange(0, len(times), 1), interval=200, repeat=True) 
 
         savefolder = parent + '/Plots/all_ejecta/vincs_separate/' + str(v) + 'vinc/all_planets/'
         f ="e_v_a_" + str(v) + "vinc_all_particles.mp4"
@@ -489,10 +666,10 @@ def orbital_elements_videos_all(num_vincs=6, num_sims=60):
                         x = x + axes_all[v][j][i][mp4data[q]]
                         y = y + eccs_all[v][j][i][mp4data[q]]
                 sc.set_offsets(np.c_[x,y])
-                ax.set_title(mp4titles[q] + ", e vs. a, time = " + str(i*10) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
+                ax.set_title(mp4titles[q] + ", e vs. a, time = " + '{:g}'.format(times[i]) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
 
             ani = FuncAnimation(fig, animate_eccs_separate, 
-                            frames=np.arange(0, 201, 1), interval=200, repeat=True) 
+                            frames=np.arange(0, len(times), 1), interval=200, repeat=True) 
             
             savefolder = parent + '/Plots/all_ejecta/vincs_separate/' + str(v) + 'vinc/per_planet/e_v_a/'
             f = 'e_v_a_' + str(v) + 'vinc_' + mp4filenames[q] + ".mp4"
@@ -530,10 +707,10 @@ def orbital_elements_videos_all(num_vincs=6, num_sims=60):
                         x = x + axes_all[v][j][i][mp4data[q]]
                         y = y + incs_all[v][j][i][mp4data[q]]
                 sc.set_offsets(np.c_[x,y])
-                ax.set_title(mp4titles[q] + ", inc vs. a, time = " + str(i*10) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
+                ax.set_title(mp4titles[q] + ", inc vs. a, time = " + '{:g}'.format(times[i]) + " years (v_inc = +" + str(v) + " km/s)", fontsize = 16, y = 1.04)
 
             ani = FuncAnimation(fig, animate_incs_separate, 
-                            frames=np.arange(0, 201, 1), interval=200, repeat=True) 
+                            frames=np.arange(0, len(times), 1), interval=200, repeat=True) 
             
             savefolder = parent + '/Plots/all_ejecta/vincs_separate/' + str(v) + 'vinc/per_planet/inc_v_a/'
             f = 'inc_v_a_' + str(v) + 'vinc_' + mp4filenames[q] + ".mp4"
@@ -557,7 +734,7 @@ def ecc_snapshot_allp(vinc, timeslice, rem=True, esc=True, a=False, b=True, c=Tr
     
     KEYWORDS:
     ## vinc: the vinc you want snapshotted
-    ## timeslice: the timeslice you want snapshotted
+    ## timeslice: the timeslice you want snapshotted (see time_slice to find it from a time)
     ## rem/esc/b/c/.....h: toggling types on/off
     ## label: out of 'all', 'mixed', or the single type (e.g. 'remaining', 'a', etc.) 
     """
@@ -724,7 +901,7 @@ def ecc_snapshot_allp(vinc, timeslice, rem=True, esc=True, a=False, b=True, c=Tr
         
     ax.set_xlabel("Semimajor Axis (AU)", fontsize = 13)
     ax.set_ylabel("Eccentricity", fontsize = 13)
-    ax.set_title("e vs. a, time = " + str(timeslice*10) + " years (v_inc = +" + str(vinc) + " km/s)", fontsize = 16, y = 1.02)
+    ax.set_title("e vs. a, time = " + '{:g}'.format(load_times()[timeslice]) + " years (v_inc = +" + str(vinc) + " km/s)", fontsize = 16, y = 1.02)
 
     plt.legend(loc=1)
     
@@ -785,7 +962,7 @@ def inc_snapshot_allp(vinc, timeslice, rem=True, esc=True, a=False, b=True, c=Tr
     
     KEYWORDS:
     ## vinc: the vinc you want snapshotted
-    ## timeslice: the timeslice you want snapshotted
+    ## timeslice: the timeslice you want snapshotted (see time_slice to find it from a time)
     ## rem/esc/b/c/.....h: toggling types on/off
     ## label: out of 'all', 'mixed', or the single type (e.g. 'remaining', 'a', etc.) 
     """
@@ -953,7 +1130,7 @@ def inc_snapshot_allp(vinc, timeslice, rem=True, esc=True, a=False, b=True, c=Tr
         
     ax.set_xlabel("Semimajor Axis (AU)", fontsize = 13)
     ax.set_ylabel("Inclination (radians)", fontsize = 13)
-    ax.set_title("inc vs. a, time = " + str(timeslice*10) + " years (v_inc = +" + str(vinc) + " km/s)", fontsize = 16, y = 1.02)
+    ax.set_title("inc vs. a, time = " + '{:g}'.format(load_times()[timeslice]) + " years (v_inc = +" + str(vinc) + " km/s)", fontsize = 16, y = 1.02)
     
     plt.legend(loc=1)
     
@@ -0,0 +1,233 @@
+import ast
+import json
+import numpy as np
+import os
+import csv
+import glob
+
+#****CONSTANTS****(hardwired to TRAPPIST for now, to be fixed later)
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+#******************
+
+
+def read_results(folder):
+    """
+    DESCRIPTION:
+    Reads the results of one simulation folder into a dictionary of numpy columns:
+        meta ------------------overview dictionary ('Number of Ejecta', 'Escaped Particles', 'a'-'h', ...)
+        body_names ------------names of the bodies, indexed by col_body
+        init_hash, init_inc, init_vplanet (n, 3), init_vstar (n, 3)
+        init_weight -----------sampling weight of each ejecta (for simulations that did not record weights, the weights
+                               of the 'cube' sampler they were drawn with, from init_vplanet)
+        init_site -------------ejection site ID of each ejecta: 0-5 for the named sites (forward, backward, up, down,
+                               left, right), 6 for a cone given by its axis, -1 for the whole sphere
+        init_vinc -------------velocity increment of each ejecta (km/s; from the overview for fixed-speed simulations)
+        init_vinc_density -----sampling density of init_vinc (per km/s; NaN for fixed-speed simulations)
+        init_parent -----------hash of the ejecta a clone was split from (0 for ejecta that are not clones)
+        col_body, col_hash, col_v (n, 3), col_t                  (collisions, sorted by time)
+        col_rel_pos, col_rel_vel (n, 3) ------ejecta position and velocity relative to the body hit
+        col_body_pos, col_body_vel (n, 3) ----position and velocity of the body hit, relative to the star
+                                              (NaN for simulations that did not record impact geometry)
+        esc_hash, esc_orbit (n, 6: a, e, inc, Omega, omega, f), esc_t, esc_vinf
+    Reads <label>_results.npz, or the older per-body csv files if the simulation has no results file.
+
+    CALLING SEQUENCE:
+    results = read_results(folder)
+
+    KEYWORDS:
+    ## folder: the simulation folder, e.g. Ejecta_Simulation_Data/0vinc/5000e_2000y_0vinc_1
+    """
+
+    label = folder.rstrip('/').split('/')[-1]
+    path = os.path.join(folder, label + '_results.npz')
+    if os.path.exists(path):
+        with np.load(path) as data:
+            results = {key: data[key] for key in data.files}
+        results['meta'] = json.loads(str(results['meta']))
+        for key in ['col_rel_pos', 'col_rel_vel', 'col_body_pos', 'col_body_vel']:
+            results.setdefault(key, np.full((len(results['col_t']), 3), np.nan))
+        results.setdefault('init_weight', cube_weights(results['init_vplanet']))
+        results.setdefault('init_site', np.full(len(results['init_hash']), -1, dtype='int8'))
+        results.setdefault('init_vinc', np.full(len(results['init_hash']), np.nan))
+        results.setdefault('init_vinc_density', np.full(len(results['init_hash']), np.nan))
+        results.setdefault('init_parent', np.zeros(len(results['init_hash']), dtype='uint32'))
+        fixed_vinc(results)
+        return results
+
+    def rows(name):
+        with open(os.path.join(folder, label + '_' + name + '.csv'), 'r') as f:
+            return list(csv.reader(f))[1:]
+
+    meta = {}
+    for key, val in rows('overview'):
+        try:
+            meta[key] = ast.literal_eval(val) if val != '' else None        #empty cells were written for None
+        except (ValueError, SyntaxError):
+            meta[key] = val
+
+    init = np.array([row + ['nan', '-1', 'nan', 'nan', '0'][len(row) - 8:] for row in rows('particle_inits')[1:]],
+                    dtype=float).reshape(-1, 13)
+    unweighted = np.isnan(init[:, 8])                                   #recorded before sampling weights
+    init[unweighted, 8] = cube_weights(init[unweighted, 2:5])
+    cols = [np.array([row + ['nan']*(17 - len(row)) for row in rows(o)[1:]], dtype=float).reshape(-1, 17)
+            for o in object_names]
+    body = np.concatenate([np.full(len(cols[x]), x, dtype='uint8') for x in range(len(object_names))])
+    cols = np.concatenate(cols)
+    order = np.argsort(cols[:, 4], kind='stable')
+    esc = np.array(rows('escaped')[1:], dtype=float).reshape(-1, 9)
+
+    results = {
+        'meta': meta,
+        'body_names': np.array(object_names),
+        'init_hash': init[:, 0].astype('uint32'),
+        'init_inc': init[:, 1],
+        'init_vplanet': init[:, 2:5],
+        'init_vstar': init[:, 5:8],
+        'init_weight': init[:, 8],
+        'init_site': init[:, 9].astype('int8'),
+        'init_vinc': init[:, 10],
+        'init_vinc_density': init[:, 11],
+        'init_parent': init[:, 12].astype('uint32'),
+        'col_body': body[order],
+        'col_hash': cols[order, 0].astype('uint32'),
+        'col_v': cols[order, 1:4],
+        'col_t': cols[order, 4],
+        'col_rel_pos': cols[order, 5:8],
+        'col_rel_vel': cols[order, 8:11],
+        'col_body_pos': cols[order, 11:14],
+        'col_body_vel': cols[order, 14:17],
+        'esc_hash': esc[:, 0].astype('uint32'),
+        'esc_orbit': esc[:, 1:7],
+        'esc_t': esc[:, 7],
+        'esc_vinf': esc[:, 8],
+    }
+    fixed_vinc(results)
+    return results
+
+
+def cube_weights(v):
+    """
+    DESCRIPTION:
+    Sampling weights of the 'cube' direction sampler, which the original runs used, for the directions of the
+    vectors v (n, 3), e.g. init_vplanet: the isotropic density over the density of normalized random points in a cube.
+    Simulations that did not record weights get these, so they pool with newer 'cube' runs.
+
+    CALLING SEQUENCE:
+    weights = cube_weights(results['init_vplanet'])
+    """
+
+    n_v = v/np.linalg.norm(v, axis=1)[:, None]
+    return 6*np.abs(n_v).max(axis=1)**3/np.pi
+
+
+def fixed_vinc(results):
+    """
+    DESCRIPTION:
+    Fills in the velocity increments of simulations that recorded none from their overview
+    ('Velocity Increment (10km/s)', which holds the increment in km/s).
+
+    CALLING SEQUENCE:
+    fixed_vinc(results)
+    """
+
+    missing = np.isnan(results['init_vinc'])
+    if missing.any() and results['meta'].get('Velocity Increment (10km/s)') is not None:
+        results['init_vinc'] = np.where(missing, float(results['meta']['Velocity Increment (10km/s)']), results['init_vinc'])
+
+
+def ejecta_weights(results, hashes):
+    """
+    DESCRIPTION:
+    Looks up the sampling weights of the given ejecta (e.g. results['col_hash']) in one simulation's results.
+    Sums of weights, rather than counts, estimate what isotropic ejection would give.
+
+    CALLING SEQUENCE:
+    weights = ejecta_weights(results, hashes)
+    """
+
+    order = np.argsort(results['init_hash'])
+    return results['init_weight'][order[np.searchsorted(results['init_hash'], hashes, sorter=order)]]
+
+
+def ejecta_fates(results):
+    """
+    DESCRIPTION:
+    Outcome of every ejecta in one simulation's results, in the order of init_hash: the index of the body it hit
+    (0-7, as in body_names), len(body_names) if it escaped, or len(body_names) + 1 if it remains.
+
+    CALLING SEQUENCE:
+    fates = ejecta_fates(results)
+    """
+
+    nbodies = len(results['body_names'])
+    fates = np.full(len(results['init_hash']), nbodies + 1)
+    fates[np.isin(results['init_hash'], results['esc_hash'])] = nbodies
+    order = np.argsort(results['init_hash'])
+    fates[order[np.searchsorted(results['init_hash'], results['col_hash'], sorter=order)]] = results['col_body']
+    return fates
+
+
+def results_to_csv(folder):
+    """
+    DESCRIPTION:
+    Writes the overview, particle_inits, per-body collision and escaped csv files of one simulation folder
+    from its results file, in the layout older simulations wrote them.
+
+    CALLING SEQUENCE:
+    results_to_csv(folder)
+
+    KEYWORDS:
+    ## folder: the simulation folder, e.g. Ejecta_Simulation_Data/0vinc/5000e_2000y_0vinc_1
+    """
+
+    label = folder.rstrip('/').split('/')[-1]
+    res = read_results(folder)
+
+    def write(name, header, rows):
+        with open(os.path.join(folder, label + '_' + name + '.csv'), 'w') as f:
+            w = csv.writer(f)
+            w.writerow([label])
+            if header is not None:
+                w.writerow(header)
+            w.writerows(rows)
+
+    write('overview', None, [[key, '' if val is None else val] for key, val in res['meta'].items()])
+    write('particle_inits', ['hash','inc', 'vxPlanet', 'vyPlanet', 'vzPlanet', 'vxStar', 'vyStar', 'vzStar', 'weight',
+                             'site', 'vinc', 'vincDensity', 'parent'],
+          [[int(res['init_hash'][k])] + [float(res['init_inc'][k])] + res['init_vplanet'][k].tolist()
+           + res['init_vstar'][k].tolist() + [float(res['init_weight'][k]), int(res['init_site'][k]),
+                                              float(res['init_vinc'][k]), float(res['init_vinc_density'][k]),
+                                              int(res['init_parent'][k])]
+           for k in range(len(res['init_hash']))])
+    for x in range(len(res['body_names'])):
+        k_body = np.nonzero(res['col_body'] == x)[0]
+        write(str(res['body_names'][x]), ['hash','vx', 'vy', 'vz', 't', 'dx', 'dy', 'dz', 'dvx', 'dvy', 'dvz',
+                                          'xBody', 'yBody', 'zBody', 'vxBody', 'vyBody', 'vzBody'],
+              [[int(res['col_hash'][k])] + res['col_v'][k].tolist() + [float(res['col_t'][k])]
+               + np.concatenate([res['col_rel_pos'][k], res['col_rel_vel'][k], res['col_body_pos'][k],
+                                 res['col_body_vel'][k]]).tolist() for k in k_body])
+    write('escaped', ['hash', 'semi-maj axis', 'eccentricity', 'inclination', 'long. asc. node', 'arg. pericenter',
+                      'true anomaly', 't', 'v_inf'],
+          [[int(res['esc_hash'][k])] + res['esc_orbit'][k].tolist() + [float(res['esc_t'][k]), float(res['esc_vinf'][k])]
+           for k in range(len(res['esc_hash']))])
+
+
+def results_to_csv_all(num_vincs=6):
+    """
+    DESCRIPTION:
+    Runs results_to_csv on every simulation folder in Ejecta_Simulation_Data/[vinc_num]vinc/ that has a results file.
+
+    CALLING SEQUENCE:
+    results_to_csv_all(num_vincs=6)
+
+    KEYWORDS:
+    ## num_vincs: number of velocity increments (default 6; +0-5 km/s)
+    """
+
+    parent = os.getcwd()
+    for v in range(num_vincs):
+        folder_paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/*'))
+        for folder in folder_paths:
+            if os.path.exists(folder + '/' + folder.split('/')[-1] + '_results.npz'):
+                results_to_csv(folder)
+        print(str(v) + 'vinc results written to csv...')
@@ -0,0 +1,104 @@
+import numpy as np
+import glob
+from results import read_results, ejecta_fates
+
+#****CONSTANTS****(hardwired to TRAPPIST for now, to be fixed later)
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+AUyr_to_kms = 4.740470463533348         #1 AU/yr in km/s
+#******************
+
+
+def spectrum_density(spectrum, vinc, v_esc):
+    """
+    DESCRIPTION:
+    Density (per km/s) of a velocity spectrum, given as for velocity_spectrum in start_template.py, at the
+    velocity increments vinc (in km/s); 0 outside its range:
+        ('uniform', vmin, vmax) ------------uniform between vmin and vmax
+        ('powerlaw', vmin, vmax, index) ----total ejection speed v_esc + increment distributed as speed**-index
+        ('table', increments, densities) ---density interpolated linearly between tabulated increments
+
+    CALLING SEQUENCE:
+    density = spectrum_density(('powerlaw', 0, 10, 2), vinc, v_esc)
+
+    KEYWORDS:
+    ## v_esc: escape velocity of the source planet (in km/s)
+    """
+
+    vinc = np.asarray(vinc, dtype=float)
+    kind, vmin, vmax = spectrum[:3]
+    if kind == 'uniform':
+        return np.where((vinc >= vmin) & (vinc <= vmax), 1/(vmax - vmin), 0.)
+    if kind == 'powerlaw':
+        k = spectrum[3]
+        s0, s1, s = v_esc + vmin, v_esc + vmax, v_esc + vinc
+        norm = 1/np.log(s1/s0) if k == 1 else (1 - k)/(s1**(1 - k) - s0**(1 - k))
+        return np.where((vinc >= vmin) & (vinc <= vmax), norm*s**-k, 0.)
+    if kind == 'table':
+        grid, dens = np.array(vmin, dtype=float), np.array(vmax, dtype=float)
+        return np.interp(vinc, grid, dens, left=0., right=0.)/(np.diff(grid)*(dens[1:] + dens[:-1])/2).sum()
+    print('Error: unknown spectrum ' + repr(kind) + '; use \'uniform\', \'powerlaw\' or \'table\'.')
+    return None
+
+
+def speed_weights(results, target):
+    """
+    DESCRIPTION:
+    Importance weights that reweight one simulation's ejecta from the velocity spectrum they were drawn from
+    to a target spectrum: each ejecta's sampling weight times the target's density over the sampling density
+    at its velocity increment. The target must be 0 wherever the simulation drew no ejecta.
+    Simulations run at a fixed velocity increment have no sampling density and get NaN.
+
+    CALLING SEQUENCE:
+    weights = speed_weights(read_results(folder), ('powerlaw', 0, 10, 2))
+
+    KEYWORDS:
+    ## target: a spectrum (see spectrum_density) or a function of the velocity increment (in km/s) giving the
+               target's relative density
+    """
+
+    vinc = results['init_vinc']
+    if callable(target):
+        p = np.asarray(target(vinc), dtype=float)
+    else:
+        v_esc = np.median(np.linalg.norm(results['init_vplanet'], axis=1)*AUyr_to_kms - vinc)
+        p = spectrum_density(target, vinc, v_esc)
+    return results['init_weight']*p/results['init_vinc_density']
+
+
+def reweighted_outcomes(folders, target):
+    """
+    DESCRIPTION:
+    Fractions of ejecta that hit each body, escaped or remain, under a target velocity spectrum, from
+    simulations whose speeds were drawn from a velocity spectrum. Pools the ejecta of all simulations with their
+    speed_weights and normalizes by the sum of the weights; returns a dictionary of (fraction, error) per outcome
+    ('a'-'h', 'escaped', 'remaining'), with 'ess' the effective number of ejecta, (sum of w)**2/(sum of w**2).
+    An ess much smaller than the number of ejecta means the target is poorly covered by the sampled spectrum.
+
+    CALLING SEQUENCE:
+    outcomes = reweighted_outcomes('Ejecta_Simulation_Data/vspec_*', ('powerlaw', 0, 10, 2))
+
+    KEYWORDS:
+    ## folders: a list of simulation folders, or a glob pattern matching them
+    ## target: a spectrum (see spectrum_density) or a function of the velocity increment (see speed_weights)
+    """
+
+    if isinstance(folders, str):
+        folders = sorted(glob.glob(folders))
+    weights, outcome = [], []
+    for folder in folders:
+        res = read_results(folder)
+        w = speed_weights(res, target)
+        if np.isnan(w).any():
+            print('Error: ' + folder + ' was not run with a velocity spectrum; it cannot be reweighted.')
+            return None
+        weights.append(w)
+        outcome.append(ejecta_fates(res))
+    w, fate = np.concatenate(weights), np.concatenate(outcome)
+
+    total = w.sum()
+    outcomes = {}
+    for k, name in enumerate(object_names + ['escaped', 'remaining']):
+        f = w[fate == k].sum()/total
+        outcomes[name] = (f, np.sqrt((w**2*((fate == k) - f)**2).sum())/total)
+    outcomes['ess'] = total**2/(w**2).sum()
+    return outcomes
@@ -0,0 +1,71 @@
+import numpy as np
+import glob
+from results import read_results, ejecta_fates
+
+#****CONSTANTS****(hardwired to TRAPPIST for now, to be fixed later)
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+#******************
+
+
+def ejecta_roots(results):
+    """
+    DESCRIPTION:
+    Hash of the ejected ancestor of every ejecta in one simulation's results, in the order of init_hash,
+    following the clones of splitting runs (see split_levels in start_template.py) back through their parents.
+    Ejecta that are not clones are their own root.
+
+    CALLING SEQUENCE:
+    roots = ejecta_roots(results)
+    """
+
+    order = np.argsort(results['init_hash'])
+    roots = results['init_hash'].copy()
+    parents = results['init_parent']
+    while True:
+        up = parents[order[np.searchsorted(results['init_hash'], roots, sorter=order)]]
+        if not up.any():
+            return roots
+        roots = np.where(up != 0, up, roots)
+
+
+def split_outcomes(folders):
+    """
+    DESCRIPTION:
+    Fractions of ejecta that hit each body, escaped (the leakage fraction) or remain, from simulations run
+    with importance splitting, or without. Each ejected particle and all clones split from it contribute the
+    sum of their weights to its outcomes; the fractions are the means of these sums over all ejected particles,
+    and the errors their standard errors, which account for clones sharing their history.
+    Returns a dictionary of (fraction, error) per outcome ('a'-'h', 'escaped', 'remaining'), with 'ejecta' and
+    'clones' the numbers of ejected particles and clones, and 'equivalent_ejecta' the number of plain ejecta
+    that would give the same error on the escaped fraction.
+
+    CALLING SEQUENCE:
+    outcomes = split_outcomes('Ejecta_Simulation_Data/5000e_20000y_0vinc_*')
+
+    KEYWORDS:
+    ## folders: a list of simulation folders, or a glob pattern matching them
+    """
+
+    if isinstance(folders, str):
+        folders = sorted(glob.glob(folders))
+    names = object_names + ['escaped', 'remaining']
+    sums = []
+    clones = 0
+    for folder in folders:
+        res = read_results(folder)
+        roots, index = np.unique(ejecta_roots(res), return_inverse=True)
+        fates = ejecta_fates(res)
+        sums.append(np.column_stack([np.bincount(index, weights=res['init_weight']*(fates == k), minlength=len(roots))
+                                     for k in range(len(names))]))
+        clones += int((res['init_parent'] != 0).sum())
+    sums = np.concatenate(sums)
+
+    n = len(sums)
+    outcomes = {}
+    for k, name in enumerate(names):
+        outcomes[name] = (sums[:, k].mean(), sums[:, k].std(ddof=1)/np.sqrt(n))
+    outcomes['ejecta'] = n
+    outcomes['clones'] = clones
+    f, err = outcomes['escaped']
+    outcomes['equivalent_ejecta'] = f*(1 - f)/err**2 if err > 0 else None
+    return outcomes
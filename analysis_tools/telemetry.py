@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import os
+import glob
+
+
+def read_telemetry(path):
+    """
+    DESCRIPTION:
+    Reads a simulation's per-chunk telemetry file (<label>_telemetry.jsonl) into a list of dictionaries,
+    one per integrated chunk, with keys 'job', 'chunk', 't_start', 't', 'wall', 'elapsed', 'N_start', 'N',
+    'steps', 'collisions', 'callbacks', 'callback_time', 'peak_rss_mb', 'archive_bytes' and 'archive_written'.
+    A partly written last line is ignored.
+
+    CALLING SEQUENCE:
+    records = read_telemetry(path)
+    """
+
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def telemetry_summary(num_vincs=6):
+    """
+    DESCRIPTION:
+    Summarizes the telemetry of every simulation in Ejecta_Simulation_Data/[vinc_num]vinc/: core-hours spent,
+    the share of it spent in the python collision callback (None unless run with profile_callback), peak memory
+    and snapshot disk use per velocity increment, plus a fit of wall seconds per simulated year against the number
+    of remaining ejecta (seconds/yr = intercept + slope*N), to use for sizing jobs.
+    Simulations that have not finished a chunk yet (empty telemetry file) add nothing but their count, and
+    velocity increments with no records at all are left out of the summary.
+
+    CALLING SEQUENCE:
+    summary = telemetry_summary(num_vincs=6)
+
+    KEYWORDS:
+    ## num_vincs: number of velocity increments (default 6; +0-5 km/s)
+    """
+
+    parent = os.getcwd()
+    summary = {}
+    for v in range(num_vincs):
+        paths = sorted(glob.glob(parent + '/Ejecta_Simulation_Data/' + str(v) + 'vinc/*/*_telemetry.jsonl'))
+        per_sim = [read_telemetry(path) for path in paths]           #empty for simulations yet to finish a chunk
+        records = [r for recs in per_sim for r in recs]
+        if len(records) == 0:
+            continue
+
+        wall = np.array([r['wall'] for r in records])
+        years = np.array([r['t'] - r['t_start'] for r in records])
+        N = np.array([r['N_start'] for r in records])
+        rate = wall/years
+        timed = np.array([r['callback_time'] is not None for r in records])          #runs with profile_callback
+        callback = np.array([r['callback_time'] for r in records if r['callback_time'] is not None])
+        slope, intercept = np.polyfit(N, rate, 1) if np.ptp(N) > 0 else (0., rate.mean())
+
+        summary[v] = {
+            'simulations': len(paths),
+            'core_hours': float(wall.sum()/3600),
+            'callback_share': float(callback.sum()/wall[timed].sum()) if timed.any() else None,
+            'peak_rss_mb': max(r['peak_rss_mb'] for r in records),
+            'archive_mb': sum(recs[-1]['archive_bytes'] for recs in per_sim if recs)/2**20,
+            'sec_per_yr_intercept': float(intercept),
+            'sec_per_yr_per_ejecta': float(slope),
+        }
+        print(str(v) + 'vinc: ' + str(summary[v]))
+    return summary
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+EJECTA SIMULATION CAMPAIGN RUNNER
+
+Runs a whole sweep of simulations (every v_increment, repeated) from one campaign spec,
+instead of copying start_template.py and its .sh file for every v_increment.
+
+Calling sequence:
+    python campaign.py spec.json                  #write the filled-in scripts and the slurm job array
+    python campaign.py spec.json [task number]    #run one task of the job array (done by the .sh file)
+    python campaign.py spec.json consolidate      #group the simulations stopped by consolidate_at, and write
+                                                  #the slurm job array continuing each group in one simulation
+    python campaign.py spec.json consolidate [group number]     #run one consolidated simulation
+
+Campaign spec (JSON):
+    *name -------------campaign name, used for the job name and the Campaigns/[name] folder
+    *template ---------system template to fill in (default start_template.py, next to this file)
+    *sourceplanet -----planet the ejecta are launched from
+    *num_ejecta -------ejecta per simulation
+    *num_years --------years per simulation
+    *v_increments -----list of velocity increments (in km/s)
+    *repeats ----------simulations per v_increment, numbered 1-repeats
+    *sims_per_task ----simulations packed into one array task (default 1), run one after another
+                       in one python process, so start-up, imports and queueing happen once per task
+    *maxtime ----------wall-clock limit of one task (in seconds), shared by its simulations
+    *params -----------any other template parameters to set, e.g. {"archive_int": 100}
+    *slurm ------------extra #SBATCH options, e.g. {"account": "astro", "mem-per-cpu": "2gb"}
+    *chain ------------requeue a task whose simulations ran out of wall-clock time, so runs longer than 
+                       maxtime continue from their checkpoints in new jobs (default false)
+    *consolidate_at ---stop every simulation at this time (in years) and continue the survivors of 
+                       consolidate_sims simulations together in one, sharing the cost of the planets
+    *consolidate_sims -simulations merged into one consolidated simulation (default 20)
+
+Each simulation still writes to its usual Ejecta_Simulation_Data/[label] folder. Rerunning a task
+skips simulations that already finished and resumes the others from their checkpoints.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+import signal
+import multiprocessing
+import subprocess
+import shutil
+import csv
+import numpy as np
+import matplotlib
+import rebound                              #imported once per task; the forked simulations share it
+
+
+"""FUNCTION DEFINITIONS"""
+
+def read_spec(path):
+
+    """
+    Reads a campaign spec and fills in the defaults.
+    """
+
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    for key in ['name', 'sourceplanet', 'num_ejecta', 'num_years', 'v_increments', 'repeats']:
+        if key not in spec:
+            sys.exit("Error: campaign spec is missing '" + key + "'.")
+    spec.setdefault('template', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'start_template.py'))
+    spec.setdefault('sims_per_task', 1)
+    spec.setdefault('maxtime', 432000)
+    spec.setdefault('params', {})
+    spec.setdefault('slurm', {})
+    spec.setdefault('chain', False)
+    spec.setdefault('consolidate_at', None)
+    spec.setdefault('consolidate_sims', 20)
+    if spec['consolidate_at'] is not None and (spec['params'].get('nshards', 1) > 1 or 
+                                               spec['params'].get('populations') is not None):
+        sys.exit("Error: sharded or packed simulations cannot be consolidated.")
+    return spec
+
+
+def fill_params(text, params):
+
+    """
+    Sets parameters in the SIMULATION PARAMETERS section of a simulation script.
+    Trailing comments are kept.
+    """
+
+    head, sep, body = text.partition('"""SIMULATION PARAMETERS"""')
+    if not sep:
+        sys.exit("Error: template has no SIMULATION PARAMETERS section.")
+    for name, value in params.items():
+        pattern = re.compile(r'^(' + re.escape(name) + r' *=)([^#\n]*)(#.*)?$', re.MULTILINE)
+        if not pattern.search(body):
+            sys.exit("Error: template has no parameter '" + name + "'.")
+        body = pattern.sub(lambda m: fill_line(m, repr(value)), body, count=1)
+    return head + sep + body
+
+
+def fill_line(m, value):
+    """
+    Rewrites one matched parameter line with a new value, keeping its comment in the same column.
+    """
+
+    if m.group(3) is None:
+        return m.group(1) + ' ' + value
+    return m.group(1) + (' ' + value).ljust(len(m.group(2)) - 1) + ' ' + m.group(3)
+
+
+def script_name(spec, vinc):
+    return str(spec['num_ejecta']) + 'e_' + str(spec['num_years']) + 'y_' + str(vinc) + 'vinc.py'
+
+
+def make_sims(spec):
+
+    """
+    Lists the campaign's simulations as (v_increment, sim number), in job array order.
+    """
+
+    return [(vinc, n) for vinc in spec['v_increments'] for n in range(1, spec['repeats']+1)]
+
+
+def make_task(spec, task):
+
+    """
+    Lists the simulations of one array task (numbered from 1).
+    """
+
+    k = spec['sims_per_task']
+    return make_sims(spec)[(task-1)*k : task*k]
+
+
+def slurm_time(seconds):
+    d, s = divmod(int(seconds), 86400)
+    return str(d) + '-' + time.strftime('%H:%M:%S', time.gmtime(s))
+
+
+def write_jobscript(spec, shpath, name, cores, ntasks, command):
+
+    """
+    Writes a slurm job array script running command (followed by the task number) in every task.
+    """
+
+    slurm = dict({'account': 'astro', 'mem-per-cpu': '2gb'}, **spec['slurm'])
+    with open(shpath, 'w') as f:
+        f.write('#!/bin/sh\n\n')
+        f.write('#SBATCH --job-name=' + name + '\n')
+        f.write('#SBATCH -c ' + str(cores) + '\n')
+        f.write('#SBATCH --time=' + slurm_time(spec['maxtime']) + '\n')
+        for key, val in slurm.items():
+            f.write('#SBATCH --' + key + '=' + str(val) + '\n')
+        f.write('#SBATCH --output=%x_%a.out\n')
+        f.write('#SBATCH --open-mode=append\n')
+        f.write('#SBATCH --array=1-' + str(ntasks) + '\n')
+        f.write('#SBATCH --signal=B:USR1@900              #checkpoint 15 minutes before the time limit\n')
+        f.write('#SBATCH --requeue                        #preempted tasks are requeued and resume\n')
+        f.write('module load anaconda\n\n')
+        f.write('exec ' + command + ' $SLURM_ARRAY_TASK_ID\n')
+
+
+def write_campaign(spec, specpath):
+
+    """
+    Writes one filled-in script per v_increment and the slurm job array script to Campaigns/[name],
+    with copies of the modules the scripts import (trappist_system.py, sampling.py and records.py).
+    """
+
+    folder = os.path.join(os.getcwd(), 'Campaigns', spec['name'])
+    os.makedirs(folder, exist_ok=True)
+    with open(spec['template'], 'r') as f:
+        template = f.read()
+    for module in ['trappist_system.py', 'sampling.py', 'records.py']:
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(spec['template'])), module), folder)
+
+    for vinc in spec['v_increments']:
+        params = dict(spec['params'], num_ejecta=spec['num_ejecta'], num_years=spec['num_years'], v_increment=vinc,
+                      sourceplanet=spec['sourceplanet'], maxtime=spec['maxtime'], consolidate_at=spec['consolidate_at'])
+        with open(os.path.join(folder, script_name(spec, vinc)), 'w') as f:
+            f.write(fill_params(template, params))
+
+    ntasks = -(-len(make_sims(spec))//spec['sims_per_task'])
+    shpath = os.path.join(folder, spec['name'] + '.sh')
+    write_jobscript(spec, shpath, spec['name'], spec['params'].get('nshards', 1), ntasks,
+                    'python ' + os.path.abspath(__file__) + ' ' + os.path.abspath(specpath))
+    return shpath, ntasks
+
+
+def pop_label(spec, src, vinc, num, n):
+
+    """
+    Label of one population of simulation n, as make_label in start_template.py.
+    """
+
+    label = str(num) + 'e_' + str(spec['num_years']) + 'y_' + str(vinc) + 'vinc_' + str(n)
+    if src != spec['sourceplanet']:
+        label = src + 'src_' + label
+    site = spec['params'].get('ejection_site')
+    if site is not None:                            #site runs are prefixed with their site ID, as in make_label
+        label = 'site' + str(site_names.index(site) if isinstance(site, str) else len(site_names)) + '_' + label
+    if spec['params'].get('velocity_spectrum') is not None:
+        label = 'vspec_' + label
+    return label
+
+
+def sim_labels(spec, vinc, n):
+
+    """
+    Labels of the populations of simulation n, whose folders get its outputs: one per entry of the 
+    'populations' parameter of a packed simulation, or the one population set by the spec.
+    """
+
+    populations = spec['params'].get('populations')
+    if populations is None:
+        populations = [(spec['sourceplanet'], vinc, spec['num_ejecta'])]
+    return [pop_label(spec, src, pvinc, num, n) for src, pvinc, num in populations]
+
+
+def sim_label(spec, vinc, n):
+
+    """
+    Label of simulation n, as set in start_template.py: its population's label, or packed[populations]_...
+    for a packed simulation, whose checkpoints and snapshots go to this folder. Shard workers add _shard[k]
+    to it; a sharded simulation merges their outputs back into its populations' folders.
+    """
+
+    populations = spec['params'].get('populations')
+    if populations is None or len(populations) == 1:
+        return sim_labels(spec, vinc, n)[0]
+    return ('packed' + str(len(populations)) + '_' + str(sum([num for src, pvinc, num in populations])) + 'e_' 
+            + str(spec['num_years']) + 'y_' + str(n))
+
+
+def sim_overview(label):
+
+    """
+    Reads the overview of one population, or returns None if it has not written one yet.
+    """
+
+    path = os.path.join(os.getcwd(), 'Ejecta_Simulation_Data', label, label)
+    if os.path.exists(path + '_results.npz'):
+        with np.load(path + '_results.npz') as data:
+            return json.loads(str(data['meta']))
+    elif os.path.exists(path + '_overview.csv'):
+        with open(path + '_overview.csv', 'r') as f:
+            return dict(row for row in csv.reader(f) if len(row) == 2)
+    return None
+
+
+def sim_done(spec, vinc, n):
+
+    """
+    Checks whether a simulation already wrote the overviews of all its populations for the full campaign 
+    length, or stopped early because its ejecta ran out or for consolidation. A sharded simulation writes 
+    them once its shards are merged.
+    """
+
+    for label in sim_labels(spec, vinc, n):
+        overall = sim_overview(label)
+        if overall is None:
+            return False
+        early = overall.get('End condition') not in [None, 'completed', 'wall-clock budget']
+        if not early and float(overall.get('Total Time (yrs)', 0)) < spec['num_years']:
+            return False
+    return True
+
+
+def run_sim(path, n, params, kind='sim'):
+
+    """
+    Runs one filled-in simulation script as sim number n, with some of its parameters overridden.
+    The script as run is written next to it ([script]_[kind][n].py), so the workers of a sharded
+    simulation, which rerun it, get the same parameters.
+    """
+
+    for sig in (signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(sig, signal.SIG_DFL)
+    with open(path, 'r') as f:
+        text = fill_params(f.read(), params)
+    path = os.path.splitext(path)[0] + '_' + kind + str(n) + '.py'
+    with open(path, 'w') as f:
+        f.write(text)
+    sys.argv = [path, str(n)]                           #as if run as: python [script] [sim number]
+    exec(compile(text, path, 'exec'), {'__name__': '__main__', '__file__': path})
+
+
+def run_task(spec, task):
+
+    """
+    Runs the simulations of one array task one after another, sharing the task's wall-clock limit.
+    Signals are forwarded to the running simulation, which checkpoints and stops; the task then stops too.
+    With chain on, a task whose simulations ran out of time, or that got the time limit signal (SIGUSR1),
+    requeues itself to continue them.
+    """
+
+    tic = time.perf_counter()
+    folder = os.path.join(os.getcwd(), 'Campaigns', spec['name'])
+    ctx = multiprocessing.get_context('fork')
+    state = {'proc': None, 'signal': None}
+
+    def forward(signum, frame):
+        state['signal'] = signum
+        if state['proc'] is not None:
+            os.kill(state['proc'].pid, signum)
+    for sig in (signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(sig, forward)
+
+    failed = []
+    unfinished = []
+    ran = False
+    for vinc, n in make_task(spec, task):
+        if sim_done(spec, vinc, n):
+            print('skipping ' + str(vinc) + 'vinc sim ' + str(n) + ': already done')
+            continue
+        left = spec['maxtime'] - (time.perf_counter() - tic)
+        if left < min_simtime or state['signal'] is not None:
+            print('task stopping, leaving ' + str(vinc) + 'vinc sim ' + str(n) + ' for a rerun')
+            unfinished.append((vinc, n))
+            continue
+
+        print('running ' + str(vinc) + 'vinc sim ' + str(n), flush=True)
+        params = {'maxtime': int(left), 'chain_jobs': False}                   #the task chains instead
+        proc = ctx.Process(target=run_sim, args=(os.path.join(folder, script_name(spec, vinc)), n, params))
+        proc.start()
+        ran = True
+        state['proc'] = proc
+        proc.join()
+        state['proc'] = None
+        if proc.exitcode != 0:
+            failed.append((vinc, n))
+        elif not sim_done(spec, vinc, n):                       #ran out of wall-clock budget
+            unfinished.append((vinc, n))
+
+    if spec['chain'] and state['signal'] == signal.SIGUSR1:           #time limit close, the simulation checkpointed
+        chain_task(spec)
+    elif spec['chain'] and ran and unfinished and not failed and state['signal'] is None:
+        chain_task(spec)
+    elif failed or unfinished:
+        sys.exit("Error: simulations " + str(failed + unfinished) + " did not finish; rerun task " + str(task) + " to resume them.")
+
+
+def chain_task(spec):
+
+    """
+    Requeues this array task, so its unfinished simulations continue from their checkpoints in a new job.
+    """
+
+    job = os.environ.get('SLURM_JOB_ID')
+    if job is None:
+        print('wall-clock time used up; rerun the task to continue')
+        return
+    if 'SLURM_ARRAY_TASK_ID' in os.environ:
+        job = os.environ['SLURM_ARRAY_JOB_ID'] + '_' + os.environ['SLURM_ARRAY_TASK_ID']
+    print('wall-clock time used up; requeueing job ' + job + ' to continue', flush=True)
+    subprocess.run(spec.get('chain_command', 'scontrol requeue {job}').format(job=job).split())
+
+
+def write_consolidation(spec, specpath):
+
+    """
+    Groups the simulations stopped for consolidation, consolidate_sims at a time, and writes the groups
+    and the slurm job array running one consolidated simulation per group to Campaigns/[name].
+    """
+
+    waiting = [(vinc, n) for vinc, n in make_sims(spec)
+               if (sim_overview(sim_label(spec, vinc, n)) or {}).get('End condition') == 'stopped for consolidation']
+    if len(waiting) == 0:
+        sys.exit("Error: no simulations are waiting for consolidation.")
+    k = spec['consolidate_sims']
+    groups = [{'script': script_name(spec, waiting[i][0]),
+               'origins': [sim_label(spec, vinc, n) for vinc, n in waiting[i:i+k]]} for i in range(0, len(waiting), k)]
+
+    folder = os.path.join(os.getcwd(), 'Campaigns', spec['name'])
+    with open(os.path.join(folder, spec['name'] + '_consolidate.json'), 'w') as f:
+        json.dump(groups, f, indent=1)
+    shpath = os.path.join(folder, spec['name'] + '_consolidate.sh')
+    write_jobscript(spec, shpath, spec['name'] + '_consolidate', 1, len(groups),
+                    'python ' + os.path.abspath(__file__) + ' ' + os.path.abspath(specpath) + ' consolidate')
+    return shpath, len(waiting), len(groups)
+
+
+def run_group(spec, group):
+
+    """
+    Runs the consolidated simulation of one group (numbered from 1). Its outputs go back to the group's simulations.
+    """
+
+    folder = os.path.join(os.getcwd(), 'Campaigns', spec['name'])
+    with open(os.path.join(folder, spec['name'] + '_consolidate.json'), 'r') as f:
+        groups = json.load(f)
+    params = {'maxtime': spec['maxtime'], 'chain_jobs': spec['chain'], 'origins': groups[group-1]['origins'],
+              'consolidate_at': None}
+    if 'chain_command' in spec:
+        params['chain_command'] = spec['chain_command']
+    run_sim(os.path.join(folder, groups[group-1]['script']), group, params, 'group')
+
+#####################################
+
+
+
+"""RUNNER PARAMETERS"""
+
+min_simtime = 3600                   #do not start another simulation with less wall-clock time left (in seconds)
+site_names = ['forward', 'backward', 'up', 'down', 'left', 'right']        #named ejection sites, as in start_template.py
+
+#####################################################
+
+
+if __name__ == '__main__':
+    spec = read_spec(sys.argv[1])
+    if len(sys.argv) > 3 and sys.argv[2] == 'consolidate':
+        run_group(spec, int(sys.argv[3]))
+    elif len(sys.argv) > 2 and sys.argv[2] == 'consolidate':
+        shpath, nsims, ngroups = write_consolidation(spec, sys.argv[1])
+        print(str(nsims) + ' simulations in ' + str(ngroups) + ' consolidated simulations; submit with: sbatch ' + shpath)
+    elif len(sys.argv) > 2:
+        run_task(spec, int(sys.argv[2]))
+    else:
+        shpath, ntasks = write_campaign(spec, sys.argv[1])
+        print(str(len(make_sims(spec))) + ' simulations in ' + str(ntasks) + ' tasks; submit with: sbatch ' + shpath)
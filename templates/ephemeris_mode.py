@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+TRAPPIST-1 SHARED EPHEMERIS MODE (EXPERIMENTAL)
+
+Every simulation integrates the same star and planets; only the massless ejecta differ. This script tests
+integrating the ejecta alone, against a planetary ephemeris computed once and shared by every run.
+
+Methodology:
+1. Integrate the star and planets alone with MERCURIUS, as draw_sim in start_template.py, and store the planets'
+   positions and velocities relative to the star every ephem_steps steps (Ephemeris/). Later runs reuse the file.
+2. Integrate a sample of ejecta with the full system (MERCURIUS, direct collision search) as the reference.
+3. Integrate the same ejecta against the ephemeris: the simulation holds only the star, at rest (heliocentric
+   frame), and the ejecta; the planets' pull, and the star's reflex acceleration, are added as forces from the
+   ephemeris, interpolated in time (cubic Hermite). Collisions are found after each step by checking each ejecta's
+   path over the step against the tabulated planets.
+4. Compare the ejecta fates of each ejecta-only step size against the reference.
+
+The ejecta-only runs use WHFast with fixed steps. An adaptive integrator (IAS15) stalls near the planets: the
+interpolated planet positions are only piecewise smooth, and the step size collapses at every sample boundary.
+
+Output Data:
+1. CSV - one row per run: wall time per simulated year, the share of the full run spent stepping the planets
+   (the most an ephemeris can save), and how far the ejecta fates diverge from the reference.
+
+The system and ejecta are set up as in start_template.py, by trappist_system.py.
+"""
+
+import math
+import numpy as np
+import rebound
+import os
+import csv
+import time
+import ctypes
+from trappist_system import (days_to_yr, km_to_AU, sec_to_yr, G, object_names, draw_sim, ejecta_states,
+                            fate_recorder, compare_fates)
+
+"""FUNCTION DEFINITIONS"""
+
+def make_ephemeris(years):
+
+    """
+    Integrates the star and planets alone and stores the planets' positions and velocities relative to the star,
+    every ephem_steps steps, in Ephemeris/ephemeris_[years]y_[ephem_steps]steps.npy (samples, planets, 6).
+    An existing file is reused; it is memory-mapped, so long ephemerides need not fit in memory.
+    Returns the ephemeris, and the wall time spent making it (0 if it was reused).
+    """
+
+    folderpath = os.path.join(os.getcwd(), 'Ephemeris')
+    os.makedirs(folderpath, exist_ok=True)
+    path = os.path.join(folderpath, 'ephemeris_' + str(years) + 'y_' + str(ephem_steps) + 'steps.npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r'), 0.
+
+    tic = time.perf_counter()
+    sim = draw_sim(dt=dt)
+    n = int(math.ceil(years/(ephem_steps*dt))) + 2          #one extra sample past the end for interpolation
+    ephem = np.lib.format.open_memmap(path + '.part', mode='w+', dtype='<f8', shape=(n, len(object_names)-1, 6))
+    xyz = np.zeros((sim.N, 3))
+    vxvyvz = np.zeros((sim.N, 3))
+    for k in range(n):
+        if k > 0:
+            sim.steps(ephem_steps)
+        sim.serialize_particle_data(xyz=xyz, vxvyvz=vxvyvz)
+        ephem[k, :, :3] = xyz[1:] - xyz[0]
+        ephem[k, :, 3:] = vxvyvz[1:] - vxvyvz[0]
+    ephem.flush()
+    del ephem
+    os.replace(path + '.part', path)
+    return np.load(path, mmap_mode='r'), time.perf_counter() - tic
+
+
+def planet_positions(t):
+
+    """
+    Positions of the planets relative to the star at time t, interpolated from the ephemeris (cubic Hermite
+    through the positions and velocities of the samples on either side).
+    """
+
+    hstep = ephem_steps*dt
+    k = min(int(t/hstep), len(ephemeris)-2)
+    s = t/hstep - k
+    p0, v0 = ephemeris[k, :, :3], ephemeris[k, :, 3:]
+    p1, v1 = ephemeris[k+1, :, :3], ephemeris[k+1, :, 3:]
+    return ((2*s**3 - 3*s**2 + 1)*p0 + (s**3 - 2*s**2 + s)*hstep*v0
+            + (-2*s**3 + 3*s**2)*p1 + (s**3 - s**2)*hstep*v1)
+
+
+def particle_view(sim):
+
+    """
+    Numpy view (no copy) of the positions, velocities and accelerations [x, y, z, vx, vy, vz, ax, ay, az]
+    of every particle, from a simulation structure.
+    """
+
+    stride = ctypes.sizeof(rebound.Particle)//8
+    buf = (ctypes.c_double*(sim.N*stride)).from_address(ctypes.addressof(sim._particles.contents))
+    return np.ctypeslib.as_array(buf).reshape(sim.N, stride)[:, :9]
+
+
+def ephemeris_forces(simp):
+
+    """
+    Additional forces for the ejecta-only simulation: the pull of each planet, minus the star's acceleration
+    towards the planets (the simulation is in the star's frame). The star itself is left at rest.
+    """
+
+    sim = simp.contents
+    view = particle_view(sim)
+    pos = planet_positions(sim.t)
+    d = view[1:, None, :3] - pos[None]
+    direct = (planet_mass[:, None]*d/np.linalg.norm(d, axis=2)[:, :, None]**3).sum(axis=1)
+    reflex = (planet_mass[:, None]*pos/np.linalg.norm(pos, axis=1)[:, None]**3).sum(axis=0)
+    view[1:, 6:9] -= G*(direct + reflex)
+
+
+def ephemeris_collisions(simp):
+
+    """
+    Collision search for the ejecta-only simulation, after each step: each ejecta's path relative to each body
+    over the step is taken as a straight line, and the ejecta hit the body if the line comes within its radius.
+    Ejecta that hit are removed and recorded, as fate_recorder does for the reference.
+    """
+    global last
+
+    sim = simp.contents
+    view = particle_view(sim)
+    r1 = view[1:, :3].copy()
+    p1 = np.vstack([np.zeros(3), planet_positions(sim.t)])          #star first, then planets, as object_names
+    t0, r0, p0 = last
+    d0 = r0[:, None, :] - p0[None]
+    u = (r1[:, None, :] - p1[None]) - d0
+    s = np.clip(-(d0*u).sum(axis=2)/np.maximum((u*u).sum(axis=2), 1e-300), 0., 1.)
+    dmin = np.linalg.norm(d0 + s[:, :, None]*u, axis=2)
+    hit = dmin < body_radius[None]
+    if hit.any():
+        hashes = np.zeros(sim.N, dtype='uint32')
+        sim.serialize_particle_data(hash=hashes)
+        for i in np.flatnonzero(hit.any(axis=1))[::-1]:
+            x = int(np.argmin(np.where(hit[i], s[i], np.inf)))          #first body reached along the step
+            fates[int(hashes[i+1])] = (x, t0 + s[i, x]*(sim.t - t0))
+            sim.remove(index=int(i+1))
+        r1 = particle_view(sim)[1:, :3].copy()
+    last = (sim.t, r1, p1)
+
+
+def run_full(years):
+
+    """
+    Integrates the sample of ejecta with the full system. Returns the wall time per simulated year and the fates,
+    and the wall time per simulated year of the star and planets alone.
+    """
+    global fates
+
+    sim = draw_sim(dt=dt)
+    tic = time.perf_counter()
+    sim.integrate(years, exact_finish_time=0)
+    planets_wall = (time.perf_counter() - tic)/years
+
+    fates = {}
+    sim = draw_sim("mercurius", "direct", fate_recorder(fates), dt)
+    planet = sim.particles[sourceplanet]
+    pos, vel = ejecta_states(planet, n_sample, v_increment*km_to_AU/sec_to_yr, genseed)
+    for i in range(n_sample):
+        sim.add(m=0, x=planet.x+pos[i, 0], y=planet.y+pos[i, 1], z=planet.z+pos[i, 2],
+                vx=planet.vx+vel[i, 0], vy=planet.vy+vel[i, 1], vz=planet.vz+vel[i, 2], hash=i+1)
+    tic = time.perf_counter()
+    sim.integrate(years, exact_finish_time=0)
+    return (time.perf_counter() - tic)/years, fates, planets_wall
+
+
+def run_ephemeris(years, step):
+
+    """
+    Integrates the sample of ejecta alone against the ephemeris with WHFast and the given step size.
+    Returns the wall time per simulated year and the fates.
+    """
+    global fates, last
+
+    fates = {}
+    full = draw_sim(dt=dt)
+    planet = full.particles[sourceplanet]
+    star = full.particles[0]
+    pos, vel = ejecta_states(planet, n_sample, v_increment*km_to_AU/sec_to_yr, genseed)
+
+    sim = rebound.Simulation()
+    sim.units = ('yr', 'AU', 'Msun')
+    sim.G = G
+    sim.integrator = 'whfast'
+    sim.dt = step
+    sim.add(m = star.m, r = star.r, hash = 'a')
+    for i in range(n_sample):
+        sim.add(m=0, x=planet.x-star.x+pos[i, 0], y=planet.y-star.y+pos[i, 1], z=planet.z-star.z+pos[i, 2],
+                vx=planet.vx-star.vx+vel[i, 0], vy=planet.vy-star.vy+vel[i, 1], vz=planet.vz-star.vz+vel[i, 2],
+                hash=i+1)
+    sim.N_active = 1
+    sim.testparticle_type = 0
+    sim.additional_forces = ephemeris_forces
+    sim.force_is_velocity_dependent = 0
+    sim.post_timestep_modifications = ephemeris_collisions
+    last = (0., particle_view(sim)[1:, :3].copy(), np.vstack([np.zeros(3), planet_positions(0.)]))
+
+    tic = time.perf_counter()
+    sim.integrate(years, exact_finish_time=0)
+    return (time.perf_counter() - tic)/years, fates
+
+
+def write_results(results, ephem_wall):
+
+    """
+    Writes the validation report to a csv file.
+    """
+
+    folderpath = os.path.join(os.getcwd(), 'Benchmark_Results')
+    os.makedirs(folderpath, exist_ok=True)
+    path = os.path.join(folderpath, str(n_sample) + 'e_' + str(val_years) + 'y_' + str(v_increment)
+                        + 'vinc_ephemeris_validation.csv')
+    header = ['mode', 'dt', 'wall_per_year', 'planet_share', 'impacts', 'fate_mismatch', 'fate_tvd',
+              'dt_median']
+    with open(path, 'w') as f:
+        write = csv.writer(f)
+        write.writerow(['reference: full system, mercurius (collision direct); ephemeris sampled every '
+                        + str(ephem_steps) + ' steps, made in ' + str(ephem_wall) + ' s (0: reused)'])
+        write.writerow(header)
+        for r in results:
+            write.writerow([r[key] for key in header])
+    return path
+
+#####################################
+
+
+
+"""VALIDATION PARAMETERS"""
+
+sourceplanet = 'd'
+
+n_sample = 200                      #number of sampled ejecta
+val_years = 20                      #length of each integration (in years)
+v_increment = 0                     #in km/s
+genseed = 1
+
+dt = days_to_yr/10                  #same timestep as start_template.py
+ephem_steps = 1                     #store the planets every this many steps (sampling every step keeps the
+                                    #interpolation error at a few percent of a planet radius for planet b)
+ejecta_dts = [dt, dt/4, dt/16]     #step sizes to try for the ejecta-only runs (WHFast)
+tol_fates = 0.05                    #maximum total variation distance of per-body impact fractions
+
+#####################################################
+
+
+"""ACTUAL VALIDATION"""
+
+ephemeris, ephem_wall = make_ephemeris(val_years)
+print('ephemeris:', len(ephemeris), 'samples,', ephem_wall, 's to make (0: reused)')
+sim = draw_sim(dt=dt)
+planet_mass = np.array([p.m for p in sim.particles[1:]])
+body_radius = np.array([p.r for p in sim.particles])
+
+ref_wall, ref_fates, planets_wall = run_full(val_years)
+print('full system (mercurius):', ref_wall, 's/yr; star and planets alone:', planets_wall, 's/yr')
+results = [{'mode': 'full (mercurius)', 'dt': dt, 'wall_per_year': ref_wall,
+            'planet_share': planets_wall/ref_wall, 'impacts': len(ref_fates),
+            'fate_mismatch': 0., 'fate_tvd': 0., 'dt_median': 0.}]
+for step in ejecta_dts:
+    wall, test_fates = run_ephemeris(val_years, step)
+    mismatch, tvd, dt_median = compare_fates(ref_fates, test_fates, n_sample)
+    results.append({'mode': 'ephemeris (whfast)', 'dt': step, 'wall_per_year': wall, 'planet_share': 0.,
+                    'impacts': len(test_fates), 'fate_mismatch': mismatch, 'fate_tvd': tvd, 'dt_median': dt_median})
+    print('ephemeris (whfast, dt = ' + str(step) + '):', wall, 's/yr, fate mismatch', mismatch, ', tvd', tvd,
+          ', within tolerance' if tvd <= tol_fates else ', NOT within tolerance')
+
+path = write_results(results, ephem_wall)
+print('results written to ' + path)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+TRAPPIST-1 INTEGRATOR BENCHMARK
+
+Methodology:
+1. Integrate the TRAPPIST-1 system with a sample of ejecta using IAS15 as a high-accuracy reference.
+2. Integrate the same system and ejecta over a grid of integrators and settings (dt, hillfac, safe_mode).
+3. Compare each run against the reference, and recommend the cheapest setting within tolerance.
+
+Output Data:
+1. CSV - one row per setting: wall time per simulated year, planetary energy drift, and how far
+   the ejecta fates (which body each ejecta hits, if any) diverge from the reference.
+
+The system and ejecta are set up as in start_template.py, by trappist_system.py.
+"""
+
+import rebound
+import os
+import csv
+import time
+import itertools
+from trappist_system import days_to_yr, km_to_AU, sec_to_yr, draw_sim, ejecta_states, fate_recorder, compare_fates
+
+"""FUNCTION DEFINITIONS"""
+
+def setup_sim(setting, fates):
+
+    """
+    Draw TRAPPIST-1 system with the integrator and settings of one benchmark setting, recording ejecta fates in fates.
+    """
+
+    sim = draw_sim(setting['integrator'], setting['collision'], fate_recorder(fates), setting['dt'])
+    if setting['integrator'] == 'mercurius':
+        sim.ri_mercurius.safe_mode = setting['safe_mode']
+        sim.ri_mercurius.hillfac = setting['hillfac']
+    if setting['integrator'] == 'trace':
+        sim.ri_trace.r_crit_hill = setting['hillfac']
+    return sim
+
+
+def add_ejecta(sim, planetname, n, v_increment, genseed):
+
+    """
+    Adds the sampled ejecta, drawn the same way as generate_ejecta in start_template.py.
+    """
+
+    planet = sim.particles[planetname]
+    pos, vel = ejecta_states(planet, n, v_increment, genseed)
+    for i in range(n):
+        sim.add(m=0, x=planet.x+pos[i, 0], y=planet.y+pos[i, 1], z=planet.z+pos[i, 2],
+                vx=planet.vx+vel[i, 0], vy=planet.vy+vel[i, 1], vz=planet.vz+vel[i, 2], hash=i+1)
+
+
+def energy(sim):
+    """
+    Total energy of the simulation; massless ejecta do not contribute, so this is the planetary energy.
+    """
+
+    return sim.energy() if hasattr(sim, 'energy') else sim.calculate_energy()
+
+
+def run_setting(setting):
+
+    """
+    Integrates the benchmark system with one setting.
+    Returns the wall time per simulated year, the relative planetary energy drift, and the ejecta fates.
+    """
+
+    fates = {}
+    sim = setup_sim(setting, fates)
+    add_ejecta(sim, sourceplanet, n_sample, v_increment*km_to_AU/sec_to_yr, genseed)
+    E0 = energy(sim)
+
+    tic = time.perf_counter()
+    sim.integrate(bench_years, exact_finish_time=1)
+    toc = time.perf_counter()
+
+    drift = abs((energy(sim) - E0)/E0)
+    return (toc - tic)/bench_years, drift, fates
+
+
+def make_settings():
+
+    """
+    Makes the grid of settings to benchmark, skipping integrators the installed REBOUND does not have.
+    """
+
+    settings = []
+    for integrator in candidates:
+        if integrator not in rebound.simulation.INTEGRATORS:
+            print('skipping ' + integrator + ': not available in REBOUND ' + rebound.__version__)
+            continue
+        if integrator == 'mercurius':
+            grid = itertools.product(dts, hillfacs, safe_modes)
+        elif integrator == 'trace':
+            grid = itertools.product(dts, hillfacs, [None])
+        else:
+            grid = itertools.product(dts, [None], [None])
+        for dt, hillfac, safe_mode in grid:
+            settings.append({'integrator': integrator, 'collision': 'direct',
+                             'dt': dt, 'hillfac': hillfac, 'safe_mode': safe_mode})
+    return settings
+
+
+def recommend(results):
+
+    """
+    Picks the cheapest setting whose energy drift and fate divergence are within tolerance.
+    """
+
+    ok = [r for r in results if r['energy_drift'] <= tol_energy and r['fate_tvd'] <= tol_fates]
+    if len(ok) == 0:
+        return None
+    return min(ok, key=lambda r: r['wall_per_year'])
+
+
+def write_results(results):
+
+    """
+    Writes benchmark results to a csv file.
+    """
+
+    folderpath = os.path.join(os.getcwd(), 'Benchmark_Results')
+    os.makedirs(folderpath, exist_ok=True)
+    path = os.path.join(folderpath, str(n_sample) + 'e_' + str(bench_years) + 'y_' + str(v_increment) + 'vinc_benchmark.csv')
+    header = ['integrator', 'collision', 'dt', 'hillfac', 'safe_mode', 'wall_per_year', 'energy_drift',
+              'fate_mismatch', 'fate_tvd', 'dt_median']
+    with open(path, 'w') as f:
+        write = csv.writer(f)
+        write.writerow(['reference: ias15 (collision ' + ref_collision + ')'])
+        write.writerow(header)
+        for r in results:
+            write.writerow([r[key] for key in header])
+    return path
+
+#####################################
+
+
+
+"""BENCHMARK PARAMETERS"""
+
+sourceplanet = 'd'
+
+n_sample = 200                      #number of sampled ejecta
+bench_years = 5                     #length of each benchmark integration (in years)
+v_increment = 0                     #in km/s
+genseed = 1
+
+#settings grid
+candidates = ['mercurius', 'trace', 'whfast']       #integrators to try, if available
+dts = [days_to_yr/20, days_to_yr/10, days_to_yr/5, days_to_yr/2]
+hillfacs = [2, 3, 5]
+safe_modes = [0, 1]
+ref_collision = 'line'              #collision search for the IAS15 reference (catches crossings within a step)
+
+#tolerances for the recommendation
+tol_energy = 1e-6                   #maximum relative planetary energy drift
+tol_fates = 0.05                    #maximum total variation distance of per-body impact fractions
+
+#####################################################
+
+
+"""ACTUAL BENCHMARK"""
+
+reference = {'integrator': 'ias15', 'collision': ref_collision, 'dt': None, 'hillfac': None, 'safe_mode': None}
+ref_wall, ref_drift, ref_fates = run_setting(reference)
+print('reference (ias15):', ref_wall, 's/yr, energy drift', ref_drift)
+
+results = [dict(reference, wall_per_year=ref_wall, energy_drift=ref_drift, fate_mismatch=0., fate_tvd=0., dt_median=0.)]
+for setting in make_settings():
+    wall, drift, test_fates = run_setting(setting)
+    mismatch, tvd, dt_median = compare_fates(ref_fates, test_fates, n_sample)
+    results.append(dict(setting, wall_per_year=wall, energy_drift=drift, fate_mismatch=mismatch,
+                        fate_tvd=tvd, dt_median=dt_median))
+    print(setting['integrator'], setting['dt'], setting['hillfac'], setting['safe_mode'],
+          wall, 's/yr, drift', drift, ', fate mismatch', mismatch, ', tvd', tvd)
+
+path = write_results(results)
+best = recommend(results)
+print('results written to ' + path)
+if best is None:
+    print('no setting is within tolerance (energy ' + str(tol_energy) + ', fates ' + str(tol_fates) + ')')
+else:
+    print('cheapest setting within tolerance:', best['integrator'], 'dt =', best['dt'], 'hillfac =', best['hillfac'],
+          'safe_mode =', best['safe_mode'], '(' + str(ref_wall/best['wall_per_year']) + 'x faster than IAS15)')
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+EJECTA SIMULATION RECORDS
+
+The binary event log, the results files (<label>_results.npz, or the older csv files) and the merging of the
+results of a sharded run, as written and read by start_template.py. start_template.py imports it, so it is
+copied next to every filled-in simulation script.
+
+Datalists hold one list of rows per dataset:
+    *init ----------[hash, inc, vxPlanet, vyPlanet, vzPlanet, vxStar, vyStar, vzStar, weight, site, vinc,
+                     vincDensity, parent]
+    *'a'-'h' -------collisions with each body: [hash, vx, vy, vz, t, dx, dy, dz, dvx, dvy, dvz,
+                     xBody, yBody, zBody, vxBody, vyBody, vzBody] (d: ejecta relative to the body it hit,
+                     Body: body relative to the star)
+    *esc -----------[hash, a, e, inc, Omega, omega, f, t, v_inf]
+"""
+
+import ast
+import csv
+import json
+import os
+import sys
+import numpy as np
+from trappist_system import object_names
+from sampling import cube_weights
+
+"""FUNCTION DEFINITIONS"""
+
+###Event log functions
+
+#one record per collision (kind 0) or escape (kind 1)
+#collisions: data = [vx, vy, vz, dx, dy, dz, dvx, dvy, dvz, px, py, pz, pvx, pvy, pvz] (see make_colbuffer)
+#escapes:    data = [a, e, inc, Omega, omega, f, v_inf, 0, ...], body = 255
+#older logs, with 7 data columns, hold only [vx, vy, vz] for collisions
+event_dtype = np.dtype([('kind', 'u1'), ('body', 'u1'), ('hash', '<u4'), ('t', '<f8'), ('data', '<f8', (15,))])
+
+
+def open_eventlog(path, size=None):
+
+    """
+    Opens the append-only binary event log.
+    A new log starts with a one-line header describing the record layout. When resuming,
+    the log is cut back to the size saved with the checkpoint, dropping events from after it.
+    """
+
+    if size is None:
+        f = open(path, 'wb')
+        f.write((repr(event_dtype.descr) + '\n').encode())
+        f.flush()
+    else:
+        f = open(path, 'r+b')
+        if f.readline().decode() != repr(event_dtype.descr) + '\n':
+            sys.exit("Error: " + path + " has an older record layout; finish this run with the script that started it.")
+        f.truncate(size)
+        f.seek(size)
+    return f
+
+
+def collision_events(rows):
+    """
+    Event records of collision buffer rows [body index, hash, vx, vy, vz, t, dx, dy, dz, dvx, dvy, dvz,
+    px, py, pz, pvx, pvy, pvz] (see make_colbuffer in start_template.py).
+    """
+
+    events = np.zeros(len(rows), dtype=event_dtype)
+    events['body'] = rows[:, 0]
+    events['hash'] = rows[:, 1]
+    events['t'] = rows[:, 5]
+    events['data'][:, :3] = rows[:, 2:5]
+    events['data'][:, 3:] = rows[:, 6:]
+    return events
+
+
+def escape_events(rows):
+    """
+    Event records of escape rows [hash, a, e, inc, Omega, omega, f, t, v_inf].
+    """
+
+    events = np.zeros(len(rows), dtype=event_dtype)
+    events['kind'] = 1
+    events['body'] = 255
+    events['hash'] = rows[:, 0]
+    events['t'] = rows[:, 7]
+    events['data'][:, :6] = rows[:, 1:7]
+    events['data'][:, 6] = rows[:, 8]
+    return events
+
+
+def read_eventlog(path):
+    """
+    Reads an event log into a structured array.
+    Works on logs that are still being written: a partly written last record is ignored.
+    """
+
+    with open(path, 'rb') as f:
+        dtype = np.dtype(ast.literal_eval(f.readline().decode()))
+        raw = f.read()
+    n = len(raw)//dtype.itemsize
+    return np.frombuffer(raw[:n*dtype.itemsize], dtype=dtype)
+
+
+def unpack_events(events, vals):
+    """
+    Sorts logged events into the per-body collision datalists and the escaped datalist of vals.
+    """
+
+    for ev in events[events['kind'] == 0]:
+        vals[object_names[ev['body']]].append([int(ev['hash'])] + ev['data'][:3].tolist() + [float(ev['t'])]
+                                              + ev['data'][3:].tolist())
+    for ev in events[events['kind'] == 1]:
+        vals['esc'].append([int(ev['hash'])] + ev['data'][:6].tolist() + [float(ev['t']), float(ev['data'][6])])
+
+
+###Results functions
+
+def write_datafiles(folder, vals, overall):
+
+    """
+    Writes the datalists and overview of one population to csv files in its folder.
+    """
+
+    label = os.path.basename(folder)
+    os.makedirs(folder, exist_ok=True)
+
+    #overview file
+    overallpath = os.path.join(folder, label + '_overview.csv')
+    with open(overallpath, 'w') as f:
+        w = csv.writer(f)
+        w.writerow([label])
+        for key, val in overall.items():
+            w.writerow([key,val])
+
+    #initial conditions file
+    initpath = os.path.join(folder, label + '_particle_inits.csv')
+    init_header = ['hash','inc', 'vxPlanet', 'vyPlanet', 'vzPlanet', 'vxStar', 'vyStar', 'vzStar', 'weight', 'site',
+                   'vinc', 'vincDensity', 'parent']
+    with open(initpath, 'w') as f:
+        write = csv.writer(f)
+        write.writerow([label])
+        write.writerow(init_header)
+        write.writerows(vals['init'])
+
+    #planetary collisions files
+    for x in range (len(object_names)):
+        objcol_path = os.path.join(folder, label + '_' + object_names[x]+'.csv')
+        obj_header = ['hash','vx', 'vy', 'vz', 't', 'dx', 'dy', 'dz', 'dvx', 'dvy', 'dvz',
+                      'xBody', 'yBody', 'zBody', 'vxBody', 'vyBody', 'vzBody']
+        with open(objcol_path, 'w') as f:
+            write = csv.writer(f)
+            write.writerow([label])
+            write.writerow(obj_header)
+            write.writerows(vals[object_names[x]])
+
+    #escaped particles file
+    esc_path = os.path.join(folder, label + '_escaped.csv')
+    esc_header = ['hash', 'semi-maj axis', 'eccentricity', 'inclination', 'long. asc. node', 'arg. pericenter', 'true anomaly',
+                  't', 'v_inf']
+    with open(esc_path, 'w') as f:
+        write = csv.writer(f)
+        write.writerow([label])
+        write.writerow(esc_header)
+        write.writerows(vals['esc'])
+
+
+def write_results(folder, vals, overall):
+
+    """
+    Writes all data of one population to a single columnar file in its folder, <label>_results.npz,
+    with the overview embedded as JSON in 'meta'. Collisions with all bodies share one table,
+    sorted by time, whose col_body column indexes body_names. Impact geometry: col_rel_pos and col_rel_vel
+    are the ejecta's position and velocity relative to the body hit, col_body_pos and col_body_vel the
+    body's position and velocity relative to the star (NaN for collisions recorded without them).
+    """
+
+    label = os.path.basename(folder)
+    os.makedirs(folder, exist_ok=True)
+
+    init = np.array(vals['init'], dtype=float).reshape(-1, 13)
+    cols = [np.array(vals[o], dtype=float).reshape(-1, 17) for o in object_names]
+    body = np.concatenate([np.full(len(cols[x]), x, dtype='uint8') for x in range(len(object_names))])
+    cols = np.concatenate(cols)
+    order = np.argsort(cols[:, 4], kind='stable')
+    esc = np.array(vals['esc'], dtype=float).reshape(-1, 9)
+
+    np.savez_compressed(os.path.join(folder, label + '_results.npz'),
+        meta = np.array(json.dumps(overall)),
+        body_names = np.array(object_names),
+        init_hash = init[:, 0].astype('uint32'),                 #initial conditions
+        init_inc = init[:, 1],
+        init_vplanet = init[:, 2:5],
+        init_vstar = init[:, 5:8],
+        init_weight = init[:, 8],                                #sampling weights
+        init_site = init[:, 9].astype('int8'),                   #ejection site IDs
+        init_vinc = init[:, 10],                                 #velocity increments (km/s)
+        init_vinc_density = init[:, 11],                         #their sampling density (per km/s; NaN: fixed)
+        init_parent = init[:, 12].astype('uint32'),              #hash a clone was split from (0: ejected)
+        col_body = body[order],                                  #collisions
+        col_hash = cols[order, 0].astype('uint32'),
+        col_v = cols[order, 1:4],
+        col_t = cols[order, 4],
+        col_rel_pos = cols[order, 5:8],
+        col_rel_vel = cols[order, 8:11],
+        col_body_pos = cols[order, 11:14],
+        col_body_vel = cols[order, 14:17],
+        esc_hash = esc[:, 0].astype('uint32'),                   #escaped particles
+        esc_orbit = esc[:, 1:7],                                 #a, e, inc, Omega, omega, f
+        esc_t = esc[:, 7],
+        esc_vinf = esc[:, 8])
+
+
+def read_datafile(path):
+    """
+    Reads the rows of an output csv file, without its label row.
+    """
+
+    with open(path, 'r') as f:
+        return list(csv.reader(f))[1:]
+
+
+def read_results(folder):
+
+    """
+    Reads the datalists and overview of one population back from the results file in its folder,
+    or from its csv files if it has none. Collisions recorded without impact geometry get NaN for it,
+    ejecta recorded without sampling weights get the 'cube' sampler's weights, which they were drawn with,
+    ejecta without site IDs site -1 (whole sphere),
+    without velocity increments NaN for them, and without parents parent 0 (not a clone).
+    """
+
+    path = os.path.join(folder, os.path.basename(folder))
+    if not os.path.exists(path + '_results.npz'):
+        vals = {'init': [row + ['nan', '-1', 'nan', 'nan', '0'][len(row) - 8:] for row in read_datafile(path + '_particle_inits.csv')[1:]],
+                'esc': read_datafile(path + '_escaped.csv')[1:]}
+        for row in vals['init']:
+            if row[8] == 'nan':                       #recorded before sampling weights
+                row[8] = str(cube_weights(np.array([row[2:5]], dtype=float))[0])
+        for o in object_names:
+            vals[o] = [row + ['nan']*(17 - len(row)) for row in read_datafile(path + '_' + o + '.csv')[1:]]
+        return vals, dict(read_datafile(path + '_overview.csv'))
+
+    def rows(hashes, *columns):
+        return [[name] + row for name, row in zip(hashes.tolist(), np.column_stack(columns).tolist())]
+
+    with np.load(path + '_results.npz') as data:
+        overall = json.loads(str(data['meta']))
+        vals = {
+            'init': rows(data['init_hash'], data['init_inc'], data['init_vplanet'], data['init_vstar'],
+                         data['init_weight'] if 'init_weight' in data.files else cube_weights(data['init_vplanet']),
+                         data['init_site'] if 'init_site' in data.files else np.full(len(data['init_hash']), -1),
+                         *[data[key] if key in data.files else np.full(len(data['init_hash']), np.nan)
+                           for key in ['init_vinc', 'init_vinc_density']],
+                         data['init_parent'] if 'init_parent' in data.files else np.zeros(len(data['init_hash']))),
+            'esc': rows(data['esc_hash'], data['esc_orbit'], data['esc_t'], data['esc_vinf']),
+        }
+        geometry = [data[key] if key in data.files else np.full((len(data['col_t']), 3), np.nan)
+                    for key in ['col_rel_pos', 'col_rel_vel', 'col_body_pos', 'col_body_vel']]
+        for x in range(len(object_names)):
+            k = data['col_body'] == x
+            vals[object_names[x]] = rows(data['col_hash'][k], data['col_v'][k], data['col_t'][k], *[g[k] for g in geometry])
+    return vals, overall
+
+
+def merge_results(shards):
+
+    """
+    Merges the datalists and overviews [(vals, overall), ...] of one population's shards.
+    Inits are sorted by hash, collisions and escapes by time. Counts are summed; the slowest shard
+    sets the time covered, and shards whose ejecta ran out early cover the whole run.
+    Returns the merged datalists and overview.
+    """
+
+    summed = ['Number of Ejecta', 'Escaped Particles'] + object_names
+    overall = {}
+    vals = {key: [] for key in ['init', 'esc'] + object_names}
+    for svals, shard_overall in shards:
+        for key, val in shard_overall.items():
+            if key not in overall:
+                overall[key] = val
+            elif key in summed:
+                overall[key] = int(overall[key]) + int(val)
+        for key in vals:
+            vals[key] += svals[key]
+
+    ends = [shard_overall for svals, shard_overall in shards]
+    full = [end for end in ends if end['End condition'] in ['completed', 'wall-clock budget']]
+    if full:
+        end = min(full, key=lambda end: float(end['Total Time (yrs)']))
+    else:
+        end = max(ends, key=lambda end: float(end['Total Time (yrs)']))
+    for key in ['Timesteps', 'Total Time (yrs)', 'End condition', 'Segments']:
+        overall[key] = end[key]
+    overall['Shards'] = len(shards)
+    vals['init'].sort(key=lambda row: int(row[0]))
+    vals['esc'].sort(key=lambda row: float(row[7]))
+    for o in object_names:
+        vals[o].sort(key=lambda row: float(row[4]))
+    return vals, overall
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+EJECTA SAMPLING
+
+Ejection directions and speeds drawn by generate_ejecta in start_template.py, with the sampling weights
+recorded for each ejecta. start_template.py imports it, so it is copied next to every filled-in simulation script.
+"""
+
+import math
+import sys
+import numpy as np
+
+"""FUNCTION DEFINITIONS"""
+
+def sample_directions(n, rng, vorb, sampler, bands=None, band_alloc=None):
+
+    """
+    Draws n ejection directions with the given sampler, and the sampling weight of each:
+    the isotropic density over the sampler's density, so sums of weights over ejecta estimate what isotropic
+    ejection would give. The weights average to 1.
+        'cube' ----------random points in a cube, normalized (not uniform on the sphere: denser towards the corners)
+        'uniform' -------uniform on the sphere
+        'fibonacci' -----spherical Fibonacci lattice, randomly rotated
+        'sobol' ---------Sobol points (randomly shifted) mapped to the sphere through an equal-area projection
+        'stratified' ----bands equal-area bands in the angle from the orbital velocity vorb, holding numbers
+                         of ejecta in proportion to band_alloc (equal if None), spread uniformly within each band
+    The lattice and stratified samplers are randomized, so each simulation gives an independent estimate, and
+    the scatter between simulations gives their error bars.
+    """
+
+    if sampler == 'cube':
+        dir_v = rng.random((n, 3))*2-1
+        n_v = dir_v/np.linalg.norm(dir_v, axis=1)[:, None]
+        return n_v, cube_weights(n_v)
+    if sampler == 'uniform':
+        dir_v = rng.normal(size=(n, 3))
+        return dir_v/np.linalg.norm(dir_v, axis=1)[:, None], np.ones(n)
+    if sampler == 'fibonacci':
+        i = np.arange(n)
+        n_v = sphere_points(1 - (2*i + 1)/n, i*math.pi*(3 - math.sqrt(5)))          #golden angle steps
+        return n_v @ random_rotation(rng).T, np.ones(n)
+    if sampler == 'sobol':
+        u = sobol_points(n, rng)
+        return sphere_points(2*u[:, 0] - 1, 2*math.pi*u[:, 1]), np.ones(n)
+    if sampler == 'stratified':
+        alloc = np.ones(bands) if band_alloc is None else np.array(band_alloc, dtype=float)
+        if len(alloc) != bands:
+            sys.exit("Error: band_alloc needs one entry per band (sampler_bands).")
+        quota = alloc/alloc.sum()*n
+        counts = np.floor(quota).astype(int)
+        counts[np.argsort(counts - quota)[:n - counts.sum()]] += 1                  #largest remainders
+        band = np.repeat(np.arange(bands), counts)
+        cos_t = 1 - 2*(band + rng.random(n))/bands                                  #band 0 along the orbital velocity
+        local = sphere_points(cos_t, 2*math.pi*rng.random(n))
+        return local @ axis_frame(vorb/np.linalg.norm(vorb)), (n/bands)/counts[band]
+    sys.exit("Error: unknown direction_sampler " + repr(sampler) + ".")
+
+
+def cube_weights(v):
+
+    """
+    Sampling weights of the 'cube' sampler, which the original runs used, for the directions of the vectors v:
+    the isotropic density over the density of normalized random points in a cube.
+    """
+
+    n_v = v/np.linalg.norm(v, axis=1)[:, None]
+    return 6*np.abs(n_v).max(axis=1)**3/math.pi
+
+
+def sample_speeds(n, rng, v_esc, spectrum):
+
+    """
+    Draws n velocity increments (in km/s) from the velocity spectrum, and the spectrum's density (per km/s) at each,
+    which the analysis divides by to reweight the ejecta to other speed distributions:
+        ('uniform', vmin, vmax) ------------uniform between vmin and vmax
+        ('powerlaw', vmin, vmax, index) ----total ejection speed v_esc + increment distributed as speed**-index
+        ('table', increments, densities) ---density interpolated linearly between tabulated increments
+    v_esc is the source planet's escape velocity (in km/s).
+    """
+
+    kind, vmin, vmax = spectrum[:3]
+    u = rng.random(n)
+    if kind == 'uniform':
+        return vmin + u*(vmax - vmin), np.full(n, 1/(vmax - vmin))
+    if kind == 'powerlaw':
+        k = spectrum[3]
+        s0, s1 = v_esc + vmin, v_esc + vmax
+        if k == 1:
+            s = s0*(s1/s0)**u
+            return s - v_esc, 1/(s*math.log(s1/s0))
+        s = (s0**(1 - k) + u*(s1**(1 - k) - s0**(1 - k)))**(1/(1 - k))           #inverse of the cumulative distribution
+        return s - v_esc, (1 - k)/(s1**(1 - k) - s0**(1 - k))*s**-k
+    if kind == 'table':
+        grid, dens = np.array(vmin, dtype=float), np.array(vmax, dtype=float)
+        fine = np.linspace(grid[0], grid[-1], 100001)
+        cdf = np.concatenate(([0.], np.cumsum(np.diff(fine)*np.interp(fine[:-1] + np.diff(fine)/2, grid, dens))))
+        v = np.interp(u*cdf[-1], cdf, fine)
+        return v, np.interp(v, grid, dens)/cdf[-1]
+    sys.exit("Error: unknown velocity_spectrum " + repr(kind) + ".")
+
+
+def sample_cone(n, rng, axis, halfangle, sampler):
+
+    """
+    Draws n ejection directions spread evenly over the cone around the unit vector axis with the given half-angle
+    (in radians), with the sampler 'uniform', 'fibonacci' (randomly turned about the axis) or 'sobol'.
+    The sampling weights are all 1: the estimates are for ejection from the cone.
+    """
+
+    if sampler == 'uniform':
+        u = rng.random((n, 2))
+    elif sampler == 'fibonacci':
+        i = np.arange(n)
+        u = np.column_stack(((i + 0.5)/n, (i*(3 - math.sqrt(5))/2 + rng.random()) % 1))
+    else:                                                                           #'sobol'
+        u = sobol_points(n, rng)
+    local = sphere_points(1 - u[:, 0]*(1 - math.cos(halfangle)), 2*math.pi*u[:, 1])     #equal-area map onto the cap
+    return local @ axis_frame(axis), np.ones(n)
+
+
+def axis_frame(ez):
+    """
+    Rows of an orthonormal frame whose third axis is the unit vector ez.
+    """
+
+    ex = np.cross(np.eye(3)[np.argmin(np.abs(ez))], ez)
+    ex = ex/np.linalg.norm(ex)
+    return np.array([ex, np.cross(ez, ex), ez])
+
+
+def sphere_points(z, phi):
+    """
+    Unit vectors from their z component and azimuth.
+    """
+
+    s = np.sqrt(np.clip(1 - z*z, 0., None))
+    return np.column_stack((s*np.cos(phi), s*np.sin(phi), z))
+
+
+def random_rotation(rng):
+    """
+    Uniformly random rotation matrix, from a random unit quaternion.
+    """
+
+    q = rng.normal(size=4)
+    a, b, c, d = q/np.linalg.norm(q)
+    return np.array([[a*a + b*b - c*c - d*d, 2*(b*c - a*d), 2*(b*d + a*c)],
+                     [2*(b*c + a*d), a*a - b*b + c*c - d*d, 2*(c*d - a*b)],
+                     [2*(b*d - a*c), 2*(c*d + a*b), a*a - b*b - c*c + d*d]])
+
+
+def sobol_points(n, rng):
+    """
+    First n points of the 2D Sobol sequence, with a random digital shift (XOR with random bits), in [0, 1)^2.
+    """
+
+    m = [1]
+    for k in range(31):
+        m.append((m[-1] << 1) ^ m[-1])                  #direction numbers of the second dimension (polynomial x + 1)
+    v = np.array([[1 << (31 - k), m[k] << (31 - k)] for k in range(32)], dtype='uint64')
+    i = np.arange(n, dtype='uint64')
+    x = np.zeros((n, 2), dtype='uint64')
+    for k in range(32):
+        x ^= ((i >> np.uint64(k)) & np.uint64(1))[:, None]*v[k]
+    x ^= rng.integers(0, 2**32, size=2, dtype='uint64')
+    return x/2.**32
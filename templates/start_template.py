@@ -21,21 +21,22 @@ import numpy as np
 import matplotlib 
 import rebound
 import os
-import csv
 import time
 import random
 import sys
+import pickle
+import signal
+import threading
+import ast
+import subprocess
+import json
+import resource
 from rebound import hash as h
-
-#define constants
-Rsun_to_AU = 0.00465047
-Rearth_to_AU = 4.2635e-5
-days_to_yr = 1/365.25
-Mearth_to_Msun = 3.00274e-6 
-deg_to_rad = math.pi/180
-km_to_AU = 6.68459e-9
-sec_to_yr = 1/31557600
-G = 39.441677           #in units of AU, M_Sun, yr
+import trappist_system                   #star and planets, shared with the benchmark scripts; keep it next to this file
+from trappist_system import days_to_yr, deg_to_rad, km_to_AU, sec_to_yr, G
+from sampling import sample_directions, sample_speeds, sample_cone     #ejection directions and speeds
+import records                           #event log, results files and shard merging
+from records import open_eventlog, collision_events, escape_events, read_eventlog, unpack_events, read_datafile, merge_results
 
 """FUNCTION DEFINITIONS"""
 
@@ -44,49 +45,26 @@ G = 39.441677           #in units of AU, M_Sun, yr
 def draw_sim():
     
     """
-    Draw TRAPPIST-1 system. 
+    Draw TRAPPIST-1 system (set up in trappist_system.py), with this template's collision handling
+    and MERCURIUS settings. 
     """
     
-    sim = rebound.Simulation()
-    sim.units = ('yr', 'AU', 'Msun')
-    sim.G = G
-    sim.integrator = "mercurius"
-    sim.collision = "direct"
-    sim.collision_resolve = c             #custom collision resolve function
+    sim = trappist_system.draw_sim("mercurius", "direct", c_profiled if profile_callback else c, dt)
     sim.ri_mercurius.safe_mode = 1        #synchronize after timesteps (solves the major issue!)
     sim.ri_mercurius.hillfac = 3          #default hill radii to switch at
-    sim.dt = dt                           #integration timestep 
-    
-    #add TRAPPIST-1 star and planets
-    sim.add(m = 0.0898, r = 0.1192*Rsun_to_AU, hash = 'a')
-    sim.add(m = 1.374*Mearth_to_Msun, a=1.154e-2, e=0, inc=(90-89.728)*deg_to_rad, 
-            Omega=1, omega=1, M=320.2328615005874, r = 1.116*Rearth_to_AU, hash='b')
-    sim.add(m = 1.308*Mearth_to_Msun, a=1.580e-2, e=0, inc=(90-89.778)*deg_to_rad,
-            Omega=1, omega=1, M=302.03085481266083, r = 1.097*Rearth_to_AU, hash='c')
-    sim.add(m = 0.388*Mearth_to_Msun, a=2.227e-2, e=0, inc=(90-89.896)*deg_to_rad,
-            Omega=1, omega=1, M=-421.17961121323583, r = 0.788*Rearth_to_AU, hash='d')
-    sim.add(m = 0.692*Mearth_to_Msun, a=2.925e-2, e=0, inc=(90-89.793)*deg_to_rad,
-            Omega=1, omega=1, M=-270.15332650367066, r = 0.920*Rearth_to_AU, hash='e')
-    sim.add(m = 1.039*Mearth_to_Msun, a=3.849e-2, e=0, inc=(90-89.740)*deg_to_rad,
-            Omega=1, omega=1, M=-187.20059131394225, r = 1.045*Rearth_to_AU, hash='f')
-    sim.add(m = 1.321*Mearth_to_Msun, a=4.683e-2, e=0, inc=(90-89.742)*deg_to_rad,
-            Omega=1, omega=1, M=-136.97239841027107, r = 1.129*Rearth_to_AU, hash='g')
-    sim.add(m = 0.326*Mearth_to_Msun, a=6.189e-2, e=0, inc=(90-89.805)*deg_to_rad,
-            Omega=1, omega=1, M=-89.87573477315452, r = 0.755*Rearth_to_AU, hash='h')
-    
-    sim.N_active = len(object_names)         #only planets and star influence each other
-    sim.testparticle_type = 0                #test particles do not influence other particles
-    sim.move_to_com()                        #move to center of mass frame 
     return sim
 
 
-def generate_ejecta(sim, planetname, n, v_increment, genseed):
+def generate_ejecta(sim, planetname, n, v_increment, genseed, pop=0, shard=0, nshards=1):
     
     """
-    Generates a random spherical distribution of massless ejecta around the source planet.
+    Generates a spherical distribution of massless ejecta around the source planet, or, with ejection_site set,
+    a distribution within one cone. All directions are drawn at once (see sample_directions and sample_cone 
+    in sampling.py), and the ejecta are added to the simulation in bulk. With velocity_spectrum set, each 
+    ejecta's velocity increment is drawn from it (see sample_speeds) instead of v_increment.
     
     Calling sequence:
-        generate_ejecta(sim, planetname, n, v_increment, genseed)
+        generate_ejecta(sim, planetname, n, v_increment, genseed, pop=0, shard=0, nshards=1)
     
     Arguments:
         *sim ------------the simulation within which to generate ejecta
@@ -94,10 +72,13 @@ def generate_ejecta(sim, planetname, n, v_increment, genseed):
         *n --------------the number of particles to generate
         *v_increment ----the velocity increment to give each particle, in addition to v_esc of the source planet
         *genseed --------the random generation seed
+        *pop ------------the population number, which tags the hashnames (pop*pop_stride + ejecta number)
+        *shard ----------with nshards > 1, only every nshards-th ejecta starting from this one is added;
+        *nshards --------all n are still drawn, so every shard of a run sees the same initial conditions
         
     """
     
-    random.seed(genseed)
+    rng = np.random.default_rng(genseed)
     
     planet = sim.particles[planetname]              #get planet particle
     
@@ -105,84 +86,430 @@ def generate_ejecta(sim, planetname, n, v_increment, genseed):
     r = planet.r                                    #radius
     v_esc = math.sqrt(2*G*M/r)                      #escape velocity
     
-    px = planet.x                                   #planetary position and velocity                
-    py = planet.y
-    pz = planet.z
-    pvx = planet.vx
-    pvy = planet.vy
-    pvz = planet.vz
+    ppos = np.array([planet.x, planet.y, planet.z])         #planetary position and velocity
+    pvel = np.array([planet.vx, planet.vy, planet.vz])
+    star = sim.particles[0]
+    rorb = ppos - np.array([star.x, star.y, star.z])        #orbital position and velocity, wrt the star
+    vorb = pvel - np.array([star.vx, star.vy, star.vz])
     
-    #creating each ejecta
-    for i in range(n):
-        
-        name = i+1                                                                #hashname by number
-        
-        dir_v = [random.random()*2-1, random.random()*2-1, random.random()*2-1]   #random direction
-        n_v = dir_v/np.linalg.norm(dir_v)                                         #unit vector in random direction
-        vi = n_v*(v_esc + v_increment)                                            #initial velocity vector
-        
-        vx = vi[0]+pvx                         #add to planetary velocity for total initial velocity wrt the star                 
-        vy = vi[1]+pvy
-        vz = vi[2]+pvz
-        
-        x = px+n_v[0]*(r + 1*km_to_AU)        #place particle 1km above the surface radially outward
-        y = py+n_v[1]*(r + 1*km_to_AU)        #particle position = planetary position + directional unit vector * (radius + 1 km)
-        z = pz+n_v[2]*(r + 1*km_to_AU)
-        
-        #add to simulation
-        sim.add(m=0, x=x, y=y, z=z, vx=vx, vy=vy, vz=vz, hash=name)
+    #creating all ejecta at once
+    names = np.arange(1, n+1, dtype='uint32') + pop*pop_stride               #hashnames by population and number
+    if n >= pop_stride or np.isin(names, list(body_index)).any():
+        sys.exit("Error: ejecta hashes overlap with another population or a planet; change pop_stride.")
+    
+    if ejection_site is None:
+        n_v, weight = sample_directions(n, rng, vorb, direction_sampler, sampler_bands, band_alloc)   #unit vectors, weights
+    else:
+        n_v, weight = sample_cone(n, rng, *site_cone(rorb, vorb), direction_sampler)
+    kms = km_to_AU/sec_to_yr                                                  #1 km/s in AU/yr
+    if velocity_spectrum is None:
+        vinc, vinc_density = np.full(n, v_increment/kms), np.full(n, np.nan)
+    else:
+        vinc, vinc_density = sample_speeds(n, rng, v_esc/kms, velocity_spectrum)   #increments (km/s) and density
+    names = names[shard::nshards]                                             #keep this shard's ejecta
+    n_v = n_v[shard::nshards]
+    weight = weight[shard::nshards]
+    vinc = vinc[shard::nshards]
+    vinc_density = vinc_density[shard::nshards]
+    vi = n_v*(v_esc + vinc*kms)[:, None]                                      #initial velocity vectors
+    
+    vel = vi + pvel                       #add to planetary velocity for total initial velocity wrt the star
+    pos = ppos + n_v*(r + 1*km_to_AU)     #place particles 1km above the surface radially outward
+    
+    #add to simulation: blank massless particles first, then fill in all states in one call
+    N0 = sim.N
+    blank = rebound.Particle(m=0.)
+    for i in range(len(names)):
+        sim.add(blank)
+    hashes = np.zeros(sim.N, dtype='uint32')
+    xyz = np.zeros((sim.N, 3))
+    vxvyvz = np.zeros((sim.N, 3))
+    sim.serialize_particle_data(hash=hashes, xyz=xyz, vxvyvz=vxvyvz)
+    hashes[N0:] = names
+    xyz[N0:] = pos
+    vxvyvz[N0:] = vel
+    sim.set_serialized_particle_data(hash=hashes, xyz=xyz, vxvyvz=vxvyvz)
+    
+    #inclinations wrt the jacobi center of mass (massive bodies only, since ejecta are massless)
+    m = np.zeros(sim.N)
+    sim.serialize_particle_data(m=m)
+    mtot = m[:N0].sum()
+    com_pos = (m[:N0, None]*xyz[:N0]).sum(axis=0)/mtot
+    com_vel = (m[:N0, None]*vxvyvz[:N0]).sum(axis=0)/mtot
+    hvec = np.cross(pos - com_pos, vel - com_vel)                             #specific angular momentum
+    inc = np.arccos(hvec[:, 2]/np.linalg.norm(hvec, axis=1))
+    
+    #add initial data to list, for output
+    #inclination, velocity wrt planet, velocity wrt star, sampling weight, ejection site, 
+    #velocity increment (km/s) and its sampling density, parent (0: ejected, not cloned; see split_ejecta)
+    init_data = np.column_stack((inc, vi, vel, weight)).tolist()
+    speed_data = np.column_stack((vinc, vinc_density)).tolist()
+    site = site_id()
+    for name, row, speed in zip(names.tolist(), init_data, speed_data):
+        vals['init'].append([name] + row + [site] + speed + [0])
         
-        #add initial data to list, for output
-        #inclination, velocity wrt planet, velocity wrt star
-        inc = sim.particles[h(name)].inc
-        init_data = [name, inc, vi[0], vi[1], vi[2], vx, vy, vz]
-        vals['init'].append(init_data)
 
-        
-        
+def site_cone(rorb, vorb):
+    
+    """
+    Axis (unit vector) and half-angle (in radians) of the cone set by ejection_site, from the source planet's
+    orbital position and velocity. Cone axes are given in the planet's frame, as 
+    [along the orbital velocity, away from the star, along the orbit normal].
+    """
+    
+    if isinstance(ejection_site, str):
+        axis, halfangle = site_axes[site_names.index(ejection_site)], site_halfangle
+    else:
+        axis, halfangle = ejection_site
+    ev = vorb/np.linalg.norm(vorb)
+    en = np.cross(rorb, vorb)
+    en = en/np.linalg.norm(en)
+    a = np.dot(axis, [ev, np.cross(ev, en), en])
+    return a/np.linalg.norm(a), halfangle*deg_to_rad
+
+
+def site_id():
+    """
+    Site ID recorded with each ejecta: the index of a named site in site_names, len(site_names) for a cone given 
+    by its axis, and -1 for ejecta from the whole sphere.
+    """
+    
+    if ejection_site is None:
+        return -1
+    if isinstance(ejection_site, str):
+        return site_names.index(ejection_site)
+    return len(site_names)
+
+
 def c(sim, c):
     """
     Custom collision resolve function.
     Removes the massless ejecta and stores data for output. 
+    Bodies are identified through the precomputed body_index table, and the impact
+    is written into the next free row of the preallocated collision buffer, which is
+    flushed to the event log when full (and by integrate_chunk after every integration).
+    Besides the ejecta's velocity, the impact geometry is recorded: the ejecta's position and
+    velocity relative to the body it hit, and that body's position and velocity relative to the star.
     """
+    global ncols
     
     i, j = c.p1, c.p2
-    p1val = sim.contents.particles[i].hash.value                          
-    p2val = sim.contents.particles[j].hash.value
- 
-    for x in range(len(object_names)):                 #compare to each planet/star
-        if h(object_names[x]).value == p1val:          #if first particle is a planet or the star 
-            part = sim.contents.particles[h(p2val)]    #we want the second particle 
-            coldata = [p2val, part.vx, part.vy, part.vz, sim.contents.t]   
-            vals[object_names[x]].append(coldata)
-            return (2)                                 #remove second particle                          
+    ps = sim.contents.particles
+    
+    x = body_index.get(ps[i].hash.value)             #if first particle is a planet or the star
+    if x is not None:
+        part = ps[j]                                 #we want the second particle
+        body = ps[i]
+        remove = 2                                   #remove second particle
+    else:
+        x = body_index.get(ps[j].hash.value)         #if second particle is a planet or the star
+        if x is None:
+            return 0
+        part = ps[i]                                 #we want the first particle
+        body = ps[j]
+        remove = 1                                   #remove first particle
+    star = ps[0]
+    
+    row = colbuf[ncols]                              #see make_colbuffer
+    row[0] = x
+    row[1] = part.hash.value
+    row[2] = part.vx
+    row[3] = part.vy
+    row[4] = part.vz
+    row[5] = sim.contents.t
+    row[6] = part.x - body.x                         #ejecta relative to the body it hit
+    row[7] = part.y - body.y
+    row[8] = part.z - body.z
+    row[9] = part.vx - body.vx
+    row[10] = part.vy - body.vy
+    row[11] = part.vz - body.vz
+    row[12] = body.x - star.x                        #body relative to the star
+    row[13] = body.y - star.y
+    row[14] = body.z - star.z
+    row[15] = body.vx - star.vx
+    row[16] = body.vy - star.vy
+    row[17] = body.vz - star.vz
+    ncols += 1
+    if ncols == len(colbuf):
+        flush_events()
+    return remove
+
+
+def c_profiled(sim, col):
+    """
+    Collision resolve function used with profile_callback on: calls c, and counts the calls
+    and the time spent in them for the telemetry file.
+    """
+    
+    tic_c = time.perf_counter()
+    remove = c(sim, col)
+    chunkstats['callbacks'] += 1
+    chunkstats['callback_time'] += time.perf_counter() - tic_c
+    return remove
+
+def acos2(num, denom, disambiguator):
+    
+    """
+    Vectorized arccos(num/denom), negative where the disambiguator is negative.
+    Follows REBOUND's acos2: values outside [-1, 1] (or undefined) map to pi or 0.
+    """
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = num/denom
+    inside = (cosine > -1.) & (cosine < 1.)
+    val = np.where(cosine <= -1., math.pi, 0.)
+    val[inside] = np.arccos(cosine[inside])
+    val[inside & (disambiguator < 0.)] *= -1
+    return val
+
+
+def orbital_elements(mu, dxyz, dvxyz):
+    
+    """
+    Calculates orbital elements for many particles at once, following REBOUND's particle-to-orbit conventions.
+    
+    Calling sequence:
+        a, e, inc, Omega, omega, f = orbital_elements(mu, dxyz, dvxyz)
+    
+    Arguments:
+        *mu -------------G*(M_primary + m_particle), scalar or one value per particle
+        *dxyz -----------(n, 3) array of positions relative to the primary
+        *dvxyz ----------(n, 3) array of velocities relative to the primary
         
-        if h(object_names[x]).value == p2val:          #if second particle is a planet or the star        
-            part = sim.contents.particles[h(p1val)]    #we want the first particle
-            coldata = [p1val, part.vx, part.vy, part.vz, sim.contents.t]
-            vals[object_names[x]].append(coldata)
-            return (1)                                 #remove first particle
+    """
+    
+    dx, dy, dz = dxyz[:, 0], dxyz[:, 1], dxyz[:, 2]
+    dvx, dvy, dvz = dvxyz[:, 0], dvxyz[:, 1], dvxyz[:, 2]
+    
+    d = np.sqrt(dx*dx + dy*dy + dz*dz)
+    vsquared = dvx*dvx + dvy*dvy + dvz*dvz
+    vcircsquared = mu/d
+    a = -mu/(vsquared - 2.*vcircsquared)                       #semi major axis
     
-    return 0
+    hx = dy*dvz - dz*dvy                                       #angular momentum vector
+    hy = dz*dvx - dx*dvz
+    hz = dx*dvy - dy*dvx
+    hnorm = np.sqrt(hx*hx + hy*hy + hz*hz)
+    
+    vdiffsquared = vsquared - vcircsquared
+    vr = (dx*dvx + dy*dvy + dz*dvz)/d
+    rvr = d*vr
+    ex = (vdiffsquared*dx - rvr*dvx)/mu                        #eccentricity vector
+    ey = (vdiffsquared*dy - rvr*dvy)/mu
+    ez = (vdiffsquared*dz - rvr*dvz)/mu
+    e = np.sqrt(ex*ex + ey*ey + ez*ez)
+    
+    inc = acos2(hz, hnorm, np.ones_like(hz))                   #inclination
+    nx = -hy                                                   #vector pointing along the ascending node
+    ny = hx
+    n = np.sqrt(nx*nx + ny*ny)
+    Omega = acos2(nx, n, ny)                                   #longitude of ascending node
+    
+    #nearly planar orbits: use longitudes rather than angles referenced to the node
+    planar = (inc < 1.e-8) | (inc > math.pi - 1.e-8)
+    prograde = inc < math.pi/2.
+    theta = acos2(dx, d, dy)                                   #true longitude
+    pomega = acos2(ex, e, ey)                                  #longitude of pericenter
+    wpf = acos2(nx*dx + ny*dy, n*d, dz)                        #omega plus f
+    omega_incl = acos2(nx*ex + ny*ey, n*e, ez)
+    
+    omega = np.where(planar, np.where(prograde, pomega - Omega, Omega - pomega), omega_incl)
+    f = np.where(planar, np.where(prograde, theta - pomega, pomega - theta), wpf - omega_incl)
+    
+    return a, e, inc, Omega, np.mod(omega, 2*math.pi), np.mod(f, 2*math.pi)
+
+
+def escape_data(sim, cutoff=0.):
+    
+    """
+    Finds test particles farther than the cutoff distance from the star on unbound (e >= 1) orbits.
+    Orbits around the star are calculated for all test particles at once.
+    
+    Calling sequence:
+        names, data = escape_data(sim, cutoff=0.)
+    
+    Returns:
+        *names ----------hashes of the escaping particles
+        *data -----------rows of [hash, a, e, inc, Omega, omega, f, t, v_inf]
+        
+    """
+    
+    N0 = len(object_names)
+    hashes = np.zeros(sim.N, dtype='uint32')
+    m = np.zeros(sim.N)
+    xyz = np.zeros((sim.N, 3))
+    vxvyvz = np.zeros((sim.N, 3))
+    sim.serialize_particle_data(hash=hashes, m=m, xyz=xyz, vxvyvz=vxvyvz)
+    
+    dxyz = xyz[N0:] - xyz[0]                                        #heliocentric positions and velocities
+    dvxyz = vxvyvz[N0:] - vxvyvz[0]
+    far = np.linalg.norm(dxyz, axis=1) > cutoff
+    
+    mu = sim.G*(m[0] + m[N0:][far])                                 #orbital elements around sun
+    orbits = orbital_elements(mu, dxyz[far], dvxyz[far])
+    esc = orbits[1] >= 1                                            #if eccentricity > 1, consider escaped
+    
+    v_inf = np.sqrt(-mu[esc]/orbits[0][esc])                        #asymptotic velocity wrt the star
+    t = np.full(v_inf.shape, sim.t)                                 #escape time
+    names = hashes[N0:][far][esc].tolist()
+    data = np.column_stack([o[esc] for o in orbits] + [t, v_inf]).tolist()
+    return names, [[name] + row for name, row in zip(names, data)]
+
 
 def escape_check(sim):
     
     """
     Checks for escaped particles, based on eccentricity.
     """
-    ps = sim.particles
-    esc_parts = [] 
-
-    for i in range (len(object_names), sim.N):
-        particle = ps[i]
-        orbit = particle.calculate_orbit(sim.particles[object_names[0]]) #orbital elements around sun 
-        ecc = orbit.e
-        if (ecc >= 1):                                                   #if eccentricity > 1, consider escaped
-            name = particle.hash.value
-            data = [name, orbit.a, orbit.e, orbit.inc, orbit.Omega, orbit.omega, orbit.f]
-            vals['esc'].append(data)
+    
+    names, data = escape_data(sim)
+    log_escapes(data)
+    
+    
+def remove_escapes(sim):
+    
+    """
+    Records and removes test particles beyond escape_dist on unbound orbits.
+    """
+    
+    names, data = escape_data(sim, escape_dist)
+    log_escapes(data)
+    for name in names:
+        sim.remove(hash=name)
+        
+        
+def integrate_chunk(sim, tend):
+    
+    """
+    Integrates up to tend. With escape_removal on, checks for and removes escaping
+    ejecta every escape_int years, so they stop costing integration time.
+    With split_levels set, splits and culls ejecta every split_int years (see split_ejecta).
+    With compact snapshots or an archive_schedule, also stops at each snapshot time to write a snapshot.
+    All these stops are moved to whole steps of dt (see next_stop), so they do not change the steps taken.
+    Returns without integrating further once a signal has been caught (see watch_signals): sim.integrate 
+    clears a stop requested before it starts, so stop_signal is checked before each call.
+    """
+    
+    if not escape_removal and not manual_snapshots and split_levels is None:
+        if stop_signal is None:
+            sim.integrate(tend, exact_finish_time=1)
+        flush_events()
+        return
+    
+    t = sim.t
+    while t < tend:
+        stops = [tend]                                                  #stay on the grids when resuming
+        if escape_removal:
+            stops.append(next_stop(t, escape_int))
+        if split_levels is not None:
+            stops.append(next_stop(t, split_int))
+        tsnap = next_snapshot(t)
+        if manual_snapshots:
+            stops.append(tsnap)
+        t = min(stops)
+        if tend - t < dt/2:                                             #grid stop in the chunk's last step
+            t = tend
+        if stop_signal is not None:
+            break
+        sim.integrate(t, exact_finish_time=1)
+        if stop_signal is not None:                                     #stopped short of t; the caller checkpoints
+            break
+        if escape_removal:
+            remove_escapes(sim)
+        if split_levels is not None:
+            split_ejecta(sim)
+        if manual_snapshots and abs(t - tsnap) < dt/2:
+            take_snapshot(sim)
+        flush_events()
+            
+
+def next_stop(t, interval):
+    
+    """
+    Next time on the grid of multiples of interval, moved to the nearest whole step of dt, 
+    that lies after t, so that integrating to it ends on a step.
+    """
+    
+    k = round(t/dt)                                                     #steps to t
+    j = math.floor(t/interval) + 1
+    while round(j*interval/dt) <= k:                                    #grid time already reached in steps
+        j += 1
+    return round(j*interval/dt)*dt
             
 
+def split_ejecta(sim):
+    
+    """
+    Importance splitting towards escape. An ejecta's level is the number of split_levels its semi-major axis
+    around the star exceeds (all of them on an unbound orbit). An ejecta that rises above the level it holds
+    is split into split_factor copies per level crossed, which share its weight; the clones start from its
+    state with a small random velocity kick (split_kick), and are recorded with its initial conditions and
+    their parent's hash. An ejecta that falls below the level it holds is culled with probability
+    1 - 1/split_factor per level, and otherwise takes on the weight of the culled copies. 
+    Every step keeps the expected weight, so weighted counts of all outcomes stay unbiased, while the
+    integration time goes into the few ejecta on their way out.
+    """
+    global init_rows
+    
+    if init_rows is None:                                            #rows of vals['init'] by hash, for the weights
+        init_rows = {int(row[0]): row for row in vals['init']}
+    levels = np.array(split_levels, dtype=float)
+    factors = [split_factor]*len(levels) if np.ndim(split_factor) == 0 else list(split_factor)
+    
+    N0 = len(object_names)
+    hashes = np.zeros(sim.N, dtype='uint32')
+    xyz = np.zeros((sim.N, 3))
+    vxvyvz = np.zeros((sim.N, 3))
+    sim.serialize_particle_data(hash=hashes, xyz=xyz, vxvyvz=vxvyvz)
+    dxyz = xyz[N0:] - xyz[0]                                         #heliocentric positions and velocities
+    dvxyz = vxvyvz[N0:] - vxvyvz[0]
+    inv_a = 2/np.linalg.norm(dxyz, axis=1) - (dvxyz**2).sum(axis=1)/(sim.G*sim.particles[0].m)
+    level = (inv_a[:, None] < 1/levels).sum(axis=1)                  #levels below the ejecta's semi-major axis
+    if split_state:
+        alive = set(hashes[N0:].tolist())
+        for name in [name for name in split_state if name not in alive]:    #collided, escaped or culled
+            del split_state[name]
+    held = np.array([split_state.get(name, 0) for name in hashes[N0:].tolist()], dtype=int)
+    
+    #culls first: removing particles after adding some within one step overruns Mercurius' dcrit array,
+    #which is only resized at the next step
+    changed = np.nonzero(level != held)[0]
+    for k in changed[level[changed] < held[changed]]:               #cull, or keep the culled copies' weight
+        name = int(hashes[N0 + k])
+        row = init_rows[name]
+        for j in range(held[k], level[k], -1):
+            if split_rng.random()*factors[j - 1] >= 1:
+                row[8] = 0.
+                sim.remove(hash=name)
+                break
+            row[8] = row[8]*factors[j - 1]
+        if level[k] > 0:
+            split_state[name] = int(level[k])
+        else:
+            split_state.pop(name, None)
+    for k in changed[level[changed] > held[changed]]:               #split: copies share the weight
+        name = int(hashes[N0 + k])
+        row = init_rows[name]
+        copies = int(np.prod(factors[held[k]:level[k]]))
+        pop = name//pop_stride
+        if clone_next[pop] + copies > pop_stride:                    #out of hashes for this population: no more splits
+            continue
+        row[8] = row[8]/copies
+        speed = np.linalg.norm(dvxyz[k])
+        for j in range(copies - 1):
+            clone = pop*pop_stride + clone_next[pop]
+            clone_next[pop] += 1
+            while clone in body_index:
+                clone = pop*pop_stride + clone_next[pop]
+                clone_next[pop] += 1
+            kick = split_rng.normal(size=3)
+            v = vxvyvz[N0 + k] + split_kick*speed*kick/np.linalg.norm(kick)
+            sim.add(m=0., x=xyz[N0 + k, 0], y=xyz[N0 + k, 1], z=xyz[N0 + k, 2], vx=v[0], vy=v[1], vz=v[2], hash=clone)
+            init_rows[clone] = [clone] + row[1:12] + [name]
+            vals['init'].append(init_rows[clone])
+            split_state[clone] = int(level[k])
+        split_state[name] = int(level[k])
+
             
 ###Data recording functions            
             
@@ -200,10 +527,171 @@ def make_datalists():
     return vals
 
 
-def make_filedir(label):
+def make_bodytable():
+    """
+    Creates the lookup table from planet/star hash value to body index in object_names.
+    """
+    
+    return {h(object_names[x]).value: x for x in range(len(object_names))}
+
+
+def make_colbuffer(n):
+    """
+    Preallocates the collision buffer, which holds collisions until they are flushed to the event log.
+    Rows are [body index, hash, vx, vy, vz, t, dx, dy, dz, dvx, dvy, dvz, px, py, pz, pvx, pvy, pvz]:
+    d: ejecta relative to the body it hit, p: body relative to the star.
+    """
+    
+    return np.zeros((n, 18))
+
+
+###Event log functions (layout and reading in records.py)
+
+def write_events(events):
+    """
+    Appends records to the event log and forces them to disk.
+    """
+    
+    eventlog.write(events.tobytes())
+    eventlog.flush()
+    os.fsync(eventlog.fileno())
+
+
+def flush_events():
+    """
+    Moves the filled rows of the collision buffer into the event log and empties the buffer.
+    """
+    global ncols, nlogged
+    
+    if ncols == 0:
+        return
+    write_events(collision_events(colbuf[:ncols]))
+    nlogged += ncols
+    ncols = 0
+    
+    
+def log_escapes(data):
+    """
+    Writes escape rows [hash, a, e, inc, Omega, omega, f, t, v_inf] to the event log.
+    """
+    
+    if len(data) == 0:
+        return
+    write_events(escape_events(np.array(data)))
+
+
+###Snapshot functions
+
+#compact snapshots: after a one-line header, one chunk per snapshot, holding a snapshot_dtype record 
+#(time, number of ejecta, planet states) followed by one column per entry of snapshot_columns
+#orbital elements are around the center of mass of the star and planets, as REBOUND's default (Jacobi) orbits
+snapshot_dtype = np.dtype([('t', '<f8'), ('N', '<u4'), ('planets', '<f8', (8, 6))])     #8 bodies: the star and planets
+snapshot_columns = [('hash', '<u4'), ('a', '<f4'), ('e', '<f4'), ('inc', '<f4'), ('Omega', '<f4'), ('omega', '<f4'), ('f', '<f4')]
+
+
+def make_schedule():
+    
+    """
+    Lists the snapshot times (in years) from 0 to num_years set by archive_schedule, moved to whole steps of dt:
+        *None ---------------------------------every archive_int years
+        *[t1, t2, ...] ------------------------these times
+        *('log', first, n) --------------------n log-spaced times from first to num_years
+        *('piecewise', [(until, interval), ...]) --every interval years up to until, for each (until, interval) in turn
+    """
+    
+    if archive_schedule is None:
+        times = np.arange(0., num_years + archive_int/2, archive_int)
+    elif archive_schedule[0] == 'log':
+        times = np.geomspace(archive_schedule[1], num_years, archive_schedule[2])
+    elif archive_schedule[0] == 'piecewise':
+        times, start = [], 0.
+        for until, interval in archive_schedule[1]:
+            times.append(np.arange(start, until - interval/2, interval))
+            start = until
+        times = np.concatenate(times + [[start]])
+    else:
+        times = np.array(archive_schedule, dtype=float)
+    times = np.asarray(times, dtype=float)
+    times = np.minimum(np.round(times[times < num_years + dt/2]/dt)*dt, num_years)  #on whole steps, as next_stop
+    return np.unique(np.concatenate([[0.], times]))
+
+
+def next_snapshot(t):
+    """
+    Time of the first snapshot after t (infinite once the schedule is used up).
+    """
+    
+    if archive_schedule is None:
+        return next_stop(t, archive_int)
+    k = np.searchsorted(schedule, t + dt/2, side='right')
+    return float(schedule[k]) if k < len(schedule) else math.inf
+
+
+def take_snapshot(sim):
+    """
+    Writes a snapshot at one of the scheduled times: a compact snapshot, or a full SimulationArchive snapshot.
+    """
+    
+    if snapshot_mode == 'compact':
+        write_snapshot(sim)
+    else:
+        sim.simulationarchive_snapshot(archive)
+
+
+def open_snapshots(path, size=None):
+    
+    """
+    Opens the append-only compact snapshot file, which starts with a one-line header describing its layout.
+    When resuming, the file is cut back to the size saved with the checkpoint.
+    """
+    
+    if size is None:
+        f = open(path, 'wb')
+        header = {'snapshot': snapshot_dtype.descr, 'columns': snapshot_columns, 'planets': object_names}
+        f.write((repr(header) + '\n').encode())
+        f.flush()
+    else:
+        f = open(path, 'r+b')
+        f.truncate(size)
+        f.seek(size)
+    return f
+
+
+def write_snapshot(sim):
+    
+    """
+    Appends a compact snapshot: the surviving ejecta's hashes and float32 orbital elements,
+    and the float64 positions and velocities of the star and planets.
+    """
+    
+    N0 = len(object_names)
+    hashes = np.zeros(sim.N, dtype='uint32')
+    m = np.zeros(sim.N)
+    xyz = np.zeros((sim.N, 3))
+    vxvyvz = np.zeros((sim.N, 3))
+    sim.serialize_particle_data(hash=hashes, m=m, xyz=xyz, vxvyvz=vxvyvz)
+    
+    M = m[:N0].sum()                                               #center of mass of the massive bodies
+    com = (m[:N0, None]*xyz[:N0]).sum(axis=0)/M
+    vcom = (m[:N0, None]*vxvyvz[:N0]).sum(axis=0)/M
+    orbits = orbital_elements(sim.G*M, xyz[N0:] - com, vxvyvz[N0:] - vcom)
+    
+    head = np.zeros(1, dtype=snapshot_dtype)
+    head['t'] = sim.t
+    head['N'] = sim.N - N0
+    head['planets'] = np.hstack([xyz[:N0], vxvyvz[:N0]])
+    snapfile.write(head.tobytes())
+    snapfile.write(hashes[N0:].tobytes())
+    for col in orbits:
+        snapfile.write(col.astype('<f4').tobytes())
+    snapfile.flush()
+    
+
+def make_filedir(label, resume=False):
     
     """
     Sets up directory structure for data writing.
+    With resume on, an existing folder is reused if it holds a checkpoint.
     """
     
     parent = os.getcwd()                      #make overall Ejecta Simulation Data folder
@@ -218,82 +706,616 @@ def make_filedir(label):
     newpath = os.path.join(path, new_fold)
     if not os.path.exists(newpath):
         os.mkdir(newpath)
+    elif resume and os.path.exists(os.path.join(newpath, label + '_checkpoint.pkl')):
+        pass
     else:
         sys.exit("Error: please choose a different simulation label.")
     
     return newpath
 
 
-def make_overall_dict():
+def make_label(src, vinc, n):
+    """
+    Makes the simulation label of one ejecta population.
+    Populations from a source planet other than sourceplanet are prefixed with that planet,
+    populations ejected from a site with its site ID, and populations with a velocity spectrum with vspec.
+    """
+    
+    label = str(n) + 'e_' + str(num_years) + 'y_' + str(vinc) + 'vinc_' + str(jobno)
+    if src != sourceplanet:
+        label = src + 'src_' + label
+    if ejection_site is not None:                   #site runs: site<site ID>_, as in the Plots/specific_collision_sites folders
+        label = 'site' + str(site_id()) + '_' + label
+    if velocity_spectrum is not None:               #speeds drawn from a spectrum rather than set by vinc
+        label = 'vspec_' + label
+    return label
+
+
+def split_populations():
+    """
+    Splits the datalists by population (hash // pop_stride), renumbering hashes from 1 within each population.
+    """
+    
+    split = [{key: [] for key in vals} for pop in populations]
+    for key, rows in vals.items():
+        for row in rows:
+            pop, name = divmod(row[0], pop_stride)
+            split[pop][key].append([name] + row[1:])
+    return split
+
+
+def make_overall_dict(pop, vals):
     """
-    Gathers data for overview file. 
+    Gathers data for overview file of one population. 
     """
+    src, vinc, n = populations[pop]
     overall = {
-        'Source Planet': sourceplanet,
-        'Number of Ejecta': num_ejecta,
-        'Velocity Increment (10km/s)': v_increment, 
+        'Source Planet': src,
+        'Number of Ejecta': len(range(shard or 0, n, nshards)),
+        'Shards': nshards,
+        'Velocity Increment (10km/s)': vinc, 
         'Timesteps': num_years/dt,
         'Step amount (yrs)': dt,
         'Total Time (yrs)': num_years, 
-        'Generation seed': genseed,
+        'Generation seed': (genseed + pop) % 2**32,
+        'Direction sampler': direction_sampler,
+        'Ejection site': ejection_site if isinstance(ejection_site, (str, type(None))) else list(ejection_site),
+        'Site half-angle (deg)': site_halfangle if isinstance(ejection_site, str) else None,
+        'Velocity spectrum': None if velocity_spectrum is None else json.loads(json.dumps(velocity_spectrum)),
+        'Splitting levels (AU)': None if split_levels is None else list(split_levels),
+        'Split factor': None if split_levels is None else json.loads(json.dumps(split_factor)),
+        'Clones': sum([1 for row in vals['init'] if float(row[12]) != 0.]),
+        'Culled': sum([1 for row in vals['init'] if float(row[8]) == 0.]),
         'Escaped Particles': len(vals['esc']),
     }
     for x in range (len(object_names)):
         overall[object_names[x]] = (len(vals[object_names[x]])) #number of collisions per planet
+    overall['Escape removal distance (AU)'] = escape_dist if escape_removal else None
+    packed = label if shard is None else label[:-len('_shard' + str(shard))]     #shards: the run's own label
+    overall['Packed simulation'] = packed if len(populations) > 1 else None   #folder holding the snapshots
+    overall['Packed population'] = pop if len(populations) > 1 else None      #hashes pop*pop_stride + number there
+    overall['End condition'] = end_condition
+    overall['Segments'] = coverage(num_years)                 #jobs that covered the run: [job id, start, end]
+    overall['Snapshot times (yrs)'] = schedule[schedule <= num_years].tolist()
+    if origins is not None:                                   #continued in a consolidated run
+        overall['Generation seed'] = origin_meta[pop]['Generation seed']
+        overall['Direction sampler'] = origin_meta[pop].get('Direction sampler')
+        overall['Ejection site'] = origin_meta[pop].get('Ejection site')
+        overall['Site half-angle (deg)'] = origin_meta[pop].get('Site half-angle (deg)')
+        overall['Velocity spectrum'] = origin_meta[pop].get('Velocity spectrum')
+        overall['Consolidated at (yrs)'] = origin_meta[pop]['Total Time (yrs)']
+        overall['Segments'] = origin_meta[pop]['Segments'] + overall['Segments']
+        overall['Snapshot times (yrs)'] = origin_meta[pop].get('Snapshot times (yrs)')      #snapshots in its own folder
     return overall
 
 
 
-def write_datafiles(label):
+def results_folder(label):
+    """
+    Output folder of a population (or shard).
+    """
     
+    return os.path.join(os.getcwd(), 'Ejecta_Simulation_Data', label)
+
+
+def read_results(label):
     """
-    Writes data to csv files. 
+    Reads the datalists and overview of one population back from its folder (see records.read_results).
     """
-    parent = os.getcwd()
-    folderpath = parent + '/Ejecta_Simulation_Data/' + label
     
-    #overview file
-    overall = make_overall_dict()
-    overallpath = os.path.join(folderpath, label + '_overview.csv')
-    w = csv.writer(open(overallpath, 'w'))
-    w.writerow([label])
-    for key, val in overall.items():
-        w.writerow([key,val])
+    return records.read_results(results_folder(label))
+
+
+def write_outputs(label, vals, overall):
+    """
+    Writes the results of one population in the formats chosen by results_format.
+    """
+    
+    if results_format in ['npz', 'both']:
+        records.write_results(results_folder(label), vals, overall)
+    if results_format in ['csv', 'both']:
+        records.write_datafiles(results_folder(label), vals, overall)
         
-    #initial conditions file
-    initpath = os.path.join(folderpath, label + '_particle_inits.csv')
-    init_header = ['hash','inc', 'vxPlanet', 'vyPlanet', 'vzPlanet', 'vxStar', 'vyStar', 'vzStar']
-    with open(initpath, 'w') as f:
-        write = csv.writer(f)
-        write.writerow([label])
-        write.writerow(init_header)
-        write.writerows(vals['init'])
-    
-    #planetary collisions files
-    for x in range (len(object_names)):
-        objcol_path = os.path.join(folderpath, label + '_' + object_names[x]+'.csv')
-        obj_header = ['hash','vx', 'vy', 'vz', 't']
-        with open(objcol_path, 'w') as f:
-            write = csv.writer(f)
-            write.writerow([label])
-            write.writerow(obj_header)
-            write.writerows(vals[object_names[x]])
-    
-    #escaped particles file
-    esc_path = os.path.join(folderpath, label + '_escaped.csv')
-    esc_header = ['hash', 'semi-maj axis', 'eccentricity', 'inclination', 'long. asc. node', 'arg. pericenter', 'true anomaly']
-    with open(esc_path, 'w') as f:
-        write = csv.writer(f)
-        write.writerow([label])
-        write.writerow(esc_header)
-        write.writerows(vals['esc'])
+
+###Checkpoint functions
+
+def save_records():
+    
+    """
+    Saves the records the run starts with (initial conditions, and the origins' records and overviews
+    of a consolidated run) once, before integrating. Checkpoints only hold what changes after that.
+    """
+    
+    path = os.path.join(data_folder, label + '_records.pkl')
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump({'vals': vals, 'origin_meta': origin_meta}, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def save_checkpoint(sim):
+    
+    """
+    Saves the simulation state and what changed in the records since save_records, so the run can be resumed.
+    The checkpoint file is replaced atomically and names its matching simulation binary,
+    so a job killed mid-save still leaves the previous checkpoint intact.
+    Collisions and escapes are kept in the event log, and snapshots in the archive; only their sizes are saved.
+    Splitting runs also save the weights of all ejecta and the initial conditions of the clones.
+    """
+    global ncheckpoints
+    
+    flush_events()
+    if snapshot_mode == 'compact':
+        os.fsync(snapfile.fileno())
+    ncheckpoints += 1
+    binname = label + '_checkpoint_' + str(ncheckpoints) + '.bin'
+    sim.save(os.path.join(data_folder, binname))
+    
+    records = {
+        't': sim.t,
+        'bin': binname,
+        'checkpoint': ncheckpoints,
+        'genseed': genseed,
+        'log_size': eventlog.tell(),
+        'segments': coverage(sim.t),
+        'splitting': None,
+        'snap_size': snapfile.tell() if snapshot_mode == 'compact' else (os.path.getsize(archive) if os.path.exists(archive) else 0),
+        'recalculate_dcrit': sim.ri_mercurius.recalculate_dcrit_this_timestep,     #set by adding clones, not saved
+    }
+    if split_levels is not None:
+        records['splitting'] = (split_state, clone_next, split_rng, 
+                                np.array([row[8] for row in vals['init']], dtype=float), vals['init'][ninit:])
+    ckpt_path = os.path.join(data_folder, label + '_checkpoint.pkl')
+    with open(ckpt_path + '.tmp', 'wb') as f:
+        pickle.dump(records, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ckpt_path + '.tmp', ckpt_path)
+    
+    oldbin = os.path.join(data_folder, label + '_checkpoint_' + str(ncheckpoints-1) + '.bin')
+    if os.path.exists(oldbin):
+        os.remove(oldbin)
+        
+        
+def load_checkpoint():
+    
+    """
+    Restores the simulation and records from the latest checkpoint of this label.
+    The event log and snapshots are cut back to their sizes at the checkpoint, dropping what a job 
+    killed later wrote after it. Returns the simulation, or None if there is no checkpoint.
+    """
+    global vals, eventlog, snapfile, genseed, ncheckpoints, segments, origin_meta, split_state, clone_next, split_rng, ninit
+    
+    ckpt_path = os.path.join(data_folder, label + '_checkpoint.pkl')
+    if not os.path.exists(ckpt_path):
+        return None
+    if all([run_finished(plabel) for plabel in pop_labels]):     #killed after writing its outputs
+        sys.exit("Error: " + label + " already finished; please choose a different simulation label.")
+    with open(ckpt_path, 'rb') as f:
+        records = pickle.load(f)
+    with open(os.path.join(data_folder, label + '_records.pkl'), 'rb') as f:
+        start = pickle.load(f)
+        
+    sim = rebound.Simulation(os.path.join(data_folder, records['bin']))
+    sim.collision_resolve = c_profiled if profile_callback else c     #function pointers are not saved with the simulation
+    sim.ri_mercurius.recalculate_dcrit_this_timestep = records['recalculate_dcrit']      #as it was when saved
+    
+    vals = start['vals']
+    origin_meta = start['origin_meta']
+    ninit = len(vals['init'])
+    eventlog = open_eventlog(os.path.join(data_folder, label + '_events.bin'), records['log_size'])
+    if snapshot_mode == 'compact':
+        snapfile = open_snapshots(os.path.join(data_folder, label + '_snapshots.bin'), records['snap_size'])
+    elif os.path.exists(os.path.join(data_folder, label + '.bin')):     #drop snapshots from after the checkpoint
+        os.truncate(os.path.join(data_folder, label + '.bin'), records['snap_size'])
+    genseed = records['genseed']
+    ncheckpoints = records['checkpoint']
+    segments = records['segments']
+    if records['splitting'] is not None:
+        split_state, clone_next, split_rng, weights, clones = records['splitting']
+        vals['init'] += clones
+        for row, weight in zip(vals['init'], weights.tolist()):
+            row[8] = weight
+    return sim
+
+
+def remove_checkpoint():
+    
+    """
+    Deletes the checkpoint files once the run's outputs are written, so the finished run is not resumed.
+    """
+    
+    for name in [label + '_checkpoint.pkl', label + '_checkpoint_' + str(ncheckpoints) + '.bin', label + '_records.pkl']:
+        path = os.path.join(data_folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_finished(plabel):
+    
+    """
+    Checks whether a population already wrote its outputs with an end condition other than the wall-clock
+    budget (or a stop for consolidation, which a consolidated run later overwrites with its own).
+    """
+    
+    path = os.path.join(os.getcwd(), 'Ejecta_Simulation_Data', plabel, plabel)
+    if os.path.exists(path + '_results.npz'):
+        with np.load(path + '_results.npz') as data:
+            overall = json.loads(str(data['meta']))
+    elif os.path.exists(path + '_overview.csv'):
+        overall = dict(read_datafile(path + '_overview.csv'))
+    else:
+        return False
+    return overall.get('End condition', 'completed') not in ['wall-clock budget', 'stopped for consolidation']
+
+
+def watch_signals(sim):
+    
+    """
+    Catches SIGTERM, SIGUSR1 and SIGUSR2 (sent by slurm on preemption, or before the time limit 
+    with --signal) in a watcher thread. The integration is stopped after the current timestep,
+    and the integration loop checkpoints and exits. The first signal is recorded; the watcher keeps 
+    taking later ones (e.g. slurm's SIGTERM after a USR1 warning), and repeats the stop every second, 
+    since an integrate call starting after the stop would clear it.
+    """
+    
+    sigs = {signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2}
+    signal.pthread_sigmask(signal.SIG_BLOCK, sigs)       #only the watcher thread receives them
+    
+    def watch():
+        global stop_signal
+        while True:
+            info = signal.sigtimedwait(sigs, 1.)
+            if info is not None and stop_signal is None:
+                stop_signal = info.si_signo
+            if stop_signal is not None:
+                sim.stop()
+        
+    threading.Thread(target=watch, daemon=True).start()
+    
+
+
+###Telemetry functions
+
+def make_chunkstats():
+    """
+    Creates the per-chunk counters: the collisions logged before the chunk, and the callback
+    calls and time filled in by c_profiled.
+    """
+    
+    return {'logged': nlogged + ncols, 'callbacks': 0, 'callback_time': 0.}
+
+
+def archive_size():
+    """
+    Size of the snapshot file written so far (full archive or compact snapshots), in bytes.
+    """
+    
+    path = data_folder + '/' + label + ('_snapshots.bin' if snapshot_mode == 'compact' else '.bin')
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def write_telemetry(sim, i, tstart, seconds, elapsed, ntest, steps):
+    
+    """
+    Appends one JSON line describing the chunk just integrated to <label>_telemetry.jsonl,
+    then resets the per-chunk counters.
+    """
+    global chunkstats, archive_bytes
+    
+    size = archive_size()
+    record = {
+        'job': os.environ.get('SLURM_JOB_ID'),          #changes when a requeued job resumes
+        'chunk': i,
+        't_start': tstart,
+        't': sim.t,
+        'wall': seconds,                                #wall-clock seconds spent on this chunk
+        'elapsed': elapsed + seconds,                   #wall-clock seconds since the job started
+        'N_start': ntest,
+        'N': sim.N - sim.N_active,                      #ejecta remaining
+        'steps': sim.steps_done - steps,
+        'collisions': nlogged + ncols - chunkstats['logged'],
+        'callbacks': chunkstats['callbacks'] if profile_callback else None,
+        'callback_time': chunkstats['callback_time'] if profile_callback else None,  #seconds in the callback
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+        'archive_bytes': size,
+        'archive_written': size - archive_bytes,
+    }
+    with open(data_folder + '/' + label + '_telemetry.jsonl', 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    chunkstats = make_chunkstats()
+    archive_bytes = size
+    
+    
+
+###Early termination functions
+
+def check_stop(sim):
+    
+    """
+    Checks the early termination conditions between chunks.
+    Returns the reason to stop integrating, or None to carry on.
+    """
+    
+    ntest = sim.N - sim.N_active
+    if ntest < min_ejecta:
+        return 'no ejecta left' if ntest == 0 else 'fewer than ' + str(min_ejecta) + ' ejecta left'
+    if consolidate_at is not None and origins is None and sim.t >= consolidate_at:
+        return 'stopped for consolidation'
+    if stop_unbound and ntest > 0 and len(escape_data(sim)[0]) == ntest:
+        return 'only unbound ejecta left'
+    return None
+    
+    
+
+###Wall-clock budget functions
+
+def make_budget():
+    """
+    Creates the record of measured chunk costs for the wall-clock budget controller.
+    """
+    
+    return {'seconds': [], 'years': [], 'N': []}
+
+
+def record_chunk(budget, seconds, years, N):
+    """
+    Records how long a chunk took, how many years it covered, and how many test particles it started with.
+    """
+    
+    budget['seconds'].append(seconds)
+    budget['years'].append(years)
+    budget['N'].append(N)
+
+
+def predict_cost(budget, years, N):
+    
+    """
+    Predicts the wall-clock seconds needed to integrate the given years with N test particles.
+    
+    Fits seconds per year against N over the last budget_window chunks, clipped to the
+    range of observed rates (falls back to their mean while N has not changed, and to
+    proj_chunktime before any chunk has been timed). 
+    """
+    
+    if len(budget['seconds']) == 0:
+        return proj_chunktime*years/chunk
+    
+    rate = np.array(budget['seconds'][-budget_window:])/np.array(budget['years'][-budget_window:])
+    n = np.array(budget['N'][-budget_window:])
+    if np.ptp(n) > 0:
+        slope, intercept = np.polyfit(n, rate, 1)
+        pred = np.clip(slope*N + intercept, rate.min(), rate.max())
+    else:
+        pred = rate.mean()
+    return budget_safety*pred*years
+
+
+def plan_chunk(budget, elapsed, N, t, tend):
+    
+    """
+    Sizes the next chunk to land inside the wall-clock limit.
+    
+    Returns tend if the whole chunk is predicted to fit in maxtime - budget_margin, otherwise 
+    the latest whole step of dt that does (so the shortened chunk does not change the steps taken),
+    or None if not even one step fits.
+    """
+    
+    left = maxtime - budget_margin - elapsed
+    if predict_cost(budget, tend - t, N) <= left:
+        return tend
+    
+    years = left/predict_cost(budget, 1., N)
+    tshort = math.floor((t + years)/dt)*dt
+    if tshort < t + dt/2:
+        return None
+    return tshort
+    
+
+###Job chaining functions
+
+def coverage(t):
+    """
+    Lists the segments (jobs) that covered this run so far as [slurm job id, start time, end time],
+    counting the current one up to time t if it integrated anything (reruns of finished runs add no segment).
+    """
+    
+    if t <= segment_start:
+        return list(segments)
+    return segments + [[os.environ.get('SLURM_JOB_ID'), segment_start, t]]
+
+
+def chain_job():
+    
+    """
+    Requeues this slurm job with chain_command, so the run continues from its latest checkpoint 
+    in a new segment; used when the wall-clock budget runs out, or the time limit signal arrives first.
+    Outside slurm, just says how to continue.
+    """
+    
+    job = os.environ.get('SLURM_JOB_ID')
+    if job is None:
+        print('out of wall-clock time; rerun to continue from the checkpoint')
+        return
+    if 'SLURM_ARRAY_TASK_ID' in os.environ:
+        job = os.environ['SLURM_ARRAY_JOB_ID'] + '_' + os.environ['SLURM_ARRAY_TASK_ID']
+    print('out of wall-clock time; requeueing job ' + job + ' to continue', flush=True)
+    subprocess.run(chain_command.format(job=job).split())
+
+
+
+###Survivor consolidation functions
+
+def parse_overview(overall):
+    """
+    Parses the values of an overview read from a csv file back into numbers and lists.
+    """
+
+    for key, val in overall.items():
+        if isinstance(val, str):
+            try:
+                overall[key] = ast.literal_eval(val)
+            except (ValueError, SyntaxError):
+                pass
+    return overall
+
+
+def origin_populations():
+    """
+    Lists the populations (source planet, v_increment, num_ejecta) of a consolidated run, one per origin simulation.
+    """
+
+    pops = []
+    for origin in origins:
+        overall = parse_overview(read_results(origin)[1])
+        pops.append((overall['Source Planet'], overall['Velocity Increment (10km/s)'], overall['Number of Ejecta']))
+    return pops
+
+
+def consolidate_sims():
+
+    """
+    Starts a consolidated run from the end states of its origin simulations, all stopped at the same time
+    by consolidate_at. The surviving ejecta of origin k are added to the star and planets of the first origin
+    with hashes k*pop_stride + ejecta number, and the origins' records so far are carried over, renumbered
+    the same way. End-of-run escape records of ejecta that are still integrated are dropped; they are checked again.
+
+    Returns the simulation, the datalists and the origins' overviews.
+    """
+
+    N0 = len(object_names)
+    data_path = os.path.join(os.getcwd(), 'Ejecta_Simulation_Data')
+    vals = make_datalists()
+    metas = []
+    states = []
+    for k in range(len(origins)):
+        ovals, overall = read_results(origins[k])
+        if overall['End condition'] != 'stopped for consolidation':
+            sys.exit("Error: " + origins[k] + " was not stopped for consolidation.")
+        osim = rebound.Simulation(os.path.join(data_path, origins[k], origins[k] + '_end.bin'))
+        hashes = np.zeros(osim.N, dtype='uint32')
+        xyz = np.zeros((osim.N, 3))
+        vxvyvz = np.zeros((osim.N, 3))
+        osim.serialize_particle_data(hash=hashes, xyz=xyz, vxvyvz=vxvyvz)
+        if k == 0:
+            sim = osim
+        elif osim.t != sim.t or np.abs(xyz[:N0] - states[0][1][:N0]).max() > consolidate_tol:
+            sys.exit("Error: " + origins[k] + " does not share the time and planets of " + origins[0] + ".")
+        if (hashes[N0:] >= pop_stride).any():
+            sys.exit("Error: " + origins[k] + " is packed or sharded; only single simulations can be consolidated.")
+
+        alive = set(hashes[N0:].tolist())
+        hashes[N0:] += k*pop_stride                                  #globally unique hashes
+        states.append((hashes, xyz, vxvyvz))
+        for key, rows in ovals.items():
+            for row in rows:
+                if key == 'esc' and float(row[7]) >= sim.t and int(row[0]) in alive:
+                    continue
+                vals[key].append([k*pop_stride + int(row[0])] + row[1:])
+        metas.append(parse_overview(overall))
+
+    #add the other origins' survivors to the first origin's simulation in bulk
+    blank = rebound.Particle(m=0.)
+    for hashes, xyz, vxvyvz in states[1:]:
+        for i in range(len(hashes) - N0):
+            sim.add(blank)
+    sim.set_serialized_particle_data(hash=np.concatenate([states[0][0]] + [s[0][N0:] for s in states[1:]]),
+                                     xyz=np.concatenate([states[0][1]] + [s[1][N0:] for s in states[1:]]),
+                                     vxvyvz=np.concatenate([states[0][2]] + [s[2][N0:] for s in states[1:]]))
+    sim.collision_resolve = c_profiled if profile_callback else c     #function pointers are not saved with the simulation
+    return sim, vals, metas
+
+
+
+###Sharding functions
+
+def shard_seed():
+    
+    """
+    Sets up the folder of a sharded run and records its generation seed there,
+    so resumed shards regenerate the same ejecta. Returns the recorded seed when resuming.
+    """
+    
+    path = os.path.join(os.getcwd(), 'Ejecta_Simulation_Data', label)
+    seedpath = os.path.join(path, label + '_shards.pkl')
+    if os.path.exists(seedpath):
+        if all([run_finished(plabel) for plabel in pop_labels]):
+            sys.exit("Error: " + label + " already finished; please choose a different simulation label.")
+        with open(seedpath, 'rb') as f:
+            return pickle.load(f)['genseed']
+    if os.path.exists(path):
+        sys.exit("Error: please choose a different simulation label.")
+    os.makedirs(path)
+    with open(seedpath, 'wb') as f:
+        pickle.dump({'genseed': genseed, 'nshards': nshards}, f, pickle.HIGHEST_PROTOCOL)
+    return genseed
+
+
+def run_shards():
+    
+    """
+    Splits this simulation's ejecta across nshards worker processes on this node.
+    Each worker runs this script (as filled in, see run_sim in campaign.py) with its own copy of the planets
+    and writes to <label>_shard<k>.
+    Signals are forwarded to the workers, so they checkpoint as usual. Once all workers 
+    finish, their outputs are merged into the usual folders. If any worker ran out of 
+    wall-clock budget, nothing is merged, so the shards can be resumed; shards that already 
+    finished are not rerun. Returns whether the outputs were merged.
+    """
+    
+    procs = {}
+    for k in range(nshards):
+        if all([run_finished(plabel + '_shard' + str(k)) for plabel in pop_labels]):
+            continue
+        out = open(label + '_shard' + str(k) + '.out', 'a')
+        procs[k] = subprocess.Popen([sys.executable, sys.argv[0], jobno, str(k), str(genseed)],
+                                    stdout=out, stderr=subprocess.STDOUT)
+    
+    def forward(signum, frame):
+        for proc in procs.values():
+            proc.send_signal(signum)
+    for sig in (signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(sig, forward)
         
+    codes = {k: proc.wait() for k, proc in procs.items()}
+    failed = [k for k in codes if codes[k] != 0]
+    if failed:
+        sys.exit("Error: shards " + str(failed) + " did not finish; rerun to resume them.")
+    for plabel in pop_labels:
+        for k in range(nshards):
+            if read_results(plabel + '_shard' + str(k))[1]['End condition'] == 'wall-clock budget':
+                return False
+    merge_shards()
+    return True
+    
+
+def merge_shards():
+    
+    """
+    Merges the shards' results (overview, particle_inits, collisions and escapes) of each population
+    into the population's usual folder, then moves the shard folders into <label>/shards.
+    """
+    
+    data_path = os.path.join(os.getcwd(), 'Ejecta_Simulation_Data')
+    for plabel in pop_labels:
+        write_outputs(plabel, *merge_results([read_results(plabel + '_shard' + str(k)) for k in range(nshards)]))
+    
+    shards_path = os.path.join(data_path, label, 'shards')
+    os.makedirs(shards_path, exist_ok=True)
+    for k in range(nshards):
+        for slabel in set([label] + pop_labels):
+            slabel = slabel + '_shard' + str(k)
+            os.rename(os.path.join(data_path, slabel), os.path.join(shards_path, slabel))
+            
+
 #ONLY NECESSARY FOR SLURM
 def move_outfile(label):
     parent = os.getcwd()
     oldout = parent + '/'+label+'.out'
     newout = parent + '/Ejecta_Simulation_Data/'+label+'/' + label + '.out'
-    os.rename(oldout, newout)
+    if os.path.exists(oldout):
+        os.rename(oldout, newout)
 
 #####################################
 
@@ -302,8 +1324,9 @@ def move_outfile(label):
 """SIMULATION PARAMETERS"""
           
 dt = days_to_yr/10
-object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+object_names = trappist_system.object_names
 jobno = str(sys.argv[1])
+shard = int(sys.argv[2]) if len(sys.argv) > 3 else None     #set for the worker processes of a sharded run
 
 #***********MOST IMPORTANT!************
 num_ejecta = 
@@ -311,49 +1334,238 @@ num_years =
 v_increment =         #in km/s
 sourceplanet = 'd'
 
+#sharding: split the ejecta across this many worker processes on one node (request as many cores with -c).
+#Each worker integrates its own copy of the planets, which drift apart from each other and from an unsharded run
+#through the close encounters, so results are statistically, not bitwise, the same as one process's
+nshards = 1
+
+#packed populations: list several ejecta populations as (source planet, v_increment in km/s, num_ejecta) to
+#integrate them in one simulation and split the outputs back into one folder per population.
+#None runs the single population above.
+populations = None
+pop_stride = 10**7                  #ejecta hashes are population*pop_stride + ejecta number
+
+#ejection directions (see sample_directions in sampling.py); each ejecta's sampling weight is recorded with its initial conditions
+direction_sampler = 'cube'          #'cube' (as in the original runs), 'uniform', 'fibonacci', 'sobol' or 'stratified'
+sampler_bands = 10                  #'stratified': number of equal-area bands in the angle from the orbital velocity
+band_alloc = None                   #'stratified': relative numbers of ejecta per band, from along the orbital velocity 
+                                    #to against it (None: equal); a band given 0 is left out of the estimates
+
+#site-targeted ejection: eject only within one cone, instead of over the whole sphere
+ejection_site = None                #None (whole sphere), a site from site_names, or (axis, half-angle in degrees) with
+                                    #the axis as [along the orbital velocity, away from the star, along the orbit normal];
+                                    #needs direction_sampler 'uniform', 'fibonacci' or 'sobol'
+site_halfangle = 30                 #half-angle of the cones around the named sites (in degrees)
+site_names = ['forward', 'backward', 'up', 'down', 'left', 'right']        #site IDs 0-5; left: towards the star
+site_axes = [[1, 0, 0], [-1, 0, 0], [0, 0, 1], [0, 0, -1], [0, -1, 0], [0, 1, 0]]
+
+#ejection speed spectrum: draw each ejecta's velocity increment instead of using v_increment (see sampling.py);
+#each ejecta's increment and sampling density are recorded with its initial conditions, for reweighting
+velocity_spectrum = None            #None, ('uniform', vmin, vmax), ('powerlaw', vmin, vmax, index) or
+                                    #('table', [increments], [relative densities]); increments in km/s
+
 archive_int = 10                    #archive snapshot intervals
+archive_schedule = None             #snapshot times instead of every archive_int years, e.g. ('log', 0.1, 200), 
+                                    #('piecewise', [(100, 1), (1000, 10), (20000, 100)]) or a list of times (see make_schedule)
+snapshot_mode = 'archive'           #'archive': full REBOUND SimulationArchive (<label>.bin)
+                                    #'compact': ejecta orbital elements and planet states only (<label>_snapshots.bin);
+                                    #          restarts then use the checkpoint and _end.bin files
+
+#in-run removal of escaping ejecta:
+escape_removal = False              #remove unbound ejecta during the run (stops at the whole step nearest to every
+                                    #escape_int years)
+escape_dist = 1                     #distance from the star past which unbound ejecta are removed (in AU)
+escape_int = 1                      #how often to check for escaping ejecta (in years)
+
+#importance splitting for rare escapes (see split_ejecta): ejecta whose semi-major axis around the star rises past
+#a level are cloned, and the copies share its weight; copies that fall back are culled. Weights are recorded with
+#the initial conditions; estimate fractions and their errors with split_outcomes in the analysis tools.
+split_levels = None                 #None (off), or increasing semi-major axes (in AU), e.g. [0.1, 0.2, 0.5]
+split_factor = 4                    #copies made at each level; a number, or one per level
+split_int = 1                       #how often to check the levels (in years)
+split_kick = 1e-6                   #size of the random velocity kick given to clones, relative to their speed
 
 #for time interval integration:
 chunk = 10                          #how many years to do at a time
-proj_chunktime =  5400                 #how long it should take to do that many years (in seconds)
+proj_chunktime =  5400                 #how long the first chunk should take, before any chunk is timed (in seconds)
 maxtime = 432000                       #maximum integration time (in seconds)
+budget_margin = 900                 #wall-clock time held back for final output and checkpoint (in seconds)
+budget_window = 5                   #how many recent chunks the cost prediction is fit to
+budget_safety = 1.1                 #factor applied to predicted chunk costs
+
+#early termination, checked between chunks (the time reached is recorded in the overview):
+min_ejecta = 1                      #stop once fewer than this many ejecta remain (1: once none are left, 0: never)
+stop_unbound = False                #stop once every remaining ejecta is on an unbound orbit (they are recorded as escaped)
+
+#job chaining, for runs longer than one job's time limit:
+chain_jobs = False                  #when the wall-clock budget runs out, requeue this job to continue from the checkpoint
+chain_command = 'scontrol requeue {job}'    #requeues a job ({job}: slurm job id, or arrayjob_task for job arrays)
+
+#survivor consolidation: once few ejecta are left, continue the survivors of many simulations in one
+consolidate_at = None               #stop at this time (in years, a multiple of chunk) and leave the survivors to a consolidated run
+origins = None                      #consolidated run: labels of the simulations stopped by consolidate_at whose survivors
+                                    #this run continues; their outputs are written back to their own folders
+consolidate_tol = 1e-8              #largest difference allowed between the origins' planet positions (in AU)
+
+#output files:
+results_format = 'npz'              #'npz': one <label>_results.npz per population; 'csv': the overview, particle_inits,
+                                    #per-body collision and escaped csv files; 'both'
+
+#checkpointing:
+checkpoint_chunks = 1               #save a checkpoint every this many chunks
+resume = True                       #resume from the latest checkpoint if this label's folder already has one
+                                    #(checkpoints are deleted once the run finishes, so finished runs are not resumed)
+
+#collision/escape event log:
+colbuf_rows = 4096                  #collisions buffered in memory before they are written out (they are
+                                    #also written after every integration, see integrate_chunk)
+profile_callback = False            #count the collision callback's calls and time it, for the telemetry file
+                                    #(two clock reads per call; collisions are counted either way)
 #**************************************
 
-v_inc = v_increment*km_to_AU/sec_to_yr
-genseed = random.randint(0, 2**32-1)
-label = str(num_ejecta) + 'e_' + str(num_years) + 'y_' + str(v_increment) + 'vinc_' + str(jobno)                
+if origins is not None:                                #consolidated run: one population per origin simulation
+    if nshards > 1:
+        sys.exit("Error: consolidated runs cannot be sharded.")
+    populations = origin_populations()
+elif populations is None:
+    populations = [(sourceplanet, v_increment, num_ejecta)]
+if consolidate_at is not None and consolidate_at % chunk != 0:
+    sys.exit("Error: consolidate_at must be a multiple of chunk.")
+if isinstance(ejection_site, str) and ejection_site not in site_names:
+    sys.exit("Error: unknown ejection_site " + repr(ejection_site) + "; use one of " + str(site_names) + " or (axis, half-angle).")
+if ejection_site is not None and direction_sampler not in ['uniform', 'fibonacci', 'sobol']:
+    sys.exit("Error: ejection from a site needs direction_sampler 'uniform', 'fibonacci' or 'sobol'.")
+if velocity_spectrum is not None and velocity_spectrum[0] not in ['uniform', 'powerlaw', 'table']:
+    sys.exit("Error: unknown velocity_spectrum " + repr(velocity_spectrum[0]) + "; use 'uniform', 'powerlaw' or 'table'.")
+if split_levels is not None and (nshards > 1 or origins is not None or consolidate_at is not None):
+    sys.exit("Error: splitting runs cannot be sharded or consolidated.")
+num_ejecta = sum([n for src, vinc, n in populations])
+genseed = random.randint(0, 2**32-1) if shard is None else int(sys.argv[3])
+pop_labels = [make_label(src, vinc, n) for src, vinc, n in populations] if origins is None else list(origins)
+if origins is not None:
+    label = 'consolidated' + str(len(origins)) + '_' + str(num_ejecta) + 'e_' + str(num_years) + 'y_' + str(jobno)
+elif len(populations) == 1:
+    label = pop_labels[0]
+else:
+    label = 'packed' + str(len(populations)) + '_' + str(num_ejecta) + 'e_' + str(num_years) + 'y_' + str(jobno)
+if shard is not None:                                  #worker of a sharded run: write to its own folders
+    label = label + '_shard' + str(shard)
+    pop_labels = [plabel + '_shard' + str(shard) for plabel in pop_labels]
 
 #####################################################
 
 
 """ACTUAL SIMULATION"""
 
-data_folder = make_filedir(label)                                                #set up file structure
-sim = draw_sim()                                                                 #set up TRAPPIST-1 system
-vals = make_datalists()                                                          #set up datalists
-generate_ejecta(sim, sourceplanet, num_ejecta, v_inc, genseed)                   #generate ejecta
+if nshards > 1 and shard is None:                                                #sharded run: start workers and merge
+    genseed = shard_seed()
+    if run_shards():
+        move_outfile(label)
+    elif chain_jobs:                                                             #continue the shards in a new job
+        chain_job()
+    sys.exit()
+
+tic = time.perf_counter()                                                        #start of the wall-clock budget
+data_folder = make_filedir(label, resume)                                        #set up file structure
+body_index = make_bodytable()                                                    #set up collision lookup table
+ncheckpoints = 0                                                                 #number of checkpoints saved
+stop_signal = None                                                               #set when slurm signals the job
+segments = []                                                                    #earlier jobs of this run
+origin_meta = None                                                               #overviews of a consolidated run's origins
+colbuf = make_colbuffer(colbuf_rows)                                             #set up collision buffer
+ncols = 0                                                                        #number of filled buffer rows
+nlogged = 0                                                                      #collisions written to the event log
+chunkstats = make_chunkstats()                                                   #per-chunk collision counters
+schedule = make_schedule()                                                       #snapshot times
+manual_snapshots = snapshot_mode == 'compact' or archive_schedule is not None   #snapshots written by integrate_chunk
+split_state = {}                                                                 #levels held by split ejecta
+clone_next = [n + 1 for src, vinc, n in populations]                             #next clone number per population
+split_rng = np.random.default_rng([genseed, 1])                                  #clone kicks and culling
+init_rows = None                                                                 #initial conditions by hash
+ninit = 0                                                                        #ejecta in the starting records
+sim = load_checkpoint() if resume else None                                      #pick up from the latest checkpoint
 archive = data_folder + '/' + label + '.bin'                                     #set up bin archive
-sim.automateSimulationArchive(archive, interval=archive_int, deletefile = True)
+if sim is None:
+    if origins is None:
+        sim = draw_sim()                                                         #set up TRAPPIST-1 system
+        vals = make_datalists()                                                  #set up datalists
+        for pop in range(len(populations)):                                      #generate ejecta
+            src, vinc, n = populations[pop]
+            generate_ejecta(sim, src, n, vinc*km_to_AU/sec_to_yr, (genseed + pop) % 2**32, pop, shard or 0, nshards)
+    else:
+        sim, vals, origin_meta = consolidate_sims()                              #merge the origins' survivors
+    ninit = len(vals['init'])                                                    #ejecta before any splitting
+    save_records()                                                               #starting records, for the checkpoints
+    eventlog = open_eventlog(data_folder + '/' + label + '_events.bin')          #set up event log
+    if snapshot_mode == 'compact':
+        snapfile = open_snapshots(data_folder + '/' + label + '_snapshots.bin')    #set up compact snapshots
+    elif manual_snapshots:
+        if os.path.exists(archive):
+            os.remove(archive)
+    else:
+        sim.automateSimulationArchive(archive, interval=archive_int, deletefile = True)
+    if manual_snapshots:
+        take_snapshot(sim)
+elif not manual_snapshots:
+    sim.automateSimulationArchive(archive, interval=archive_int, deletefile = False)
+segment_start = sim.t                                                            #start of this job's segment
+watch_signals(sim)                                                               #checkpoint on SIGTERM/SIGUSR
+archive_bytes = archive_size()                                                   #for the telemetry file
 
 
 #INTEGRATION LOOP
-#keeps track of total time, so we don't exceed cluster computing time limits
+#times each chunk and sizes the next one, so we land just inside cluster computing time limits
 
 maxloops = int(num_years/chunk)                        #total number of loops to do
-loops = 0
-tic = time.perf_counter()
-for i in range (maxloops):
-    sim.integrate((i+1)*chunk, exact_finish_time=1)
+firstloop = int(sim.t/chunk)                           #nonzero when resuming from a checkpoint
+budget = make_budget()
+end_condition = 'completed'                            #why integration stopped, recorded in the overview
+for i in range (firstloop, maxloops):
+    stop = check_stop(sim)
+    if stop is not None:                              #population exhausted, no need to integrate bare planets
+        end_condition = stop
+        print('stopping early at t = ' + str(sim.t) + ': ' + stop)
+        break
+    elapsed = time.perf_counter() - tic
+    ntest = sim.N - sim.N_active
+    tend = plan_chunk(budget, elapsed, ntest, sim.t, (i+1)*chunk)
+    if tend is None:                                  #not even a short chunk fits, stop integrating
+        end_condition = 'wall-clock budget'
+        break
+    
+    tstart = sim.t
+    steps = sim.steps_done
+    integrate_chunk(sim, tend)
+    if stop_signal is not None:                       #job is about to be killed: checkpoint and stop
+        save_checkpoint(sim)
+        if stop_signal == signal.SIGUSR1 and chain_jobs and shard is None:     #time limit (--signal=B:USR1), not
+            chain_job()                                                         #a cancel or preemption
+        sys.exit("Stopped by signal " + str(stop_signal) + " at t = " + str(sim.t) + "; checkpoint saved.")
     toc = time.perf_counter()    
-    elapsed = toc-tic
-    loops = loops + 1
-    print(elapsed, (i+1)*chunk)
-    if(elapsed + proj_chunktime >= maxtime):          #if projected time exceeds max time, stop integrating
-        break 
+    record_chunk(budget, toc - tic - elapsed, sim.t - tstart, ntest)
+    write_telemetry(sim, i, tstart, toc - tic - elapsed, elapsed, ntest, steps)
+    print(toc - tic, sim.t)
+    if tend < (i+1)*chunk:                            #shortened chunk used up the budget
+        end_condition = 'wall-clock budget'
+        break
+    if (i+1) % checkpoint_chunks == 0:
+        save_checkpoint(sim)
          
             
-num_years = loops*chunk                                     #actual total time integrated
+save_checkpoint(sim)                                        #final checkpoint, for continuing the run
+num_years = sim.t                                           #actual total time integrated
 escape_check(sim)                                           #check for escaped particles
+eventlog.close()
+if snapshot_mode == 'compact':
+    snapfile.close()
+unpack_events(read_eventlog(eventlog.name), vals)                 #sort logged events by body
 sim.save(data_folder + "/" + label + "_end.bin")            #save final state for restarting
-write_datafiles(label)                                      #write data to files
-move_outfile(label)                                       #SLURM ONLY - move outfile
+if origins is None or end_condition != 'wall-clock budget':  #consolidated runs only write back to the origins once done
+    for pop, pop_vals in enumerate(split_populations()):    #write data to files, per population
+        write_outputs(pop_labels[pop], pop_vals, make_overall_dict(pop, pop_vals))
+if end_condition != 'wall-clock budget':                    #done: nothing left to resume
+    remove_checkpoint()
+if end_condition == 'wall-clock budget' and chain_jobs and shard is None:
+    chain_job()                                             #SLURM ONLY - continue in a new job
+else:
+    move_outfile(label)                                     #SLURM ONLY - move outfile
@@ -2,11 +2,14 @@
 
 #SBATCH --account=astro
 #SBATCH --job-name=5000e_1000y_0vinc    ####CHANGE THIS!
-#SBATCH -c 1
+#SBATCH -c 1                               #set to nshards for sharded runs
 #SBATCH --time=5-00:00:00
 #SBATCH --mem-per-cpu=2gb
 #SBATCH --output=%x_%a.out
+#SBATCH --open-mode=append
 #SBATCH --array=1-20
+#SBATCH --signal=B:USR1@900              #checkpoint 15 minutes before the time limit
+#SBATCH --requeue                        #preempted jobs are requeued and resume from their checkpoint
 module load anaconda
 
-python 5000e_1000y_0vinc.py $SLURM_ARRAY_TASK_ID   #####AND CHANGE PY FILE NAME!!
+exec python 5000e_1000y_0vinc.py $SLURM_ARRAY_TASK_ID   #####AND CHANGE PY FILE NAME!!
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+TRAPPIST-1 SYSTEM SHARED BY THE SIMULATION AND BENCHMARK SCRIPTS
+
+The star and planets used by start_template.py, and the ejecta sampling and fate bookkeeping used by 
+integrator_benchmark.py, collision_benchmark.py and ephemeris_mode.py. start_template.py imports it, 
+so it is copied next to every filled-in simulation script.
+"""
+
+import math
+import numpy as np
+import rebound
+from rebound import hash as h
+
+#define constants
+Rsun_to_AU = 0.00465047
+Rearth_to_AU = 4.2635e-5
+days_to_yr = 1/365.25
+Mearth_to_Msun = 3.00274e-6
+deg_to_rad = math.pi/180
+km_to_AU = 6.68459e-9
+sec_to_yr = 1/31557600
+G = 39.441677           #in units of AU, M_Sun, yr
+
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+body_index = {h(object_names[x]).value: x for x in range(len(object_names))}
+
+"""FUNCTION DEFINITIONS"""
+
+def draw_sim(integrator="mercurius", collision="direct", collision_resolve=None, dt=None):
+
+    """
+    Draw TRAPPIST-1 system with the given integrator and collision search.
+    Integrator-specific settings (hillfac, safe_mode, ...) are left to the caller.
+    """
+
+    sim = rebound.Simulation()
+    sim.units = ('yr', 'AU', 'Msun')
+    sim.G = G
+    sim.integrator = integrator
+    sim.collision = collision
+    if collision_resolve is not None:
+        sim.collision_resolve = collision_resolve
+    if dt is not None:
+        sim.dt = dt
+
+    #add TRAPPIST-1 star and planets
+    sim.add(m = 0.0898, r = 0.1192*Rsun_to_AU, hash = 'a')
+    sim.add(m = 1.374*Mearth_to_Msun, a=1.154e-2, e=0, inc=(90-89.728)*deg_to_rad,
+            Omega=1, omega=1, M=320.2328615005874, r = 1.116*Rearth_to_AU, hash='b')
+    sim.add(m = 1.308*Mearth_to_Msun, a=1.580e-2, e=0, inc=(90-89.778)*deg_to_rad,
+            Omega=1, omega=1, M=302.03085481266083, r = 1.097*Rearth_to_AU, hash='c')
+    sim.add(m = 0.388*Mearth_to_Msun, a=2.227e-2, e=0, inc=(90-89.896)*deg_to_rad,
+            Omega=1, omega=1, M=-421.17961121323583, r = 0.788*Rearth_to_AU, hash='d')
+    sim.add(m = 0.692*Mearth_to_Msun, a=2.925e-2, e=0, inc=(90-89.793)*deg_to_rad,
+            Omega=1, omega=1, M=-270.15332650367066, r = 0.920*Rearth_to_AU, hash='e')
+    sim.add(m = 1.039*Mearth_to_Msun, a=3.849e-2, e=0, inc=(90-89.740)*deg_to_rad,
+            Omega=1, omega=1, M=-187.20059131394225, r = 1.045*Rearth_to_AU, hash='f')
+    sim.add(m = 1.321*Mearth_to_Msun, a=4.683e-2, e=0, inc=(90-89.742)*deg_to_rad,
+            Omega=1, omega=1, M=-136.97239841027107, r = 1.129*Rearth_to_AU, hash='g')
+    sim.add(m = 0.326*Mearth_to_Msun, a=6.189e-2, e=0, inc=(90-89.805)*deg_to_rad,
+            Omega=1, omega=1, M=-89.87573477315452, r = 0.755*Rearth_to_AU, hash='h')
+
+    sim.N_active = len(object_names)         #only planets and star influence each other
+    sim.testparticle_type = 0                #test particles do not influence other particles
+    sim.move_to_com()                        #move to center of mass frame
+    return sim
+
+
+def ejecta_states(planet, n, v_increment, genseed):
+
+    """
+    Positions and velocities of the sampled ejecta relative to the source planet,
+    drawn the same way as generate_ejecta in start_template.py.
+    """
+
+    rng = np.random.default_rng(genseed)
+    v_esc = math.sqrt(2*G*planet.m/planet.r)
+
+    dir_v = rng.random((n, 3))*2-1
+    n_v = dir_v/np.linalg.norm(dir_v, axis=1)[:, None]
+    return n_v*(planet.r + 1*km_to_AU), n_v*(v_esc + v_increment)
+
+
+def fate_recorder(fates):
+
+    """
+    Collision resolve function that removes the massless ejecta and records in fates, keyed by ejecta hash,
+    which body it hit (index in object_names) and when.
+    """
+
+    def c(sim, c):
+        i, j = c.p1, c.p2
+        ps = sim.contents.particles
+        x = body_index.get(ps[i].hash.value)
+        if x is not None:
+            fates[ps[j].hash.value] = (x, sim.contents.t)
+            return 2
+        x = body_index.get(ps[j].hash.value)
+        if x is not None:
+            fates[ps[i].hash.value] = (x, sim.contents.t)
+            return 1
+        return 0
+    return c
+
+
+def compare_fates(ref, test, n):
+
+    """
+    Compares the fates of ejecta 1..n against the reference.
+
+    Returns:
+        *mismatch -------fraction of ejecta whose fate (body hit, or none) differs from the reference
+        *tvd ------------total variation distance between the fractions of ejecta hitting each body
+                         (or none), which is what the campaign histograms measure
+        *dt_median ------median difference in impact time for ejecta that hit the same body
+    """
+
+    names = range(1, n+1)
+    ref_body = np.array([ref[x][0] if x in ref else -1 for x in names])
+    test_body = np.array([test[x][0] if x in test else -1 for x in names])
+    mismatch = np.mean(ref_body != test_body)
+
+    bins = np.arange(-1, len(object_names)+1)
+    tvd = 0.5*np.abs(np.histogram(ref_body, bins)[0] - np.histogram(test_body, bins)[0]).sum()/n
+
+    same = [x for x in names if x in ref and x in test and ref[x][0] == test[x][0]]
+    dt_median = np.median([abs(ref[x][1] - test[x][1]) for x in same]) if same else float('nan')
+    return mismatch, tvd, dt_median
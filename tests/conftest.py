@@ -0,0 +1,8 @@
+import os
+import sys
+
+#the templates and analysis tools are run as scripts from their own folders, so their modules import each other
+#by plain name; put both folders on the path the same way
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ['templates', 'analysis_tools']:
+    sys.path.insert(0, os.path.join(root, folder))
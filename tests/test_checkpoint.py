@@ -0,0 +1,103 @@
+import glob
+import os
+import pickle
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('rebound')
+
+templates = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+params = {'num_ejecta': '100', 'num_years': '6', 'v_increment': '0', 'genseed': '3', 'chunk': '1',
+          'split_levels': '[0.03]'}                   #clones are split off from the first year, so their records are checkpointed too
+
+
+def make_run(folder):
+    """
+    Fills in start_template.py in folder, next to the modules it imports, as campaign.py does.
+    """
+
+    os.makedirs(folder)
+    with open(os.path.join(templates, 'start_template.py')) as f:
+        src = f.read()
+    for key, val in params.items():
+        src, n = re.subn(r'^' + key + r' = [^#\n]*', key + ' = ' + val + ' ', src, count=1, flags=re.M)
+        assert n == 1, key
+    with open(os.path.join(folder, 'sim.py'), 'w') as f:
+        f.write(src)
+    for module in ['trappist_system.py', 'sampling.py', 'records.py']:
+        shutil.copy(os.path.join(templates, module), folder)
+    open(os.path.join(folder, '1.out'), 'w').close()
+
+
+def start(folder):
+    return subprocess.Popen([sys.executable, 'sim.py', '1'], cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def run(folder):
+    proc = subprocess.run([sys.executable, 'sim.py', '1'], cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return proc.returncode, proc.stdout.decode()
+
+
+def wait_for_checkpoint(folder, proc, t):
+    """
+    Waits until the running simulation has checkpointed at time t or later.
+    """
+
+    path = os.path.join(folder, 'Ejecta_Simulation_Data', '100e_6y_0vinc_1', '100e_6y_0vinc_1_checkpoint.pkl')
+    while True:
+        assert proc.poll() is None, 'finished before checkpointing at t = ' + str(t)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if pickle.load(f)['t'] >= t:
+                    return
+        time.sleep(0.02)
+
+
+def read(folder):
+    path, = glob.glob(os.path.join(folder, 'Ejecta_Simulation_Data', '*', '*_results.npz'))
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+@pytest.fixture(scope='module')
+def reference(tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp('reference')/'run')
+    make_run(folder)
+    code, out = run(folder)
+    assert code == 0, out
+    return read(folder)
+
+
+def assert_same_results(res, reference):
+    assert sorted(res) == sorted(reference)
+    for key in reference:
+        if key != 'meta':
+            assert np.array_equal(res[key], reference[key], equal_nan=res[key].dtype.kind == 'f'), key
+    assert (reference['init_parent'] != 0).any()                        #the run split some ejecta
+
+
+@pytest.mark.parametrize('sig', [signal.SIGKILL, signal.SIGUSR1])
+def test_resume_matches_uninterrupted_run(tmp_path, reference, sig):
+    folder = str(tmp_path/'run')
+    make_run(folder)
+    proc = start(folder)
+    wait_for_checkpoint(folder, proc, 2)
+    proc.send_signal(sig)                                               #killed outright, or stopped by slurm
+    proc.wait()
+    assert proc.returncode != 0
+
+    code, out = run(folder)
+    assert code == 0, out
+    assert_same_results(read(folder), reference)
+    data_folder = os.path.join(folder, 'Ejecta_Simulation_Data', '100e_6y_0vinc_1')
+    assert not glob.glob(os.path.join(data_folder, '*checkpoint*')) and not glob.glob(os.path.join(data_folder, '*records.pkl'))
+
+    code, out = run(folder)                                             #finished runs are not run again
+    assert code != 0 and 'choose a different simulation label' in out
+    assert_same_results(read(folder), reference)
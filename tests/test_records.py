@@ -0,0 +1,194 @@
+import csv
+import json
+import math
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('rebound')              #records.py gets the body names from trappist_system.py
+
+import records
+import results
+from sampling import cube_weights
+
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+
+
+def collision_row(body, hash, t):
+    #collision buffer row: body index, hash, vx, vy, vz, t, then the impact geometry
+    return [body, hash, 0.1*hash, 0.2, 0.3, t] + [hash + 0.01*k for k in range(12)]
+
+
+def escape_row(hash, t):
+    return [hash, 0.5, 1.2, 0.1, 0.2, 0.3, 0.4, t, 2.5]
+
+
+def empty_vals():
+    return {key: [] for key in ['init', 'esc'] + object_names}
+
+
+def init_row(hash, parent=0):
+    return [hash, 0.1, 1., -2., 0.5, 3., 4., 5., 1.25, -1, float('nan'), float('nan'), parent]
+
+
+def test_eventlog_round_trip(tmp_path):
+    path = str(tmp_path/'run_events.bin')
+    cols = np.array([collision_row(3, 7, 0.5), collision_row(1, 9, 1.5)])
+    esc = np.array([escape_row(8, 1.)])
+    log = records.open_eventlog(path)
+    log.write(records.collision_events(cols).tobytes())
+    log.write(records.escape_events(esc).tobytes())
+    log.write(records.collision_events(cols[:1]).tobytes()[:20])        #killed mid-write
+    log.close()
+
+    events = records.read_eventlog(path)
+    assert events['kind'].tolist() == [0, 0, 1]
+    assert events['hash'].tolist() == [7, 9, 8]
+    vals = empty_vals()
+    records.unpack_events(events, vals)
+    assert vals['d'] == [[7] + collision_row(3, 7, 0.5)[2:5] + [0.5] + collision_row(3, 7, 0.5)[6:]]
+    assert vals['b'][0][0] == 9 and vals['b'][0][4] == 1.5
+    assert vals['esc'] == [escape_row(8, 1.)]
+
+
+def test_eventlog_resume_drops_events_after_checkpoint(tmp_path):
+    path = str(tmp_path/'run_events.bin')
+    log = records.open_eventlog(path)
+    log.write(records.escape_events(np.array([escape_row(1, 1.)])).tobytes())
+    size = log.tell()
+    log.write(records.escape_events(np.array([escape_row(2, 2.)])).tobytes())
+    log.close()
+
+    log = records.open_eventlog(path, size)
+    log.write(records.escape_events(np.array([escape_row(3, 3.)])).tobytes())
+    log.close()
+    assert records.read_eventlog(path)['hash'].tolist() == [1, 3]
+
+
+def test_eventlog_refuses_other_layout(tmp_path):
+    path = tmp_path/'run_events.bin'
+    path.write_bytes(b"[('kind', '|u1')]\n")
+    with pytest.raises(SystemExit):
+        records.open_eventlog(str(path), 18)
+
+
+def sample_vals():
+    vals = empty_vals()
+    vals['init'] = [init_row(1), init_row(2), init_row(3, parent=1)]
+    vals['init'][0][9:12] = [2, 3.5, 0.25]
+    vals['b'] = [[2] + collision_row(1, 2, 0.75)[2:5] + [0.75] + collision_row(1, 2, 0.75)[6:]]
+    vals['esc'] = [escape_row(3, 1.5)]
+    return vals
+
+
+@pytest.mark.parametrize('write', [records.write_results, records.write_datafiles])
+def test_results_round_trip(tmp_path, write):
+    folder = str(tmp_path/'3e_2y_0vinc_1')
+    vals = sample_vals()
+    overall = {'Number of Ejecta': 3, 'End condition': 'completed'}
+    write(folder, vals, overall)
+
+    read_vals, read_overall = records.read_results(folder)
+    assert int(read_overall['Number of Ejecta']) == 3
+    assert read_overall['End condition'] == 'completed'
+    for key in vals:
+        assert len(read_vals[key]) == len(vals[key])
+        for row, read_row in zip(vals[key], read_vals[key]):
+            assert np.allclose(np.array(read_row, dtype=float), row, equal_nan=True)
+
+    res = results.read_results(folder)
+    assert res['init_hash'].tolist() == [1, 2, 3]
+    assert res['init_parent'].tolist() == [0, 0, 1]
+    assert res['col_body'].tolist() == [1]
+
+
+def write_csv(path, label, rows):
+    with open(path, 'w') as f:
+        w = csv.writer(f)
+        w.writerow([label])
+        w.writerows(rows)
+
+
+def test_read_results_legacy_csv(tmp_path):
+    #csv files from before sampling weights, site IDs, velocity increments, parents and impact geometry
+    label = '2e_2y_1vinc_1'
+    folder = tmp_path/label
+    folder.mkdir()
+    write_csv(folder/(label + '_overview.csv'), label, [['Number of Ejecta', 2], ['Velocity Increment (10km/s)', 1]])
+    write_csv(folder/(label + '_particle_inits.csv'), label,
+              [['hash', 'inc', 'vxPlanet', 'vyPlanet', 'vzPlanet', 'vxStar', 'vyStar', 'vzStar'],
+               [1, 0.1, 1., -2., 0.5, 3., 4., 5.], [2, 0.1, 0., 0., -1., 3., 4., 5.]])
+    for o in object_names:
+        write_csv(folder/(label + '_' + o + '.csv'), label,
+                  [['hash', 'vx', 'vy', 'vz', 't']] + ([[2, 0.1, 0.2, 0.3, 1.5]] if o == 'e' else []))
+    write_csv(folder/(label + '_escaped.csv'), label, [['hash', 'a', 'e', 'inc', 'Omega', 'omega', 'f', 't', 'v_inf']])
+
+    vals, overall = records.read_results(str(folder))
+    assert overall['Number of Ejecta'] == '2'
+    assert [len(row) for row in vals['init']] == [13, 13]
+    assert float(vals['init'][0][8]) == pytest.approx(cube_weights(np.array([[1., -2., 0.5]]))[0])
+    assert float(vals['init'][1][8]) == pytest.approx(6/math.pi)
+    assert vals['init'][0][9:] == ['-1', 'nan', 'nan', '0']
+    assert len(vals['e'][0]) == 17 and vals['e'][0][5:] == ['nan']*12
+    assert vals['esc'] == []
+
+    res = results.read_results(str(folder))
+    assert np.allclose(res['init_weight'], [float(row[8]) for row in vals['init']])
+    assert res['init_site'].tolist() == [-1, -1]
+    assert res['init_vinc'].tolist() == [1, 1]                                  #filled in from the overview
+    assert res['init_parent'].tolist() == [0, 0]
+    assert res['col_body'].tolist() == [4] and np.isnan(res['col_rel_pos']).all()
+    assert len(res['esc_hash']) == 0
+
+
+def test_read_results_legacy_npz(tmp_path):
+    #results file from before sampling weights, site IDs, velocity increments, parents and impact geometry
+    label = '2e_2y_0vinc_1'
+    folder = tmp_path/label
+    folder.mkdir()
+    np.savez_compressed(folder/(label + '_results.npz'),
+        meta = np.array(json.dumps({'Number of Ejecta': 2})),
+        body_names = np.array(object_names),
+        init_hash = np.array([1, 2], dtype='uint32'), init_inc = np.zeros(2),
+        init_vplanet = np.array([[1., -2., 0.5], [0., 0., -1.]]), init_vstar = np.zeros((2, 3)),
+        col_body = np.array([4], dtype='uint8'), col_hash = np.array([2], dtype='uint32'),
+        col_v = np.ones((1, 3)), col_t = np.array([1.5]),
+        esc_hash = np.zeros(0, dtype='uint32'), esc_orbit = np.zeros((0, 6)), esc_t = np.zeros(0), esc_vinf = np.zeros(0))
+
+    vals, overall = records.read_results(str(folder))
+    assert overall == {'Number of Ejecta': 2}
+    weights = cube_weights(np.array([[1., -2., 0.5], [0., 0., -1.]]))
+    assert np.allclose([row[8] for row in vals['init']], weights)
+    assert [row[9] for row in vals['init']] == [-1, -1] and [row[12] for row in vals['init']] == [0, 0]
+    assert np.isnan([row[10:12] for row in vals['init']]).all()
+    assert vals['e'][0][:5] == [2, 1., 1., 1., 1.5] and np.isnan(vals['e'][0][5:]).all()
+
+    res = results.read_results(str(folder))
+    assert np.allclose(res['init_weight'], weights)
+    assert res['init_site'].tolist() == [-1, -1] and res['init_parent'].tolist() == [0, 0]
+    assert np.isnan(res['col_body_vel']).all()
+
+
+def test_merge_results():
+    shards = []
+    for k, (t, end) in enumerate([(10., 'completed'), (8.5, 'wall-clock budget'), (3., 'no ejecta left')]):
+        vals = empty_vals()
+        vals['init'] = [init_row(k + 1), init_row(k + 4)]
+        vals['d'] = [[k + 1, 0., 0., 0., 3. - k] + [0.]*12]
+        vals['esc'] = [escape_row(k + 4, 2. + k)]
+        overall = {'Label': 'x', 'Number of Ejecta': 2, 'Escaped Particles': 1, 'Timesteps': int(t*10),
+                   'Total Time (yrs)': t, 'End condition': end, 'Segments': [[0, t]]}
+        overall.update({o: int(o == 'd') for o in object_names})
+        shards.append((vals, overall))
+
+    vals, overall = records.merge_results(shards)
+    assert [row[0] for row in vals['init']] == [1, 2, 3, 4, 5, 6]
+    assert [row[4] for row in vals['d']] == [1., 2., 3.]
+    assert [row[7] for row in vals['esc']] == [2., 3., 4.]
+    assert overall['Number of Ejecta'] == 6 and overall['Escaped Particles'] == 3
+    assert overall['d'] == 3 and overall['b'] == 0
+    assert overall['Label'] == 'x'
+    #the slowest shard still running sets the time covered; the one whose ejecta ran out covers the whole run
+    assert overall['Total Time (yrs)'] == 8.5 and overall['End condition'] == 'wall-clock budget'
+    assert overall['Timesteps'] == 85 and overall['Segments'] == [[0, 8.5]]
+    assert overall['Shards'] == 3
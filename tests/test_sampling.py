@@ -0,0 +1,67 @@
+import math
+import numpy as np
+import pytest
+import results
+from sampling import sample_directions, cube_weights, sample_speeds, sample_cone
+
+vorb = np.array([0.3, 1.0, 0.1])
+
+
+@pytest.mark.parametrize('sampler', ['cube', 'uniform', 'fibonacci', 'sobol', 'stratified'])
+def test_directions_are_unit_vectors_with_mean_weight_one(sampler):
+    n_v, w = sample_directions(20000, np.random.default_rng(1), vorb, sampler, bands=10)
+    assert n_v.shape == (20000, 3)
+    assert np.allclose(np.linalg.norm(n_v, axis=1), 1)
+    assert abs(w.mean() - 1) < 0.02
+
+
+@pytest.mark.parametrize('sampler', ['cube', 'uniform', 'fibonacci', 'sobol', 'stratified'])
+def test_weighted_directions_are_isotropic(sampler):
+    n_v, w = sample_directions(20000, np.random.default_rng(2), vorb, sampler, bands=10, band_alloc=np.arange(1, 11))
+    for axis in range(3):
+        assert abs(np.average(n_v[:, axis], weights=w)) < 0.03           #no preferred direction
+        assert abs(np.average(n_v[:, axis]**2, weights=w) - 1/3) < 0.02
+
+
+def test_stratified_bands_follow_allocation():
+    alloc = [3, 1, 1, 1]
+    n_v, w = sample_directions(600, np.random.default_rng(3), vorb, 'stratified', bands=4, band_alloc=alloc)
+    cos_t = n_v @ (vorb/np.linalg.norm(vorb))
+    band = np.floor((1 - cos_t)/2*4).astype(int)
+    assert np.bincount(band, minlength=4).tolist() == [300, 100, 100, 100]
+    assert w.sum() == pytest.approx(600)
+    assert np.allclose(w[band == 0], 0.5)
+
+
+def test_stratified_needs_one_allocation_per_band():
+    with pytest.raises(SystemExit):
+        sample_directions(10, np.random.default_rng(0), vorb, 'stratified', bands=3, band_alloc=[1, 2])
+
+
+def test_cube_weights_match_cube_sampler_and_analysis_tools():
+    rng = np.random.default_rng(4)
+    n_v, w = sample_directions(1000, rng, vorb, 'cube')
+    v = n_v*rng.uniform(1, 5, size=(1000, 1))                            #weights depend on the direction only
+    assert np.allclose(cube_weights(v), w)
+    assert np.array_equal(results.cube_weights(v), cube_weights(v))
+    assert cube_weights(np.array([[0., 0., 2.]]))[0] == pytest.approx(6/math.pi)
+
+
+@pytest.mark.parametrize('sampler', ['uniform', 'fibonacci', 'sobol'])
+def test_cone_directions_stay_in_the_cone(sampler):
+    axis = np.array([0., 0.6, 0.8])
+    halfangle = 30*math.pi/180
+    n_v, w = sample_cone(5000, np.random.default_rng(5), axis, halfangle, sampler)
+    cos_t = n_v @ axis
+    assert np.allclose(np.linalg.norm(n_v, axis=1), 1)
+    assert cos_t.min() >= math.cos(halfangle) - 1e-12
+    assert np.median(cos_t) == pytest.approx((1 + math.cos(halfangle))/2, abs=0.01)     #even over the cap's area
+    assert np.all(w == 1)
+
+
+@pytest.mark.parametrize('spectrum', [('uniform', 1, 5), ('powerlaw', 1, 5, 3), ('powerlaw', 1, 5, 1),
+                                      ('table', [1, 2, 5], [2, 1, 0.5])])
+def test_speed_densities_are_normalized(spectrum):
+    v, density = sample_speeds(50000, np.random.default_rng(6), 1.5, spectrum)
+    assert v.min() >= 1 and v.max() <= 5
+    assert np.mean(1/density) == pytest.approx(4, rel=0.02)              #the mean of 1/density is the range's width
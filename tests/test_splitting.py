@@ -0,0 +1,50 @@
+import json
+import numpy as np
+import pytest
+from splitting import ejecta_roots, split_outcomes
+
+object_names = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+
+
+def write_results(folder, hashes, weights, parents, cols, esc):
+    #minimal results file: cols maps the hashes that hit a body to its index, esc lists the escaped hashes
+    folder.mkdir()
+    n = len(hashes)
+    np.savez_compressed(folder/(folder.name + '_results.npz'),
+        meta = np.array(json.dumps({})), body_names = np.array(object_names),
+        init_hash = np.array(hashes, dtype='uint32'), init_inc = np.zeros(n),
+        init_vplanet = np.ones((n, 3)), init_vstar = np.zeros((n, 3)),
+        init_weight = np.array(weights, dtype=float), init_parent = np.array(parents, dtype='uint32'),
+        col_body = np.array(list(cols.values()), dtype='uint8'), col_hash = np.array(list(cols), dtype='uint32'),
+        col_v = np.zeros((len(cols), 3)), col_t = np.arange(len(cols), dtype=float),
+        esc_hash = np.array(esc, dtype='uint32'), esc_orbit = np.zeros((len(esc), 6)),
+        esc_t = np.zeros(len(esc)), esc_vinf = np.zeros(len(esc)))
+    return str(folder)
+
+
+def test_ejecta_roots_follow_clones_back_to_their_ejected_ancestor():
+    res = {'init_hash': np.array([20, 1, 2, 10, 11], dtype='uint32'),
+           'init_parent': np.array([10, 0, 0, 1, 1], dtype='uint32')}
+    assert ejecta_roots(res).tolist() == [1, 1, 2, 1, 1]
+
+
+def test_split_outcomes_sums_weights_per_ejected_particle(tmp_path):
+    #ejecta 1 was split into four (weight 1/4 each), and its clone 10 split again in two (1/8 each);
+    #ejecta 2 was never split
+    first = write_results(tmp_path/'sim_1', [1, 2, 10, 11, 12, 20], [0.25, 1, 0.125, 0.25, 0.25, 0.125],
+                          [0, 0, 1, 1, 1, 10], cols={1: 1}, esc=[10, 11, 12, 2])
+    #two plain ejecta: one hits d, one remains
+    second = write_results(tmp_path/'sim_2', [1, 2], [1, 1], [0, 0], cols={1: 3}, esc=[])
+
+    outcomes = split_outcomes([first, second])
+    assert outcomes['ejecta'] == 4 and outcomes['clones'] == 4
+    per_ejecta = {'b': [0.25, 0, 0, 0], 'd': [0, 0, 1, 0], 'escaped': [0.625, 1, 0, 0], 'remaining': [0.125, 0, 0, 1]}
+    for name, sums in per_ejecta.items():
+        f, err = outcomes[name]
+        assert f == pytest.approx(np.mean(sums))
+        assert err == pytest.approx(np.std(sums, ddof=1)/2)
+    assert outcomes['a'] == (0, 0)
+    f, err = outcomes['escaped']
+    assert outcomes['equivalent_ejecta'] == pytest.approx(f*(1 - f)/err**2)
+    #each ejected particle's outcomes add up to its own weight
+    assert sum(outcomes[name][0] for name in object_names + ['escaped', 'remaining']) == pytest.approx(1)